@@ -8,14 +8,30 @@ import pylab
 import altair as alt
 import functools
 import base64
+import json
+import os
+import tempfile
+import time
+import uuid
 import random
 import scipy.interpolate
 
-from util import ActiveHoursFeature, CadenceFeature, GaitFeature, KneeFlexionFeature, LyingAdlFeature, Phase, SittingAdlFeature, StepWidthFeature, StepLengthFeature, TugScoreFeature
+from calibrate import calibrate
+from features import FEATURE_CATALOG
+from estimate import BACKGROUND_MODE, CHUNK_ROWS, EXPORT_TTL_SECONDS, MEMORY_MODE, estimate_cost, format_bytes
+from manifest import build_manifest
+from presets import PRESETS, build_preset, get_preset_paths
+from schema import CompactSchema
+from stats import StreamingReport, get_summary_frame, report_to_html, report_to_json
+from settings import HASH_FUNCS, to_config
+from util import (FEATURE_NAMES, PHASE_NAMES, build_dataset_settings, build_phase_settings, build_phases,
+                  clip_to_widgets, collect_config, generate_dataset, with_feature_defaults, write_dataset)
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from io import StringIO
 from streamlit.report_thread import REPORT_CONTEXT_ATTR_NAME
-from threading import current_thread
+from threading import Lock, current_thread
 
 @st.cache
 def get_total_data_points(start, end, freq):
@@ -78,27 +94,104 @@ def get_table_download_link(df):
     href = f'<a href="data:file/csv;base64,{b64}">Download csv file</a>'
     return href
 
-@st.cache
-def generate_data(include_features, include_phases, phases, include_dates=False):
-    result_json = {}
-    for phase in phases:
-        if str(phase) in include_phases:
-            for phase_feature in phase.feature_dic:
-                total_data_points = get_total_data_points(st.session_state[phase.name+'_start_date'], st.session_state[phase.name+'_end_date'], 
-                                                    st.session_state[phase.name+'_frequency_per_day'])
-                if str(phase_feature) in include_features:
-                    feature_data = phase.feature_dic[phase_feature].get_feature_data(st.session_state[str(phase)+'_'+phase_feature+'_base_start'], st.session_state[str(phase)+'_'+phase_feature+'_base_end'],
-                                                                                    st.session_state[str(phase)+'_'+phase_feature+'_space'], st.session_state[str(phase)+'_'+phase_feature+'_trend'], 
-                                                                                    st.session_state[str(phase)+'_'+phase_feature+'_noise'], total_data_points)[1]
-                    result_json[phase_feature] = np.concatenate((result_json.get(phase_feature, []), feature_data))
-            
-            if include_dates:
-                result_json['Date'] = np.concatenate((result_json.get('Date', np.array([],dtype='datetime64[D]')), phase.get_date_data(st.session_state[phase.name+'_start_date'], 
-                                                                                                                                        st.session_state[phase.name+'_end_date'], 
-                                                                                                                                        st.session_state[phase.name+'_frequency_per_day'])))
- 
-    result_df = pd.DataFrame(result_json)
-    return result_df
+@st.cache(hash_funcs=HASH_FUNCS, allow_output_mutation=True)
+def generate_data(dataset, seed=None, compact=False):
+    # Keyed by the dataset fingerprint, the frame is only read so its hash is not checked on every call
+    # Statistics are collected while generating, the report and the compact schema are returned with the data
+    config = to_config(dataset)
+    include_features, include_phases = set(dataset.features), {phase.name for phase in dataset.phases}
+    report = StreamingReport()
+    schema = CompactSchema(config, include_features, include_phases) if compact else None
+    result_df = generate_dataset(config, include_features, include_phases, build_phases(),
+                                 include_dates=dataset.include_dates, seed=seed, report=report, schema=schema)
+    return result_df, report.to_dict(), schema.to_dict() if compact else None
+
+def export_data(path, dataset, seed=None, compact=False):
+    # Large datasets are streamed to a gzipped csv on disk in chunks, seeded so phases can be split
+    config = to_config(dataset)
+    include_features, include_phases = set(dataset.features), {phase.name for phase in dataset.phases}
+    report = StreamingReport()
+    schema = CompactSchema(config, include_features, include_phases) if compact else None
+    write_dataset(path, config, include_features, include_phases, build_phases(), include_dates=dataset.include_dates,
+                  seed=seed, report=report, chunk_rows=CHUNK_ROWS, schema=schema)
+    return report.to_dict(), schema.to_dict() if compact else None
+
+def apply_calibration():
+    # Runs before the script, so the fitted settings are in place when the widgets are created
+    reference = st.session_state['reference_file']
+    if reference is None:
+        st.session_state['calibration_message'] = ('warning', '⚠️ Upload a reference CSV first.')
+        return
+    try:
+        reference.seek(0)
+        calibrated = calibrate(reference, compression='gzip' if reference.name.endswith('.gz') else None)
+    except (ValueError, KeyError, pd.errors.ParserError) as error:
+        st.session_state['calibration_message'] = ('error', f'⚠️ {error}')
+        return
+    for key, value in clip_to_widgets(calibrated, st.session_state['phases']).items():
+        st.session_state[key] = value
+    phase_names = sorted({key.split('_')[0] + '_' + key.split('_')[1] for key in calibrated})
+    st.session_state['calibration_message'] = ('success', f"✅ Calibrated {', '.join(phase_names)}")
+
+def get_schema_link(schema_dict, current_date):
+    schema_b64 = base64.b64encode(json.dumps(schema_dict, indent=2).encode()).decode()
+    return f'<a href="data:application/json;base64,{schema_b64}" download="SyntheticGaitData_{current_date}.schema.json">🗜️ Download schema</a>'
+
+@st.cache(allow_output_mutation=True)
+def get_background_executor():
+    # One worker shared by all sessions for background exports
+    return ThreadPoolExecutor(max_workers=1)
+
+@st.cache(allow_output_mutation=True)
+def get_export_jobs():
+    # Exports of all sessions by dataset fingerprint, seed and schema, so the same seeded export runs once
+    return {}
+
+@st.cache(allow_output_mutation=True)
+def get_export_lock():
+    # Guards get_export_jobs, script threads of all sessions use it
+    return Lock()
+
+class ExportJob:
+    """A chunked export on disk, shared by the sessions that asked for the same dataset and seed."""
+
+    def __init__(self, future, path):
+        self.future = future
+        self.path = path
+        # When each session holding the job last showed it
+        self.sessions = {}
+
+    def hold(self, session):
+        self.sessions[session] = time.monotonic()
+
+    def held(self, now):
+        return any(now - seen <= EXPORT_TTL_SECONDS for seen in self.sessions.values())
+
+    def failed(self):
+        return self.future.done() and (self.future.cancelled() or self.future.exception() is not None)
+
+    def get_error(self):
+        return 'the export was cancelled' if self.future.cancelled() else self.future.exception()
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def release_export(export_jobs, export_key, session):
+    # The session moved on, a job it alone asked for is cancelled when still queued and evicted when done
+    export_job = export_jobs.get(export_key)
+    if export_job is not None:
+        export_job.sessions.pop(session, None)
+        if not export_job.sessions:
+            export_job.future.cancel()
+
+def evict_exports(export_jobs):
+    # Done jobs no session showed within the time to live are deleted with their files
+    now = time.monotonic()
+    for export_key, export_job in list(export_jobs.items()):
+        if export_job.future.done() and not export_job.held(now):
+            del export_jobs[export_key]
+            export_job.remove()
 
 # App setting
 st.set_page_config(
@@ -298,81 +391,10 @@ footer {visibility: hidden;}
 """
 st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
-# Initialise phases
-phase_1 = Phase('Phase_1')
-phase_2 = Phase('Phase_2')
-phase_3 = Phase('Phase_3')
-phase_4 = Phase('Phase_4')
-phase_5 = Phase('Phase_5')
-
-# Append reuired features to each phase
-phase_1.add_features(
-    {
-        'Gait_Speed': GaitFeature(),
-        'Step_Length': StepLengthFeature(),
-        'Step_Width': StepWidthFeature(),
-        'Tug_Score': TugScoreFeature(),
-        'Cadence': CadenceFeature(),
-        'Knee_Flexion': KneeFlexionFeature(),
-        'Sitting_Adl': SittingAdlFeature(),
-        'Lying_Adl': LyingAdlFeature(),
-        'Active_Hours': ActiveHoursFeature()
-    }
-)
-phase_2.add_features(
-    {
-        'Gait_Speed': GaitFeature(),
-        'Step_Length': StepLengthFeature(),
-        'Step_Width': StepWidthFeature(),
-        'Tug_Score': TugScoreFeature(),
-        'Cadence': CadenceFeature(),
-        'Knee_Flexion': KneeFlexionFeature(),
-        'Sitting_Adl': SittingAdlFeature(),
-        'Lying_Adl': LyingAdlFeature(),
-        'Active_Hours': ActiveHoursFeature()
-        
-    }
-)
-phase_3.add_features(
-    {
-        'Gait_Speed': GaitFeature(),
-        'Step_Length': StepLengthFeature(),
-        'Step_Width': StepWidthFeature(),
-        'Tug_Score': TugScoreFeature(),
-        'Cadence': CadenceFeature(),
-        'Knee_Flexion': KneeFlexionFeature(),
-        'Sitting_Adl': SittingAdlFeature(),
-        'Lying_Adl': LyingAdlFeature(),
-        'Active_Hours': ActiveHoursFeature()
-        
-    }
-)
-phase_4.add_features(
-    {
-        'Gait_Speed': GaitFeature(),
-        'Step_Length': StepLengthFeature(),
-        'Step_Width': StepWidthFeature(),
-        'Tug_Score': TugScoreFeature(),
-        'Cadence': CadenceFeature(),
-        'Knee_Flexion': KneeFlexionFeature(),
-        'Sitting_Adl': SittingAdlFeature(),
-        'Lying_Adl': LyingAdlFeature(),
-        'Active_Hours': ActiveHoursFeature()
-    }
-)
-phase_5.add_features(
-    {
-        'Gait_Speed': GaitFeature(),
-        'Step_Length': StepLengthFeature(),
-        'Step_Width': StepWidthFeature(),
-        'Tug_Score': TugScoreFeature(),
-        'Cadence': CadenceFeature(),
-        'Knee_Flexion': KneeFlexionFeature(),
-        'Sitting_Adl': SittingAdlFeature(),
-        'Lying_Adl': LyingAdlFeature(),
-        'Active_Hours': ActiveHoursFeature()
-    }
-)
+# Initialise phases with the required features, once per session rather than on every rerun
+if 'phases' not in st.session_state:
+    st.session_state['phases'] = build_phases()
+phase_1, phase_2, phase_3, phase_4, phase_5 = st.session_state['phases']
 
 # App Variables
 current_phase = None#phase_1
@@ -382,7 +404,7 @@ with st.container():
     st.title('🚶 Synthetic Gait Data Generator')
 
 # Hero Section
-st.markdown("""
+st.markdown(f"""
 <div class="hero-section">
     <div class="hero-title">🧬 Mobility & Gait Synthetic Data Generator</div>
     <div class="hero-subtitle">Generate realistic synthetic gait and mobility data for healthcare analytics, research, and ML model training</div>
@@ -392,7 +414,7 @@ st.markdown("""
             <div class="stat-label">Mobility Phases</div>
         </div>
         <div class="stat-item">
-            <div class="stat-number">9</div>
+            <div class="stat-number">{len(FEATURE_CATALOG)}</div>
             <div class="stat-label">Gait Features</div>
         </div>
         <div class="stat-item">
@@ -459,19 +481,13 @@ with st.expander("📖 Detailed Guide & Phase Descriptions", expanded=False):
         </div>
         """, unsafe_allow_html=True)
         
-        st.markdown("""
+        feature_tags = ''.join(f'<span class="feature-tag" title="{spec.description}">{spec.name.replace("_", " ")}</span>'
+                               for spec in FEATURE_CATALOG)
+        st.markdown(f"""
         <div class="info-card">
             <div class="info-card-title">📊 Available Features</div>
             <div class="info-card-content">
-                <span class="feature-tag">Gait Speed</span>
-                <span class="feature-tag">Step Length</span>
-                <span class="feature-tag">Step Width</span>
-                <span class="feature-tag">TUG Score</span>
-                <span class="feature-tag">Cadence</span>
-                <span class="feature-tag">Knee Flexion</span>
-                <span class="feature-tag">Sitting ADL</span>
-                <span class="feature-tag">Lying ADL</span>
-                <span class="feature-tag">Active Hours</span>
+                {feature_tags}
             </div>
         </div>
         """, unsafe_allow_html=True)
@@ -488,7 +504,8 @@ with st.expander("📖 Detailed Guide & Phase Descriptions", expanded=False):
                 • Value Range (Start → End)<br>
                 • Distribution Space (Linear/Geometric)<br>
                 • Trend Type (Nearest/Linear/Cubic/Quadratic)<br>
-                • Noise Level (Standard Deviation)
+                • Noise Level (Standard Deviation)<br>
+                • Noise Model (White/AR/Random walk/Heteroscedastic/Weekly)
             </div>
         </div>
         """, unsafe_allow_html=True)
@@ -500,6 +517,7 @@ with st.expander("📖 Detailed Guide & Phase Descriptions", expanded=False):
                 • Phase intervals are <strong>left-closed</strong><br>
                 • Units are not specified - use ranges to define values<br>
                 • All phases must be configured before generating data<br>
+                • Feature settings take effect when you click <strong>Apply</strong><br>
                 • Include timestamps for time-series analysis
             </div>
         </div>
@@ -518,7 +536,7 @@ st.sidebar.markdown("""
 
 st.sidebar.subheader('📋 Phase Selection')
 final_frame_phase = st.sidebar.multiselect('🎯 Phases to include:', 
-                                                ['Phase_1', 'Phase_2', 'Phase_3', 'Phase_4', 'Phase_5'],
+                                                PHASE_NAMES,
                                                 help="Select one or more mobility phases for your dataset")
 
 st.sidebar.markdown("---")
@@ -529,21 +547,26 @@ selected_phase = st.sidebar.radio(
 
 st.sidebar.markdown("---")
 st.sidebar.subheader('📊 Feature Selection')
-final_frame_features = st.sidebar.multiselect('Features to include:', 
-                                                ['Gait_Speed',
-                                                'Step_Length',
-                                                'Step_Width',
-                                                'Tug_Score',
-                                                'Cadence',
-                                                'Knee_Flexion',
-                                                'Sitting_Adl',
-                                                'Lying_Adl',
-                                                'Active_Hours'],
-                                                help="Select the gait/mobility features you want in your dataset")
+final_frame_features = st.sidebar.multiselect('Features to include:', FEATURE_NAMES,
+                                              help="Select the gait/mobility features you want in your dataset")
 
 st.sidebar.markdown("---")
 st.sidebar.subheader('⏰ Timestamp Option')
 include_dates = st.sidebar.checkbox('📅 Include timestamps', help="Add date column to the generated data")
+compact = st.sidebar.checkbox('🗜️ Compact schema', help="Phase column, timestamps as seconds from the phase start, "
+                                                       "float32 or fixed point int16 values, decoded with the schema file")
+
+st.sidebar.markdown("---")
+st.sidebar.subheader('📐 Calibration')
+st.sidebar.file_uploader('Reference CSV', type=['csv', 'gz'], key='reference_file',
+                         help="Real measurements with a Phase column, feature columns and an optional Date column. "
+                              "Uploads are limited to 10 MB, fit larger recordings with "
+                              "`python calibrate.py reference.csv --output config.json`")
+st.sidebar.button('🎯 Fit settings to reference', on_click=apply_calibration,
+                  help="Fit dates, readings per day, start/end, space, noise model and noise of every phase in the file")
+if 'calibration_message' in st.session_state:
+    message_kind, message = st.session_state['calibration_message']
+    getattr(st.sidebar, message_kind)(message)
 selected_phase_holder = st.empty()
 siderbar_selected_phase_holder = st.sidebar.empty()
 phase_configure_place_holder = st.empty()
@@ -581,29 +604,179 @@ with st.container():
         </div>
         """, unsafe_allow_html=True)
         st.caption(f"Configure the parameters for each feature in {current_phase.name.replace('_', ' ')}")
-        for feature in current_phase.feature_dic:
-            current_phase.feature_dic[feature].render(get_total_data_points(st.session_state[current_phase.name+'_start_date'], st.session_state[current_phase.name+'_end_date'], 
-                                                    st.session_state[current_phase.name+'_frequency_per_day']),
-                                                    current_phase.name)
+        # The phase settings are read from the widgets once, the features only see the immutable copy
+        phase_settings = build_phase_settings(collect_config([current_phase], st.session_state), current_phase.name)
+        # Only the included features are rendered, the others keep their settings until they are included again
+        for feature_name, feature in current_phase.feature_dic.items():
+            if feature_name in final_frame_features:
+                feature.render(phase_settings)
+        if not final_frame_features:
+            st.info('Select features in the sidebar to configure them')
+
+# Preset scenarios are served from the artifact cache, built on first use unless the image has them
+st.sidebar.markdown("---")
+st.sidebar.subheader('📦 Preset Datasets')
+preset_name = st.sidebar.selectbox('Scenario', [None] + list(PRESETS), key='preset_name',
+                                   format_func=lambda name: 'None' if name is None else PRESETS[name].title,
+                                   help="Standard scenarios with a fixed seed, ready to download without generating")
+if preset_name is not None:
+    preset = PRESETS[preset_name]
+    st.sidebar.caption(preset.description)
+    with st.sidebar:
+        with st.spinner('Building preset ....'):
+            preset_path = build_preset(preset)
+    with open(preset_path, 'rb') as preset_file:
+        st.sidebar.download_button('📥 Download preset (gzip)', preset_file, file_name=f"{preset.name}.csv.gz",
+                                   mime='application/gzip')
+    with open(get_preset_paths(preset)[1]) as manifest_file:
+        preset_manifest_b64 = base64.b64encode(manifest_file.read().encode()).decode()
+    st.sidebar.markdown(f'<a href="data:application/json;base64,{preset_manifest_b64}" download="{preset.name}.manifest.json">📄 Download manifest</a>',
+                        unsafe_allow_html=True)
 
 # Download section in sidebar
 st.sidebar.markdown("---")
 st.sidebar.subheader('💾 Generate Data')
+use_seed = st.sidebar.checkbox('🎲 Reproducible seed', help="Generate the same data on every click and get a manifest to rebuild it")
+seed = st.sidebar.number_input('Seed', value=0, min_value=0, format="%d", key='seed') if use_seed else None
+
+# Pre-flight estimate of the selected dataset
+phases = [phase_1, phase_2, phase_3, phase_4, phase_5]
+config = with_feature_defaults(collect_config(phases, st.session_state), set(final_frame_phase),
+                               set(final_frame_features))
+try:
+    dataset = build_dataset_settings(config, set(final_frame_features), set(final_frame_phase), include_dates)
+    estimate = estimate_cost(config, set(final_frame_features), set(final_frame_phase), phases, include_dates=include_dates,
+                             compact=compact)
+except KeyError:
+    dataset, estimate = None, None
+if final_frame_phase and estimate is None:
+    st.sidebar.caption('Configure all included phases to see the estimated size')
+elif final_frame_phase:
+    st.sidebar.caption(f"📐 ~{estimate.rows:,} rows · {format_bytes(estimate.memory_bytes)} in memory · "
+                       f"{format_bytes(estimate.file_bytes)} {'gzip' if estimate.mode != MEMORY_MODE else 'CSV'} · "
+                       f"~{estimate.seconds:.1f} s")
+    if estimate.mode == BACKGROUND_MODE:
+        st.sidebar.info('⏳ Long generation: it will run in the background and be written to disk in chunks')
+    elif estimate.mode != MEMORY_MODE:
+        st.sidebar.info('💽 Large dataset: it will be written to disk in chunks as a gzipped CSV')
+
 download=st.sidebar.button('🚀 Generate Download Link', help="Click to generate your synthetic dataset")
+current_date = datetime.datetime.now().strftime("%Y-%m-%d")
+if 'export_session' not in st.session_state:
+    st.session_state['export_session'] = uuid.uuid4().hex
+export_session = st.session_state['export_session']
+with get_export_lock():
+    evict_exports(get_export_jobs())
+if download and estimate is not None and estimate.mode != MEMORY_MODE:
+    # Chunks are split by row ranges, which needs the counter based noise
+    # Without a seed, one is drawn per dataset and session, so clicking again reuses the export and its file
+    export_seed = seed
+    if export_seed is None:
+        if st.session_state.get('export_seed', (None, None))[0] != (dataset.fingerprint, compact):
+            st.session_state['export_seed'] = ((dataset.fingerprint, compact), random.randrange(2 ** 32))
+        export_seed = st.session_state['export_seed'][1]
+    export_key = (dataset.fingerprint, export_seed, compact)
+    inline_future = None
+    with get_export_lock():
+        export_jobs = get_export_jobs()
+        if st.session_state.get('export_key') not in (None, export_key):
+            release_export(export_jobs, st.session_state['export_key'], export_session)
+        export_job = export_jobs.get(export_key)
+        if export_job is not None and export_job.failed():
+            del export_jobs[export_key]
+            export_job.remove()
+            export_job = None
+        if export_job is None:
+            export_path = os.path.join(tempfile.gettempdir(), f"SyntheticGaitData_{uuid.uuid4().hex}.csv.gz")
+            if estimate.mode == BACKGROUND_MODE:
+                future = get_background_executor().submit(export_data, export_path, dataset, export_seed, compact)
+            else:
+                # Chunked exports run in this script thread, not behind the background exports of other sessions
+                future = inline_future = futures.Future()
+                future.set_running_or_notify_cancel()
+            export_job = export_jobs[export_key] = ExportJob(future, export_path)
+        export_job.hold(export_session)
+        evict_exports(export_jobs)
+    st.session_state['export_key'] = export_key
+    if estimate.mode != BACKGROUND_MODE:
+        with st.sidebar:
+            with st.spinner('Writing data to disk ....'):
+                if inline_future is not None:
+                    try:
+                        inline_future.set_result(export_data(export_job.path, dataset, export_seed, compact))
+                    except Exception as error:
+                        inline_future.set_exception(error)
+                else:
+                    # The same export, started by another session
+                    futures.wait([export_job.future])
+    download = False
+
+report = None
 if download:
     try:
-        csv = generate_data(set(final_frame_features), set(final_frame_phase), 
-                        [phase_1, phase_2, phase_3, phase_4, phase_5], 
-                        include_dates = include_dates).to_csv(index=False)
+        result_df, report, schema_dict = generate_data(dataset, seed=seed, compact=compact)
+        csv = result_df.to_csv(index=False)
         b64 = base64.b64encode(csv.encode()).decode()  # some strings
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
         filename = f"SyntheticGaitData_{current_date}.csv"
         linko= f'<a href="data:file/csv;base64,{b64}" download="{filename}" style="display: inline-block; padding: 0.5rem 1rem; background: #e94560; color: white; text-decoration: none; border-radius: 5px; font-weight: bold;">📥 Download CSV</a>'
         st.sidebar.markdown(linko, unsafe_allow_html=True)
+        if schema_dict:
+            st.sidebar.markdown(get_schema_link(schema_dict, current_date), unsafe_allow_html=True)
+        if use_seed:
+            manifest_json = json.dumps(build_manifest(config, set(final_frame_features), set(final_frame_phase), include_dates, seed))
+            manifest_b64 = base64.b64encode(manifest_json.encode()).decode()
+            st.sidebar.markdown(f'<a href="data:application/json;base64,{manifest_b64}" download="SyntheticGaitData_{current_date}.manifest.json">📄 Download manifest</a>',
+                                unsafe_allow_html=True)
         st.sidebar.success('✅ Data generated successfully!')
     except:
+        report = None
         st.sidebar.error('⚠️ Please configure all included phases before generating data.')
 
+# Chunked and background exports are served from disk once done
+if 'export_key' in st.session_state:
+    export_file = None
+    with get_export_lock():
+        # The file is opened under the lock, so no other session evicts it in between
+        export_job = get_export_jobs().get(st.session_state['export_key'])
+        export_done = export_job is not None and export_job.future.done()
+        if export_job is not None:
+            export_job.hold(export_session)
+        if export_done and not export_job.failed() and os.path.exists(export_job.path):
+            export_file = open(export_job.path, 'rb')
+    if export_job is None or (export_done and not export_job.failed() and export_file is None):
+        st.sidebar.info('⌛ The exported data expired, please generate it again.')
+        del st.session_state['export_key']
+    elif not export_done:
+        st.sidebar.info('⏳ Generating data in the background ....')
+        st.sidebar.button('🔄 Check progress')
+    elif export_job.failed():
+        st.sidebar.error(f'⚠️ The export failed: {export_job.get_error()}')
+        with get_export_lock():
+            release_export(get_export_jobs(), st.session_state['export_key'], export_session)
+        del st.session_state['export_key']
+    else:
+        report, schema_dict = export_job.future.result()
+        with export_file:
+            st.sidebar.download_button('📥 Download CSV (gzip)', export_file, file_name=f"SyntheticGaitData_{current_date}.csv.gz",
+                                       mime='application/gzip')
+        if schema_dict:
+            st.sidebar.markdown(get_schema_link(schema_dict, current_date), unsafe_allow_html=True)
+        st.sidebar.success('✅ Data generated successfully!')
+
+# Statistics report of the generated data
+if report:
+    st.markdown("""
+    <div class="section-header">
+        <h3>📈 Data Report</h3>
+    </div>
+    """, unsafe_allow_html=True)
+    st.dataframe(get_summary_frame(report))
+    report_json_b64 = base64.b64encode(report_to_json(report).encode()).decode()
+    report_html_b64 = base64.b64encode(report_to_html(report).encode()).decode()
+    st.markdown(f'<a href="data:application/json;base64,{report_json_b64}" download="SyntheticGaitData_{current_date}.report.json">📥 Download JSON report</a> &nbsp; '
+                f'<a href="data:text/html;base64,{report_html_b64}" download="SyntheticGaitData_{current_date}.report.html">📥 Download HTML report</a>',
+                unsafe_allow_html=True)
+
 # Footer info
 st.sidebar.markdown("---")
 st.sidebar.caption("🧬 Synthetic Gait Data Generator v1.0")
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""Incremental appends to seeded datasets.
+
+A state file next to the output records per phase the rows written, the control
+grid and the last reading day, and per feature the tail of stateful noise (the
+last AR values or the random walk level). Since the noise of a seeded dataset is
+counter based, new days of the last phase continue its trend, noise and
+timestamps from the next row, and new phases are generated after it. Readings of
+irregular phases are drawn per new day from streams keyed by the day, so
+extending by 30 days gives the same rows as 10 and then 20. Rows are appended to the output without reading or
+rewriting it, so an append costs only the new rows.
+
+Outputs are csv (gzipped for .gz paths), a directory of Parquet parts for
+.parquet paths, or raw records for .bin paths, read with open_memmap.
+
+Usage:
+    python append.py init manifest.json data.csv
+    python append.py extend data.csv --phase Phase_5 --days 30
+    python append.py add data.csv --phase Phase_4 --config phase4.json
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from counter_rng import FeatureStream, get_sampling_rng
+from estimate import CHUNK_ROWS
+from manifest import load_manifest
+from noise_models import STATEFUL_MODELS, get_phase_noise_state
+from util import (DEFAULT_END_DATE, DEFAULT_START_DATE, PHASE_NAMES, build_phases, default_config,
+                  extend_feature_values, get_date_slice, get_day_sample_times, get_initial_space_len, get_sample_dates,
+                  get_sample_times, get_total_data_points, iter_dataset, iter_phase_chunks, parse_config,
+                  serialize_config)
+
+STATE_VERSION = 1
+
+
+def get_state_path(path):
+    return path.rstrip('/') + '.state.json'
+
+
+def get_output_format(path):
+    if path.rstrip('/').endswith('.parquet'):
+        return 'parquet'
+    if path.endswith('.bin'):
+        return 'memmap'
+    return 'csv'
+
+
+def get_record_dtype(features, include_dates):
+    # Column order of generate_phase, features then the date
+    return np.dtype([(feature, '<f8') for feature in features] + ([('Date', '<M8[s]')] if include_dates else []))
+
+
+def load_state(path):
+    with open(get_state_path(path)) as state_file:
+        state = json.load(state_file)
+    if state.get('version') != STATE_VERSION:
+        raise ValueError(f'Unsupported state version {state.get("version")}')
+    return state
+
+
+def write_state(path, state):
+    # Replaced in one step after the rows are written, so a failed append leaves the previous state
+    temporary_path = get_state_path(path) + '.tmp'
+    with open(temporary_path, 'w') as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(temporary_path, get_state_path(path))
+
+
+def open_memmap(path):
+    # Records of a .bin output without loading them
+    state = load_state(path)
+    dtype = np.dtype([tuple(field) for field in state['dtype']])
+    if state['rows'] == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(state['rows'],))
+
+
+def append_frame(path, state, frame):
+    if len(frame) == 0:
+        return
+    if state['format'] == 'parquet':
+        os.makedirs(path, exist_ok=True)
+        frame.to_parquet(os.path.join(path, f"part-{state['parts']:05d}.parquet"), index=False)
+        state['parts'] += 1
+    elif state['format'] == 'memmap':
+        dtype = np.dtype([tuple(field) for field in state['dtype']])
+        records = np.empty(len(frame), dtype=dtype)
+        for name in dtype.names:
+            records[name] = frame[name].to_numpy().astype(dtype[name])
+        with open(path, 'ab') as output:
+            output.write(records.tobytes())
+    else:
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'at', newline='') as output:
+            frame.to_csv(output, index=False, header=state['rows'] == 0)
+    state['rows'] += len(frame)
+
+
+def get_phase(phase_name):
+    return next(phase for phase in build_phases() if phase.name == phase_name)
+
+
+def get_phase_settings(config, phase_name):
+    return {key: value for key, value in config.items() if key.startswith(phase_name + '_')}
+
+
+def get_last_time(start_date, last_day):
+    return str(get_sample_dates(start_date, np.array([last_day]))[0])
+
+
+def build_phase_state(config, phase, include_features, seed, chunk_rows=CHUNK_ROWS):
+    # Where a phase generated with the seed ends, from its settings alone
+    phase_index = PHASE_NAMES.index(phase.name)
+    start_date, end_date = config[phase.name + '_start_date'], config[phase.name + '_end_date']
+    phase_days = (end_date - start_date).days
+    frequency = config[phase.name + '_frequency_per_day']
+    sampling = config.get(phase.name + '_sampling', 'Regular')
+    if sampling == 'Regular':
+        rows = get_total_data_points(start_date, end_date, frequency)
+        days = np.arange(rows) * phase_days / max(rows, 1)
+        initial_space_len = get_initial_space_len(rows)
+        # Rows are spread evenly from the first to the last control point
+        x_per_day = frequency * initial_space_len / max(rows - 1, 1)
+    else:
+        sampling_rng = get_sampling_rng(seed, phase_index)
+        sample_times = get_sample_times(start_date, end_date, frequency, sampling,
+                                        config.get(phase.name + '_wear_probability', 1.0), rng=sampling_rng)
+        rows = len(sample_times)
+        days = sample_times / max(phase_days, 1) * phase_days
+        initial_space_len = get_initial_space_len(rows)
+        x_per_day = initial_space_len / max(phase_days, 1)
+
+    feature_states = {}
+    for feature_index, feature_name in enumerate(phase.feature_dic):
+        if feature_name not in include_features:
+            continue
+        prefix = phase.name + '_' + feature_name
+        noise_model = config.get(prefix + '_noise_model', 'White')
+        coefficients = config.get(prefix + '_noise_coefficients')
+        noise_state = []
+        if config[prefix + '_noise'] != 0 and noise_model in STATEFUL_MODELS and rows:
+            noise_state = get_phase_noise_state(noise_model, days, phase_days or rows, chunk_rows,
+                                                coefficients=coefficients, first_weekday=start_date.weekday(),
+                                                stream=FeatureStream(seed, feature_index, phase_index))
+        feature_states[feature_name] = {'noise_state': noise_state}
+
+    last_day = float(days[-1]) if rows else 0.0
+    return {
+        'name': phase.name,
+        'settings': serialize_config(get_phase_settings(config, phase.name)),
+        'rows': int(rows),
+        'phase_days': phase_days,
+        'days': phase_days,
+        'initial_space_len': initial_space_len,
+        'x_per_day': x_per_day,
+        'last_day': last_day,
+        'last_time': get_last_time(start_date, last_day) if rows else None,
+        'features': feature_states,
+    }
+
+
+def extend_phase(state, phase_state, extra_days):
+    # Rows of the next extra_days of a phase, the phase state is moved past them
+    phase = get_phase(phase_state['name'])
+    phase_index = PHASE_NAMES.index(phase.name)
+    settings = parse_config(phase_state['settings'])
+    start_date = settings[phase.name + '_start_date']
+    frequency = settings[phase.name + '_frequency_per_day']
+    sampling = settings.get(phase.name + '_sampling', 'Regular')
+    first_row = phase_state['rows']
+    if sampling == 'Regular':
+        days = np.arange(first_row, first_row + extra_days * frequency) / frequency
+    else:
+        days = get_day_sample_times(phase_state['days'], phase_state['days'] + extra_days, frequency, sampling,
+                                    settings.get(phase.name + '_wear_probability', 1.0), state['seed'], phase_index)
+    x = days * phase_state['x_per_day']
+
+    result = {}
+    for feature_index, feature_name in enumerate(phase.feature_dic):
+        if feature_name not in phase_state['features']:
+            continue
+        prefix = phase.name + '_' + feature_name
+        feature_state = phase_state['features'][feature_name]
+        result[feature_name], feature_state['noise_state'] = extend_feature_values(
+            settings[prefix + '_base_start'], settings[prefix + '_base_end'], settings[prefix + '_space'],
+            settings[prefix + '_trend'], settings[prefix + '_noise'], phase_state['initial_space_len'], x, first_row,
+            FeatureStream(state['seed'], feature_index, phase_index), days,
+            noise_model=settings.get(prefix + '_noise_model', 'White'),
+            coefficients=settings.get(prefix + '_noise_coefficients'), last_day=phase_state['last_day'],
+            phase_days=phase_state['phase_days'] or phase_state['rows'], first_weekday=start_date.weekday(),
+            noise_state=feature_state['noise_state'])
+    if state['include_dates'] and sampling == 'Regular':
+        result['Date'] = get_date_slice(start_date, frequency, first_row, first_row + len(days))
+    elif state['include_dates']:
+        result['Date'] = get_sample_dates(start_date, days)
+
+    phase_state['rows'] += len(days)
+    phase_state['days'] += extra_days
+    settings[phase.name + '_end_date'] = start_date + datetime.timedelta(days=phase_state['days'])
+    phase_state['settings'] = serialize_config(settings)
+    if len(days):
+        phase_state['last_day'] = float(days[-1])
+        phase_state['last_time'] = get_last_time(start_date, phase_state['last_day'])
+    return pd.DataFrame(result)
+
+
+def init_output(manifest, path, chunk_rows=CHUNK_ROWS):
+    # State of a dataset built from a manifest, the output is written first when it does not exist yet
+    phases = build_phases()
+    include_phases = [phase_name for phase_name in PHASE_NAMES if phase_name in manifest['phases']]
+    state = {
+        'version': STATE_VERSION,
+        'seed': manifest['seed'],
+        'features': manifest['features'],
+        'include_dates': manifest['include_dates'],
+        'format': get_output_format(path),
+        'dtype': get_record_dtype(manifest['features'], manifest['include_dates']).descr,
+        'rows': 0,
+        'parts': 0,
+        'phases': [build_phase_state(manifest['config'], phase, manifest['features'], manifest['seed'], chunk_rows)
+                   for phase in phases if phase.name in include_phases],
+    }
+    if os.path.exists(path):
+        # The output holds the manifest's dataset
+        state['rows'] = sum(phase_state['rows'] for phase_state in state['phases'])
+        if state['format'] == 'parquet':
+            state['parts'] = len([name for name in os.listdir(path) if name.endswith('.parquet')])
+    else:
+        for _, chunk in iter_dataset(manifest['config'], set(manifest['features']), set(include_phases), phases,
+                                     include_dates=manifest['include_dates'], seed=manifest['seed'],
+                                     chunk_rows=chunk_rows):
+            append_frame(path, state, chunk)
+    return state
+
+
+def extend_output(path, state, phase_name, extra_days, chunk_rows=CHUNK_ROWS):
+    # Only the last phase can grow, the rows are written in blocks of whole days
+    if not state['phases'] or state['phases'][-1]['name'] != phase_name:
+        last_phase = state['phases'][-1]['name'] if state['phases'] else None
+        raise ValueError(f'Only the last phase of the output ({last_phase}) can be extended, not {phase_name}')
+    phase_state = state['phases'][-1]
+    if phase_state['initial_space_len'] < 2:
+        raise ValueError(f'{phase_name} has too few rows to continue its trend')
+    frequency = parse_config(phase_state['settings'])[phase_name + '_frequency_per_day']
+    block_days = max(chunk_rows // max(frequency, 1), 1)
+    for first_day in range(0, extra_days, block_days):
+        append_frame(path, state, extend_phase(state, phase_state, min(block_days, extra_days - first_day)))
+
+
+def add_phase(path, state, phase_name, config, days=None, chunk_rows=CHUNK_ROWS):
+    # A phase not in the output yet, it starts where the last phase ends unless the config dates it
+    if any(phase_state['name'] == phase_name for phase_state in state['phases']):
+        raise ValueError(f'{phase_name} is already in the output, extend it instead')
+    phase = get_phase(phase_name)
+    settings = get_phase_settings(default_config([phase]), phase_name)
+    settings.update(get_phase_settings(config, phase_name))
+    start_key, end_key = phase_name + '_start_date', phase_name + '_end_date'
+    if start_key not in config and state['phases']:
+        last_phase = state['phases'][-1]
+        settings[start_key] = parse_config(last_phase['settings'])[last_phase['name'] + '_end_date']
+    if days is not None:
+        settings[end_key] = settings[start_key] + datetime.timedelta(days=days)
+    elif end_key not in config:
+        settings[end_key] = settings[start_key] + (DEFAULT_END_DATE - DEFAULT_START_DATE)
+    for chunk in iter_phase_chunks(settings, phase, set(state['features']), include_dates=state['include_dates'],
+                                   seed=state['seed'], chunk_rows=chunk_rows):
+        append_frame(path, state, chunk)
+    state['phases'].append(build_phase_state(settings, phase, state['features'], state['seed'], chunk_rows))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Append days or phases to a seeded dataset without regenerating it')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='Rows generated per block')
+    commands = parser.add_subparsers(dest='command', required=True)
+    init_parser = commands.add_parser('init', help='Write the state of a manifest dataset, and the output if missing')
+    init_parser.add_argument('manifest', help='Manifest of the dataset, from the app or manifest.py')
+    init_parser.add_argument('output', help='Output path, .csv, .csv.gz, .parquet (directory of parts) or .bin records')
+    extend_parser = commands.add_parser('extend', help='Continue the last phase of the output for more days')
+    extend_parser.add_argument('output', help='Output path with a state file next to it')
+    extend_parser.add_argument('--phase', required=True, help='Last phase of the output')
+    extend_parser.add_argument('--days', type=int, required=True, help='Days to append')
+    add_parser = commands.add_parser('add', help='Append a phase that is not in the output yet')
+    add_parser.add_argument('output', help='Output path with a state file next to it')
+    add_parser.add_argument('--phase', required=True, help='Phase to append')
+    add_parser.add_argument('--config', default=None, help='Json file of the phase settings, widget defaults otherwise')
+    add_parser.add_argument('--days', type=int, default=None, help='Length of the phase, from its start date')
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        state = init_output(load_manifest(args.manifest), args.output, chunk_rows=args.chunk_rows)
+    else:
+        state = load_state(args.output)
+        rows = state['rows']
+        if args.command == 'extend':
+            extend_output(args.output, state, args.phase, args.days, chunk_rows=args.chunk_rows)
+        else:
+            config = {}
+            if args.config:
+                with open(args.config) as config_file:
+                    config = parse_config(json.load(config_file))
+            add_phase(args.output, state, args.phase, config, days=args.days, chunk_rows=args.chunk_rows)
+        print(f"Appended {state['rows'] - rows} rows")
+    write_state(args.output, state)
+    print(f"{args.output} has {state['rows']} rows, state in {get_state_path(args.output)}")
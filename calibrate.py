@@ -0,0 +1,282 @@
+"""Calibration of the phase and feature settings from real reference data.
+
+A reference csv has a Phase column (Phase_1..Phase_5), a column per measured
+feature (any of the generator's feature names) and optionally a Date column.
+Readings of a phase are expected in time order. The file is read in chunks and
+every (phase, feature) keeps one-pass regression sums, so references of any size
+are calibrated in constant memory:
+
+- base start/end and space: least squares line of the values, or of their log
+  (Geometric) when it fits better, Constant when the slope is not significant
+- noise model and noise: from the residuals of the line, their lag-1
+  autocorrelation (AR, Random walk), the trend of their variance
+  (Heteroscedastic) and their mean per weekday (Weekly, needs dates)
+- trend: Linear, the fitted control points are joined by straight lines
+
+With a Date column the phase dates and readings per day are fitted too, without
+it readings are assumed to be a day apart.
+
+Usage: python calibrate.py reference.csv --output config.json
+"""
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+from util import FEATURE_NAMES, PHASE_NAMES, serialize_config
+
+CHUNK_ROWS = 100000
+# Slopes below this many standard errors give a Constant space
+SLOPE_T_MIN = 2.0
+# Residuals this autocorrelated are a random walk
+RANDOM_WALK_AUTOCORRELATION = 0.98
+# Share of the residual variance explained by weekday means for a Weekly model
+WEEKLY_SHARE = 0.5
+# Residual variance at the phase start below this share of the end for a Heteroscedastic model
+HETEROSCEDASTIC_RATIO = 0.25
+MAX_AR_COEFFICIENT = 0.95
+
+
+class LineSums:
+    """One-pass sums of a series against time, for its line and the residuals around it."""
+
+    def __init__(self):
+        self.count = 0
+        self.shift = None
+        self.last = None
+        self.u_max = 0.0
+        self.sums = dict.fromkeys(['u', 'uu', 'uuu', 'y', 'yy', 'uy', 'uuy', 'uyy',
+                                   'pairs', 'y0', 'y1', 'u0', 'u1', 'y0y1', 'u0y1', 'y0u1', 'u0u1',
+                                   'dydy', 'dydu', 'dudu', 'du'], 0.0)
+        self.weekday_count = np.zeros(7)
+        self.weekday_y = np.zeros(7)
+        self.weekday_u = np.zeros(7)
+
+    def update(self, times, values, weekdays=None):
+        # Shifted by the first reading to keep the sums well conditioned
+        if self.shift is None:
+            self.shift = (times[0], values[0])
+        u = times - self.shift[0]
+        y = values - self.shift[1]
+        sums = self.sums
+        self.count += len(y)
+        self.u_max = max(self.u_max, u.max())
+        sums['u'] += u.sum()
+        sums['uu'] += np.dot(u, u)
+        sums['uuu'] += np.dot(u * u, u)
+        sums['y'] += y.sum()
+        sums['yy'] += np.dot(y, y)
+        sums['uy'] += np.dot(u, y)
+        sums['uuy'] += np.dot(u * u, y)
+        sums['uyy'] += np.dot(u, y * y)
+        if weekdays is not None:
+            self.weekday_count += np.bincount(weekdays, minlength=7)
+            self.weekday_y += np.bincount(weekdays, weights=y, minlength=7)
+            self.weekday_u += np.bincount(weekdays, weights=u, minlength=7)
+
+        # Consecutive readings, the last one of the previous chunk included
+        if self.last is not None:
+            u = np.concatenate(([self.last[0]], u))
+            y = np.concatenate(([self.last[1]], y))
+        self.last = (u[-1], y[-1])
+        u0, u1, y0, y1 = u[1:], u[:-1], y[1:], y[:-1]
+        du, dy = u0 - u1, y0 - y1
+        sums['pairs'] += len(u0)
+        sums['y0'] += y0.sum()
+        sums['y1'] += y1.sum()
+        sums['u0'] += u0.sum()
+        sums['u1'] += u1.sum()
+        sums['y0y1'] += np.dot(y0, y1)
+        sums['u0y1'] += np.dot(u0, y1)
+        sums['y0u1'] += np.dot(y0, u1)
+        sums['u0u1'] += np.dot(u0, u1)
+        sums['dydy'] += np.dot(dy, dy)
+        sums['dydu'] += np.dot(dy, du)
+        sums['dudu'] += np.dot(du, du)
+        sums['du'] += du.sum()
+
+    @property
+    def centered_uu(self):
+        return self.sums['uu'] - self.sums['u'] ** 2 / self.count
+
+    def get_line(self):
+        # Least squares intercept and slope in shifted coordinates
+        sums, n = self.sums, self.count
+        slope = (sums['uy'] - sums['u'] * sums['y'] / n) / self.centered_uu if self.centered_uu > 0 else 0.0
+        return (sums['y'] - slope * sums['u']) / n, slope
+
+    def get_residuals(self):
+        # Statistics of the residuals e = y - a - b * u, expanded over the stored sums
+        sums, n = self.sums, self.count
+        a, b = self.get_line()
+        squares = sums['yy'] - 2 * a * sums['y'] - 2 * b * sums['uy'] + a * a * n + 2 * a * b * sums['u'] + b * b * sums['uu']
+        squares = max(squares, 0.0)
+        squares_u = sums['uyy'] - 2 * a * sums['uy'] - 2 * b * sums['uuy'] + a * a * sums['u'] + \
+            2 * a * b * sums['uu'] + b * b * sums['uuu']
+        lagged = sums['y0y1'] - a * sums['y0'] - b * sums['y0u1'] - a * sums['y1'] + a * a * sums['pairs'] + \
+            a * b * sums['u1'] - b * sums['u0y1'] + a * b * sums['u0'] + b * b * sums['u0u1']
+        steps = max(sums['dydy'] - 2 * b * sums['dydu'] + b * b * sums['dudu'], 0.0)
+
+        variance = squares / max(n - 2, 1)
+        # Trend of the squared residuals over the phase
+        variance_slope = (squares_u - sums['u'] * squares / n) / self.centered_uu if self.centered_uu > 0 else 0.0
+        variance_start = (squares - variance_slope * sums['u']) / n
+        weekday_variance = 0.0
+        seen = self.weekday_count > 0
+        if seen.any():
+            weekday_means = (self.weekday_y[seen] - a * self.weekday_count[seen] - b * self.weekday_u[seen]) / \
+                self.weekday_count[seen]
+            weekday_variance = np.average(np.square(weekday_means), weights=self.weekday_count[seen])
+        return {
+            'variance': variance,
+            'total': sums['yy'] - sums['y'] ** 2 / n,
+            'squares': squares,
+            'slope_error': np.sqrt(variance / self.centered_uu) if self.centered_uu > 0 else np.inf,
+            'autocorrelation': lagged / squares if squares > 0 and sums['pairs'] > 0 else 0.0,
+            'step_variance': steps / sums['du'] if sums['du'] > 0 else 0.0,
+            'variance_start': variance_start,
+            'variance_end': variance_start + variance_slope * self.u_max,
+            'weekday_variance': weekday_variance,
+        }
+
+
+class FeatureFit:
+    """Line of the values, and of their log while they are positive, of one phase and feature."""
+
+    def __init__(self):
+        self.values = LineSums()
+        self.logs = LineSums()
+        self.positive = True
+
+    @property
+    def count(self):
+        return self.values.count
+
+    def update(self, times, values, weekdays=None):
+        if len(values) == 0:
+            return
+        self.values.update(times, values, weekdays)
+        self.positive = self.positive and bool(np.all(values > 0))
+        if self.positive:
+            self.logs.update(times, np.log(values), weekdays)
+
+    def fit(self):
+        lines = self.values
+        residuals = lines.get_residuals()
+        intercept, slope = lines.get_line()
+        start = lines.shift[1] + intercept
+        end = start + slope * lines.u_max
+        # Noise in the log space is converted with the mean inverse square level of the fitted curve
+        scale = 1.0
+
+        # Space from the slope significance and the fit of the line against the log line
+        # A random walk bends the readings by itself, so it keeps the line
+        space = 'Linear'
+        if lines.count < 3 or abs(slope) < SLOPE_T_MIN * residuals['slope_error']:
+            space = 'Constant'
+            start = end = lines.shift[1] + lines.sums['y'] / lines.count
+        elif self.positive and residuals['autocorrelation'] < RANDOM_WALK_AUTOCORRELATION:
+            log_residuals = self.logs.get_residuals()
+            if residuals['total'] > 0 and log_residuals['total'] > 0 and \
+                    log_residuals['squares'] / log_residuals['total'] + 0.01 < residuals['squares'] / residuals['total']:
+                space = 'Geometric'
+                log_intercept, log_slope = self.logs.get_line()
+                log_start = self.logs.shift[1] + log_intercept
+                growth = 2 * log_slope * self.logs.u_max
+                mean_inverse_square = np.exp(-2 * log_start) * (-np.expm1(-growth) / growth if growth else 1.0)
+                scale = 1 / np.sqrt(mean_inverse_square)
+                start, end = np.exp(log_start), np.exp(log_start + log_slope * self.logs.u_max)
+                residuals = log_residuals
+
+        # Noise model from the residuals
+        noise_model, noise = 'AR', np.sqrt(residuals['variance'])
+        coefficient = float(np.clip(residuals['autocorrelation'], -MAX_AR_COEFFICIENT, MAX_AR_COEFFICIENT))
+        if residuals['autocorrelation'] >= RANDOM_WALK_AUTOCORRELATION and residuals['step_variance'] > 0:
+            noise_model, noise = 'Random walk', np.sqrt(residuals['step_variance'])
+        elif residuals['variance'] > 0 and residuals['weekday_variance'] >= WEEKLY_SHARE * residuals['variance']:
+            noise_model, noise = 'Weekly', np.sqrt(residuals['weekday_variance'])
+        elif residuals['variance_end'] > 0 and residuals['variance_start'] < HETEROSCEDASTIC_RATIO * residuals['variance_end']:
+            noise_model = 'Heteroscedastic'
+
+        return {
+            'base_start': float(start), 'base_end': float(end), 'space': space, 'trend': 'Linear',
+            'noise': float(noise * scale), 'noise_model': noise_model, 'noise_coefficients': f'{coefficient:.3f}',
+        }
+
+
+class PhaseFit:
+    """Dates and readings per day of one phase."""
+
+    def __init__(self):
+        self.count = 0
+        self.first = None
+        self.last = None
+
+    def update(self, count, dates=None):
+        self.count += count
+        if dates is not None and len(dates):
+            self.first = dates.min() if self.first is None else min(self.first, dates.min())
+            self.last = dates.max() if self.last is None else max(self.last, dates.max())
+
+    def fit(self):
+        if self.first is None:
+            return {}
+        start_date = pd.Timestamp(self.first).date()
+        end_date = pd.Timestamp(self.last).date() + pd.Timedelta(days=1)
+        days = (end_date - start_date).days
+        return {'start_date': start_date, 'end_date': end_date,
+                'frequency_per_day': max(int(round(self.count / days)), 1)}
+
+
+def calibrate(source, chunk_rows=CHUNK_ROWS, compression='infer'):
+    # Fits the settings of every phase and feature in the reference, returns a config mapping
+    feature_fits, phase_fits = {}, {}
+    for chunk in pd.read_csv(source, chunksize=chunk_rows, compression=compression):
+        if 'Phase' not in chunk:
+            raise ValueError('The reference data needs a Phase column')
+        dates = pd.to_datetime(chunk['Date']).to_numpy(dtype='datetime64[s]') if 'Date' in chunk else None
+        features = [column for column in chunk.columns if column in FEATURE_NAMES]
+        for phase_name, rows in chunk.groupby('Phase', sort=False).indices.items():
+            if phase_name not in PHASE_NAMES:
+                raise ValueError(f'Unknown phase {phase_name}, phases are {", ".join(PHASE_NAMES)}')
+            phase_fit = phase_fits.setdefault(phase_name, PhaseFit())
+            if dates is not None:
+                times = dates[rows].astype('int64') / 86400
+                weekdays = (dates[rows].astype('datetime64[D]').astype('int64') + 3) % 7
+            else:
+                # Readings a day apart, counted across chunks
+                times = phase_fit.count + np.arange(len(rows), dtype='float64')
+                weekdays = None
+            phase_fit.update(len(rows), dates[rows] if dates is not None else None)
+            for feature_name in features:
+                values = chunk[feature_name].to_numpy(dtype='float64')[rows]
+                observed = ~np.isnan(values)
+                feature_fits.setdefault((phase_name, feature_name), FeatureFit()).update(
+                    times[observed], values[observed], weekdays[observed] if weekdays is not None else None)
+
+    config = {}
+    for phase_name, phase_fit in phase_fits.items():
+        for name, value in phase_fit.fit().items():
+            config[phase_name + '_' + name] = value
+    for (phase_name, feature_name), feature_fit in feature_fits.items():
+        if feature_fit.count:
+            for name, value in feature_fit.fit().items():
+                config[phase_name + '_' + feature_name + '_' + name] = value
+    return config
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fit phase and feature settings to a reference csv')
+    parser.add_argument('reference', help='Csv with a Phase column, feature columns and an optional Date column')
+    parser.add_argument('--output', default=None, help='Write the fitted settings as a json config, printed otherwise')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='Rows read per chunk')
+    args = parser.parse_args()
+
+    calibrated = json.dumps(serialize_config(calibrate(args.reference, chunk_rows=args.chunk_rows)), indent=2)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            output_file.write(calibrated)
+        print(f'Wrote calibrated settings to {args.output}')
+    else:
+        print(calibrated)
@@ -0,0 +1,272 @@
+"""Cohort simulation of phase progression.
+
+Every synthetic patient moves between Phase_1..Phase_5 following a transition
+matrix, staying in each visited phase for a dwell time drawn from a geometric
+(Markov) or gamma (semi-Markov) distribution. Each visit is rendered with that
+phase's feature settings, so a patient in Phase_3 for 40 days gets 40 days of
+the Phase_3 trajectory.
+
+Everything is vectorized across patients: visits and dwell times are drawn as
+(patients, visits) arrays and the readings of all visits are assembled by index
+arithmetic. Nearest and Linear trends are reproduced exactly, Cubic and Quadratic
+are rendered with linear interpolation of the control points (Quadratic keeps its
+extra per reading noise). Noise models other than White (see noise_models.py)
+are filtered over all visits of a phase at once.
+
+Usage: python cohort.py --patients 100000 --days 365 --output cohort.csv --config config.json
+"""
+import argparse
+import datetime
+import json
+
+import numpy as np
+import pandas as pd
+import scipy.special
+
+from counter_rng import (CONTROL_STREAM, DWELL_STREAM, NOISE_STREAM, ROW_STREAM, TRANSITION_STREAM, WEEKLY_STREAM,
+                         keyed_normal, keyed_uniform)
+from noise_models import get_model_noise
+from util import PHASE_NAMES, build_phases, default_config, parse_config
+
+# Mostly forward progression with some recovery, Phase_5 is nearly absorbing
+DEFAULT_TRANSITIONS = np.array([
+    [0.00, 0.85, 0.10, 0.05, 0.00],
+    [0.30, 0.00, 0.60, 0.10, 0.00],
+    [0.05, 0.25, 0.00, 0.60, 0.10],
+    [0.00, 0.05, 0.25, 0.00, 0.70],
+    [0.00, 0.00, 0.05, 0.95, 0.00],
+])
+DEFAULT_INITIAL = np.array([0.70, 0.20, 0.10, 0.00, 0.00])
+DEFAULT_DWELL_DAYS = np.array([120.0, 90.0, 60.0, 45.0, 365.0])
+SPACE_CODES = {'Linear': 0, 'Geometric': 1, 'Constant': 2}
+
+
+def get_control_lengths(total_points):
+    # Vectorized util.get_initial_space_len
+    return np.where(total_points // 10 < 10, total_points, total_points // 10)
+
+
+def draw_uniforms(patient_ids, first_visit, block, stream, seed, rng):
+    # Counter based uniforms keyed by (patient, visit) when seeded, so any patient can be simulated alone
+    if seed is None:
+        return rng.random((len(patient_ids), block))
+    visits = np.arange(first_visit, first_visit + block)
+    return keyed_uniform(seed, stream, visits[np.newaxis, :], patient=patient_ids[:, np.newaxis])[0]
+
+
+def get_dwell_days(states, uniforms, dwell_days, dwell_shape):
+    # Inverse cdf of the dwell time distributions
+    mean_days = dwell_days[states]
+    if dwell_shape is None:
+        # Markov chain with daily steps, geometric dwell times
+        with np.errstate(divide='ignore'):
+            days = np.log1p(-uniforms) / np.log1p(-1 / mean_days)
+    else:
+        days = scipy.special.gammaincinv(dwell_shape, uniforms) * mean_days / dwell_shape
+    return np.maximum(np.ceil(days), 1).astype('int64')
+
+
+def simulate_transitions(n_patients, days, transitions=DEFAULT_TRANSITIONS, initial=DEFAULT_INITIAL,
+                         dwell_days=DEFAULT_DWELL_DAYS, dwell_shape=None, rng=np.random, seed=None, patient_ids=None):
+    """Returns one row per visit: patient, visit number, phase index, first day and end day (exclusive)."""
+    patient_ids = np.arange(n_patients) if patient_ids is None else np.asarray(patient_ids)
+    n_patients = len(patient_ids)
+    transitions = np.asarray(transitions, dtype='float64')
+    cumulative = np.cumsum(transitions / transitions.sum(axis=1, keepdims=True), axis=1)
+    initial_cumulative = np.cumsum(initial)
+    dwell_days = np.asarray(dwell_days, dtype='float64')
+
+    # Enough visits for an average patient to reach the horizon, topped up below if needed
+    block = max(int(np.ceil(2 * days / dwell_days.min())), 2)
+    states = np.empty((n_patients, 0), dtype='int8')
+    ends = np.empty((n_patients, 0), dtype='int64')
+    current = None
+    reached = np.zeros(n_patients, dtype='int64')
+    while states.shape[1] == 0 or reached.min() < days:
+        first_visit = states.shape[1]
+        block_states = np.empty((n_patients, block), dtype='int8')
+        uniforms = draw_uniforms(patient_ids, first_visit, block, TRANSITION_STREAM, seed, rng)
+        for visit in range(block):
+            # The first visit draws from the initial distribution, later ones from the previous phase's row
+            bounds = initial_cumulative if current is None else cumulative[current]
+            current = np.minimum((uniforms[:, visit, np.newaxis] > bounds).sum(axis=1), len(cumulative) - 1)
+            block_states[:, visit] = current
+        dwell_uniforms = draw_uniforms(patient_ids, first_visit, block, DWELL_STREAM, seed, rng)
+        block_ends = reached[:, np.newaxis] + np.cumsum(get_dwell_days(block_states, dwell_uniforms, dwell_days, dwell_shape), axis=1)
+        states = np.concatenate((states, block_states), axis=1)
+        ends = np.concatenate((ends, block_ends), axis=1)
+        reached = ends[:, -1]
+
+    starts = np.concatenate((np.zeros((n_patients, 1), dtype='int64'), ends[:, :-1]), axis=1)
+    keep = starts < days
+    patients = np.broadcast_to(patient_ids[:, np.newaxis], states.shape)
+    visit_numbers = np.broadcast_to(np.arange(states.shape[1]), states.shape)
+    return pd.DataFrame({
+        'patient': patients[keep],
+        'visit': visit_numbers[keep],
+        'phase': states[keep],
+        'start_day': starts[keep],
+        'end_day': np.minimum(ends[keep], days),
+    })
+
+
+def get_phase_settings(config, phases, include_features):
+    # One array per setting indexed by phase, so visits pick their settings by index
+    settings = {'frequency': np.array([config[phase.name + '_frequency_per_day'] for phase in phases])}
+    for feature_name in include_features:
+        prefixes = [phase.name + '_' + feature_name for phase in phases]
+        settings[feature_name] = {
+            'index': list(phases[0].feature_dic).index(feature_name),
+            'start': np.array([config[prefix + '_base_start'] for prefix in prefixes], dtype='float64'),
+            'end': np.array([config[prefix + '_base_end'] for prefix in prefixes], dtype='float64'),
+            'space': np.array([SPACE_CODES.get(config[prefix + '_space'], 2) for prefix in prefixes]),
+            'nearest': np.array([config[prefix + '_trend'] == 'Nearest' for prefix in prefixes]),
+            'quadratic': np.array([config[prefix + '_trend'] == 'Quadratic' for prefix in prefixes]),
+            'noise': np.array([config[prefix + '_noise'] for prefix in prefixes], dtype='float64'),
+            'noise_model': np.array([config.get(prefix + '_noise_model', 'White') for prefix in prefixes]),
+            'coefficients': [config.get(prefix + '_noise_coefficients') for prefix in prefixes],
+        }
+    return settings
+
+
+def get_space_values(start, end, space, fraction):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        geometric = start * np.power(end / start, fraction)
+    return np.select([space == 0, space == 1], [start + (end - start) * fraction, geometric], start)
+
+
+def draw_normals(index, feature, visit, patient, stream, seed, rng):
+    if seed is None:
+        return rng.normal(0, 1, len(index))
+    return keyed_normal(seed, stream, index, feature, visit, patient)
+
+
+def render_visits(visits, settings, include_features, start_date=None, rng=np.random, seed=None, spread_readings=False):
+    # With a seed the noise of each visit is keyed by (patient, visit, feature) and independent of the chunking
+    # Noise models restart at every visit, weekdays count from start_date (or day 0) of the simulation
+    phase = visits['phase'].to_numpy()
+    patient = visits['patient'].to_numpy()
+    visit = visits['visit'].to_numpy()
+    frequency = settings['frequency'][phase]
+    points = (visits['end_day'].to_numpy() - visits['start_day'].to_numpy()) * frequency
+    controls = get_control_lengths(points)
+
+    # Row and control point positions within their visit
+    row_visit = np.repeat(np.arange(len(visits)), points)
+    row_offset = np.arange(points.sum()) - np.repeat(np.cumsum(points) - points, points)
+    control_visit = np.repeat(np.arange(len(visits)), controls)
+    control_first = np.cumsum(controls) - controls
+    control_offset = np.arange(controls.sum()) - np.repeat(control_first, controls)
+    control_fraction = control_offset / np.maximum(controls[control_visit] - 1, 1)
+    position = row_offset / np.maximum(points[row_visit] - 1, 1) * np.maximum(controls[row_visit] - 1, 0)
+    lower = np.floor(position).astype('int64')
+    upper = np.minimum(lower + 1, controls[row_visit] - 1)
+    weight = position - lower
+    lower += control_first[row_visit]
+    upper += control_first[row_visit]
+
+    result = {
+        'Patient': patient[row_visit],
+        'Phase': pd.Categorical.from_codes(phase[row_visit], PHASE_NAMES),
+    }
+    if start_date is not None and spread_readings:
+        # Readings of a day spread evenly over it, second resolution
+        seconds = visits['start_day'].to_numpy()[row_visit] * 86400 + row_offset * 86400 // frequency[row_visit]
+        result['Date'] = np.datetime64(start_date, 's') + seconds.astype('timedelta64[s]')
+    elif start_date is not None:
+        day = visits['start_day'].to_numpy()[row_visit] + row_offset // frequency[row_visit]
+        result['Date'] = np.datetime64(start_date, 'D') + day.astype('timedelta64[D]')
+    row_phase = phase[row_visit]
+    control_phase = phase[control_visit]
+    row_days = row_offset / frequency[row_visit]
+    row_weekday = (start_date.weekday() if start_date is not None else 0) + \
+        visits['start_day'].to_numpy()[row_visit] + np.floor(row_days).astype('int64')
+    for feature_name in include_features:
+        feature = settings[feature_name]
+        control_values = get_space_values(feature['start'][control_phase], feature['end'][control_phase],
+                                          feature['space'][control_phase], control_fraction)
+        white_noise = feature['noise'] * (feature['noise_model'] == 'White')
+        if white_noise.any():
+            control_values += draw_normals(control_offset, feature['index'], visit[control_visit], patient[control_visit],
+                                           CONTROL_STREAM, seed, rng) * white_noise[control_phase]
+        values = np.where(feature['nearest'][row_phase],
+                          control_values[np.where(weight < 0.5, lower, upper)],
+                          control_values[lower] * (1 - weight) + control_values[upper] * weight)
+        if feature['quadratic'].any():
+            quadratic_noise = np.abs(feature['start'] - feature['end']) / 2 * feature['quadratic']
+            values += draw_normals(row_offset, feature['index'], visit[row_visit], patient[row_visit],
+                                   ROW_STREAM, seed, rng) * quadratic_noise[row_phase]
+        for phase_index in np.flatnonzero((feature['noise'] > 0) & (feature['noise_model'] != 'White')):
+            # All visits of a phase share its model, the series restart at every visit
+            rows = np.flatnonzero(row_phase == phase_index)
+            if len(rows) == 0:
+                continue
+            model = feature['noise_model'][phase_index]
+            segment = row_visit[rows]
+            normals = draw_normals(row_offset[rows], feature['index'], visit[segment], patient[segment],
+                                   NOISE_STREAM, seed, rng)
+            profile = None
+            if model == 'Weekly':
+                profile = draw_normals(np.tile(np.arange(7), len(visits)), feature['index'], np.repeat(visit, 7),
+                                       np.repeat(patient, 7), WEEKLY_STREAM, seed, rng).reshape(-1, 7)
+            values[rows] += feature['noise'][phase_index] * get_model_noise(
+                model, normals, row_days[rows], row_offset[rows] / points[segment], segment,
+                coefficients=feature['coefficients'][phase_index], profile=profile, weekday=row_weekday[rows] % 7)
+        result[feature_name] = values
+    return pd.DataFrame(result)
+
+
+def iter_cohort(visits, config, include_features, start_date=None, chunk_patients=5000, rng=np.random, seed=None):
+    settings = get_phase_settings(config, build_phases(), include_features)
+    patients = visits['patient'].to_numpy()
+    bounds = np.searchsorted(patients, np.append(np.arange(0, patients.max() + 1, chunk_patients), patients.max() + 1))
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if last > first:
+            yield render_visits(visits.iloc[first:last], settings, include_features, start_date=start_date, rng=rng, seed=seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate phase progression for a cohort of patients')
+    parser.add_argument('--patients', type=int, default=1000, help='Number of patients')
+    parser.add_argument('--days', type=int, default=365, help='Length of the simulation in days')
+    parser.add_argument('--start-date', default=None, help='First date of the simulation, no dates are written without it')
+    parser.add_argument('--config', default=None, help='Json file of phase and feature settings, widget defaults otherwise')
+    parser.add_argument('--features', nargs='*', default=None, help='Features to include, all by default')
+    parser.add_argument('--transitions', default=None,
+                        help='Json file with "matrix", "initial" and "dwell_days" overriding the defaults')
+    parser.add_argument('--dwell-shape', type=float, default=None,
+                        help='Gamma shape of the semi-Markov dwell times, geometric dwell times without it')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='Seed of the counter based random numbers, any patient can be regenerated alone with it')
+    parser.add_argument('--manifest', default=None, help='Write a manifest to rebuild the output or slices of it, needs --seed')
+    parser.add_argument('--chunk-patients', type=int, default=5000, help='Patients rendered per chunk')
+    parser.add_argument('--output', default='cohort.csv', help='Output csv path')
+    args = parser.parse_args()
+
+    phases = build_phases()
+    config = default_config(phases)
+    if args.config:
+        with open(args.config) as config_file:
+            config.update(parse_config(json.load(config_file)))
+    model = {}
+    if args.transitions:
+        with open(args.transitions) as transitions_file:
+            model = json.load(transitions_file)
+    model = dict(matrix=np.asarray(model.get('matrix', DEFAULT_TRANSITIONS)).tolist(),
+                 initial=np.asarray(model.get('initial', DEFAULT_INITIAL)).tolist(),
+                 dwell_days=np.asarray(model.get('dwell_days', DEFAULT_DWELL_DAYS)).tolist(),
+                 dwell_shape=args.dwell_shape)
+    visits = simulate_transitions(args.patients, args.days, transitions=model['matrix'], initial=model['initial'],
+                                  dwell_days=model['dwell_days'], dwell_shape=args.dwell_shape, seed=args.seed)
+    start_date = datetime.date.fromisoformat(args.start_date) if args.start_date else None
+    features = args.features or list(phases[0].feature_dic)
+    for index, chunk in enumerate(iter_cohort(visits, config, features, start_date=start_date,
+                                              chunk_patients=args.chunk_patients, seed=args.seed)):
+        chunk.to_csv(args.output, index=False, mode='w' if index == 0 else 'a', header=index == 0)
+    print(f'Simulated {args.patients} patients with {len(visits)} phase visits into {args.output}')
+
+    if args.manifest:
+        from manifest import build_manifest, write_manifest
+        cohort = dict(model, patients=args.patients, days=args.days, start_date=args.start_date)
+        write_manifest(args.manifest, build_manifest(config, features, PHASE_NAMES, args.start_date is not None,
+                                                     args.seed, cohort=cohort))
@@ -0,0 +1,89 @@
+"""Counter based random numbers for reproducible, random access generation.
+
+Philox4x32-10 (Salmon et al., Random123) evaluated on numpy arrays. The value at
+index i of a stream only depends on the seed, the stream and the (patient, phase,
+feature, i) counter, so any range of rows can be generated on its own and matches
+the full run exactly, and whole cohorts are drawn in one vectorized call.
+"""
+import numpy as np
+
+MASK = np.uint64(0xFFFFFFFF)
+SHIFT = np.uint64(32)
+PHILOX_M = (np.uint64(0xD2511F53), np.uint64(0xCD9E8D57))
+PHILOX_W = (np.uint64(0x9E3779B9), np.uint64(0xBB67AE85))
+PHILOX_ROUNDS = 10
+
+# Streams drawn for every (patient, phase, feature)
+CONTROL_STREAM = 0
+ROW_STREAM = 1
+SAMPLING_STREAM = 2
+TRANSITION_STREAM = 3
+DWELL_STREAM = 4
+NOISE_STREAM = 5
+WEEKLY_STREAM = 6
+# Wear, reading count and reading times of every day of an extended phase
+DAY_SAMPLING_STREAM = 7
+
+
+def philox4x32(counter, key):
+    c0, c1, c2, c3 = (np.asarray(word, dtype=np.uint64) & MASK for word in counter)
+    k0, k1 = (np.asarray(word, dtype=np.uint64) & MASK for word in key)
+    for _ in range(PHILOX_ROUNDS):
+        product0 = c0 * PHILOX_M[0]
+        product1 = c2 * PHILOX_M[1]
+        c0, c1, c2, c3 = ((product1 >> SHIFT) ^ c1 ^ k0, product1 & MASK,
+                          (product0 >> SHIFT) ^ c3 ^ k1, product0 & MASK)
+        k0 = (k0 + PHILOX_W[0]) & MASK
+        k1 = (k1 + PHILOX_W[1]) & MASK
+    return c0, c1, c2, c3
+
+
+def get_key(seed, stream):
+    seed = int(seed)
+    return (seed ^ (seed >> 32)) & 0xFFFFFFFF, stream
+
+
+def keyed_uniform(seed, stream, index, feature=0, phase=0, patient=0):
+    # Two uniforms in (0, 1) with 53 bits each per counter
+    words = philox4x32((index, feature, phase, patient), get_key(seed, stream))
+    uniforms = []
+    for high, low in ((words[0], words[1]), (words[2], words[3])):
+        mantissa = (high << np.uint64(21)) | (low >> np.uint64(11))
+        uniforms.append((mantissa.astype('float64') + 0.5) / 2.0 ** 53)
+    return uniforms
+
+
+def keyed_normal(seed, stream, index, feature=0, phase=0, patient=0):
+    # Box-Muller, one standard normal per counter
+    first, second = keyed_uniform(seed, stream, index, feature, phase, patient)
+    return np.sqrt(-2 * np.log(first)) * np.cos(2 * np.pi * second)
+
+
+def get_sampling_rng(seed, phase=0, patient=0):
+    # Sample times are drawn sequentially from a Philox generator keyed by the phase
+    return np.random.Generator(np.random.Philox(np.random.SeedSequence([int(seed), SAMPLING_STREAM, phase, patient])))
+
+
+class FeatureStream:
+    """Noise of one patient, phase and feature, addressable by index."""
+
+    def __init__(self, seed, feature=0, phase=0, patient=0):
+        self.seed = seed
+        self.feature = feature
+        self.phase = phase
+        self.patient = patient
+
+    def normal(self, stream, first, last):
+        return keyed_normal(self.seed, stream, np.arange(first, last), self.feature, self.phase, self.patient)
+
+
+def stream_normals(streams, stream, first, last):
+    # One row per FeatureStream, the streams sharing their seed, phase and patient are drawn in a single call
+    groups = {}
+    for row, feature_stream in enumerate(streams):
+        groups.setdefault((feature_stream.seed, feature_stream.phase, feature_stream.patient), []).append(row)
+    normals = np.empty((len(streams), last - first))
+    for (seed, phase, patient), rows in groups.items():
+        features = np.array([streams[row].feature for row in rows])[:, np.newaxis]
+        normals[rows] = keyed_normal(seed, stream, np.arange(first, last), features, phase, patient)
+    return normals
@@ -0,0 +1,159 @@
+"""Pre-flight estimate of the cost of generating a dataset.
+
+Rows come from the phase settings (get_total_data_points and the wear probability
+of irregular phases), the other numbers from per value costs measured by
+``python estimate.py`` (see benchmark below). Above the thresholds the app
+switches from in-memory generation to chunked generation on disk, and to a
+background job when it would take too long. Thresholds are set with the
+GENERATOR_MAX_MEMORY_MB, GENERATOR_MAX_SECONDS and GENERATOR_CHUNK_ROWS
+environment variables, and how long exported files no session shows are kept
+with GENERATOR_EXPORT_TTL_SECONDS.
+"""
+import collections
+import datetime
+import os
+import tempfile
+import time
+
+from schema import CompactSchema
+from util import build_phases, default_config, generate_dataset, get_total_data_points, write_dataset
+
+# Measured with benchmark(), rerun it to calibrate for other hardware
+CALIBRATION = {
+    'generate_seconds_per_value': 4.5e-8,
+    'csv_seconds_per_value': 1.5e-6,
+    'csv_bytes_per_value': 18.8,
+    'csv_bytes_per_date': 11.0,
+    'gzip_ratio': 0.06,
+    'compact_csv_bytes_per_value': 7.2,
+    'compact_csv_bytes_per_date': 8.0,
+}
+# The compact schema adds the phase label to every row, e.g. Phase_1 and a separator
+COMPACT_BYTES_PER_ROW = 8
+# The in-memory download holds the csv string, its bytes and both base64 forms
+CSV_COPIES = 1 + 1 + 4 / 3 + 4 / 3
+# A chunk holds the values, trend and model noise of every feature and the frame built from them
+CHUNK_ARRAYS = 4
+# Sample times, worn days and their random draws of an irregular phase
+SAMPLE_TIME_ARRAYS = 3
+
+MAX_MEMORY_BYTES = float(os.environ.get('GENERATOR_MAX_MEMORY_MB', 256)) * 2 ** 20
+MAX_SECONDS = float(os.environ.get('GENERATOR_MAX_SECONDS', 20))
+CHUNK_ROWS = int(os.environ.get('GENERATOR_CHUNK_ROWS', 500000))
+# Exported files are deleted once no session holds them, or this long after they were written
+EXPORT_TTL_SECONDS = float(os.environ.get('GENERATOR_EXPORT_TTL_SECONDS', 3600))
+
+MEMORY_MODE = 'memory'
+CHUNKED_MODE = 'chunked'
+BACKGROUND_MODE = 'background'
+
+Estimate = collections.namedtuple('Estimate', ['rows', 'memory_bytes', 'file_bytes', 'seconds', 'mode'])
+
+
+def estimate_phase_rows(config, include_phases, phases):
+    # Rows and sampling of every included phase
+    result = []
+    for phase in phases:
+        if phase.name not in include_phases:
+            continue
+        phase_rows = get_total_data_points(config[phase.name + '_start_date'], config[phase.name + '_end_date'],
+                                           config[phase.name + '_frequency_per_day'])
+        sampling = config.get(phase.name + '_sampling', 'Regular')
+        if sampling != 'Regular':
+            phase_rows *= config.get(phase.name + '_wear_probability', 1.0)
+        result.append((max(int(phase_rows), 0), sampling))
+    return result
+
+
+def estimate_rows(config, include_phases, phases):
+    return sum(count for count, _ in estimate_phase_rows(config, include_phases, phases))
+
+
+def choose_mode(memory_bytes, seconds):
+    if seconds > MAX_SECONDS:
+        return BACKGROUND_MODE
+    if memory_bytes > MAX_MEMORY_BYTES:
+        return CHUNKED_MODE
+    return MEMORY_MODE
+
+
+def estimate_cost(config, include_features, include_phases, phases, include_dates=False, compact=False,
+                  calibration=CALIBRATION):
+    phase_rows = estimate_phase_rows(config, include_phases, phases)
+    rows = sum(count for count, _ in phase_rows)
+    values = rows * len(include_features)
+    if compact:
+        file_bytes = values * calibration['compact_csv_bytes_per_value'] + rows * COMPACT_BYTES_PER_ROW + \
+            include_dates * rows * calibration['compact_csv_bytes_per_date']
+        # float32 or int16 values, int32 offsets and one byte phase codes
+        array_bytes = 2 * (4 * values + 4 * include_dates * rows + rows)
+    else:
+        file_bytes = values * calibration['csv_bytes_per_value'] + include_dates * rows * calibration['csv_bytes_per_date']
+        # The phase arrays are concatenated into the frame, so they are held twice
+        array_bytes = 2 * 8 * (values + include_dates * rows)
+    memory_bytes = array_bytes + CSV_COPIES * file_bytes
+    seconds = values * (calibration['generate_seconds_per_value'] + calibration['csv_seconds_per_value']) + \
+        include_dates * rows * calibration['csv_seconds_per_value']
+    mode = choose_mode(memory_bytes, seconds)
+    if mode != MEMORY_MODE:
+        # One chunk of arrays and its csv text is in memory, irregular phases also hold the sample times of the
+        # whole phase, and the file is gzipped on disk
+        chunk_rows = min(CHUNK_ROWS, max((count for count, _ in phase_rows), default=0))
+        sample_rows = max((count for count, sampling in phase_rows if sampling != 'Regular'), default=0)
+        memory_bytes = chunk_rows * (CHUNK_ARRAYS * 8 * (len(include_features) + include_dates) +
+                                     file_bytes / max(rows, 1)) + SAMPLE_TIME_ARRAYS * 8 * sample_rows
+        file_bytes = file_bytes * calibration['gzip_ratio']
+    return Estimate(rows, int(memory_bytes), int(file_bytes), seconds, mode)
+
+
+def format_bytes(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TB'
+
+
+def benchmark(days=365, frequency=100):
+    # Times generation and csv export of one phase with every feature to calibrate the estimate
+    phases = build_phases()
+    config = default_config(phases)
+    config['Phase_1_end_date'] = config['Phase_1_start_date'] + datetime.timedelta(days=days)
+    config['Phase_1_frequency_per_day'] = frequency
+    for feature_name, feature in phases[0].feature_dic.items():
+        # Noisy values, as incompressible as typical user settings
+        config['Phase_1_' + feature_name + '_noise'] = feature.spec.noise_max / 2
+    features = set(phases[0].feature_dic)
+    rows = get_total_data_points(config['Phase_1_start_date'], config['Phase_1_end_date'], frequency)
+    values = rows * len(features)
+
+    started = time.perf_counter()
+    generate_dataset(config, features, {'Phase_1'}, phases, seed=0)
+    generate_seconds = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.csv')
+        started = time.perf_counter()
+        write_dataset(path, config, features, {'Phase_1'}, phases, include_dates=True, seed=0)
+        write_seconds = time.perf_counter() - started
+        write_dataset(path + '.gz', config, features, {'Phase_1'}, phases, include_dates=True, seed=0)
+        csv_bytes, gzip_bytes = os.path.getsize(path), os.path.getsize(path + '.gz')
+        write_dataset(path, config, features, {'Phase_1'}, phases, seed=0,
+                      schema=CompactSchema(config, features, {'Phase_1'}))
+        compact_bytes = os.path.getsize(path)
+
+    # Dates are written as yyyy-mm-dd and a separator
+    date_bytes = CALIBRATION['csv_bytes_per_date']
+    return {
+        'generate_seconds_per_value': generate_seconds / values,
+        'csv_seconds_per_value': max(write_seconds - generate_seconds, 0) / (values + rows),
+        'csv_bytes_per_value': (csv_bytes - rows * date_bytes) / values,
+        'csv_bytes_per_date': date_bytes,
+        'gzip_ratio': gzip_bytes / csv_bytes,
+        'compact_csv_bytes_per_value': (compact_bytes - rows * COMPACT_BYTES_PER_ROW) / values,
+        'compact_csv_bytes_per_date': CALIBRATION['compact_csv_bytes_per_date'],
+    }
+
+
+if __name__ == '__main__':
+    for name, value in benchmark().items():
+        print(f'{name}: {value:.3g}')
@@ -0,0 +1,50 @@
+"""Catalog of the generated features.
+
+Every feature is described by a spec: its name and units, the default start and
+end values of the trend, the bounds, step and default of the noise slider, and
+the valid range of its base values. The UI, the generator, the default configs
+and the compact schema are all driven by FEATURE_CATALOG, so adding a feature is
+adding a spec here.
+
+The position of a spec in the catalog is the feature index of its counter based
+noise (see counter_rng.FeatureStream), so new specs are appended at the end to
+keep seeded datasets of the existing features unchanged.
+"""
+from collections import namedtuple
+
+FeatureSpec = namedtuple('FeatureSpec', ['name', 'units', 'description', 'start_default', 'end_default',
+                                         'noise_min', 'noise_max', 'noise_step', 'noise_default',
+                                         'valid_min', 'valid_max', 'fixed_point_scale'],
+                         defaults=(0.0, 3.0, 0.05, 0.0, 0.0, None, None))
+
+FEATURE_CATALOG = (
+    FeatureSpec('Gait_Speed', 'm/s', 'Walking speed over a level distance of more than 2 meters', 0.6, 0.8,
+                noise_max=1.0),
+    FeatureSpec('Step_Length', 'cm', 'Distance between the initial contacts of the two feet', 36.4, 114.6,
+                noise_max=5.0),
+    FeatureSpec('Step_Width', 'cm', 'Distance between the heels of the two feet during double stance', 1.6, 14.6),
+    FeatureSpec('Tug_Score', 's', 'Time of the timed up and go test', 8.0, 13.5),
+    FeatureSpec('Cadence', 'steps/min', 'Walking rate', 0.0, 1.0, noise_max=1.0),
+    FeatureSpec('Knee_Flexion', 'deg', 'Angle between the femoral and tibial median axes', 20.0, 35.0,
+                valid_max=180.0, fixed_point_scale=100),
+    FeatureSpec('Sitting_Adl', 'min', 'Minutes a day of activities of daily living done sitting', 2.0, 10.0,
+                noise_max=5.0, valid_max=1440.0, fixed_point_scale=10),
+    FeatureSpec('Lying_Adl', 'min', 'Minutes a day of activities of daily living done lying', 0.0, 1.0,
+                valid_max=1440.0, fixed_point_scale=10),
+    FeatureSpec('Active_Hours', 'h', 'Hours a day of standing chores', 0.25, 1.0, valid_max=24.0,
+                fixed_point_scale=100),
+    FeatureSpec('Stride_Time_Variability', '%', 'Coefficient of variation of the stride time', 2.0, 6.0,
+                valid_max=100.0, fixed_point_scale=100),
+    FeatureSpec('Double_Support', '%', 'Share of the gait cycle with both feet on the ground', 20.0, 35.0,
+                noise_max=5.0, valid_max=100.0, fixed_point_scale=100),
+    FeatureSpec('Sit_To_Stand_Count', 'count/day', 'Sit to stand transitions a day', 45.0, 30.0,
+                noise_max=10.0, fixed_point_scale=10),
+    FeatureSpec('Turning_Speed', 'deg/s', 'Peak angular velocity of turns while walking', 120.0, 80.0,
+                noise_max=20.0, valid_max=720.0, fixed_point_scale=10),
+)
+
+FEATURE_SPECS = {spec.name: spec for spec in FEATURE_CATALOG}
+
+
+def get_feature_label(spec):
+    return f"{spec.name.replace('_', ' ')} ({spec.units})"
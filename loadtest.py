@@ -0,0 +1,347 @@
+"""Concurrent session load test of the Streamlit app.
+
+Starts `streamlit run app.py` (or attaches to a running server) and drives many
+simulated browser sessions over the app's websocket the way the frontend does:
+every step sends the widget values with a rerun request and waits until the
+script run finished. A session selects phases and features, sets the readings
+per day of every phase, applies every feature form, opens the first charts and
+generates the dataset, waiting for background exports to finish.
+
+For every number of concurrent sessions the rerun latency percentiles per step,
+the generation latency and the RSS and CPU of the server process (read from
+/proc, Linux only) are reported, to size replicas and to compare builds.
+
+Usage:
+    python loadtest.py --sessions 1 5 10 20
+    python loadtest.py --url ws://localhost:8501/stream --pid 1234 --sessions 50 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import tornado.websocket
+from streamlit.proto.Alert_pb2 import Alert
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ClientState_pb2 import ClientState
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState, WidgetStates
+
+from util import FEATURE_NAMES, PHASE_NAMES
+
+# Labels of the widgets created without a key, their ids are hashes of the element
+PHASES_LABEL = '🎯 Phases to include:'
+FEATURES_LABEL = 'Features to include:'
+PHASE_RADIO_LABEL = 'Select phase to configure:'
+GENERATE_LABEL = '🚀 Generate Download Link'
+PROGRESS_LABEL = '🔄 Check progress'
+WIDGET_TYPES = {'button', 'checkbox', 'date_input', 'multiselect', 'number_input', 'radio', 'selectbox', 'slider',
+                'text_input'}
+# Same limit as the server's default server.maxMessageSize
+MAX_MESSAGE_BYTES = 200 * 1024 * 1024
+SAMPLE_SECONDS = 0.25
+PERCENTILES = [50, 90, 99]
+
+
+class Session:
+    """One simulated browser tab connected to the app."""
+
+    def __init__(self, url):
+        self.url = url
+        self.connection = None
+        # Widgets of the last script run by label and by id
+        self.labels = {}
+        self.widgets = {}
+        # Values of the widgets the user changed, sent with every rerun like the frontend does
+        self.states = {}
+        self.errors = 0
+        self.succeeded = False
+
+    async def connect(self):
+        self.connection = await tornado.websocket.websocket_connect(self.url, max_message_size=MAX_MESSAGE_BYTES)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+    def find(self, label):
+        if label not in self.labels:
+            raise LookupError(f'Widget {label!r} was not rendered')
+        return self.labels[label][0]
+
+    async def send(self, message):
+        await self.connection.write_message(message.SerializeToString(), binary=True)
+
+    async def rerun(self, *states, trigger=None):
+        # Seconds from the rerun request to the end of the script run
+        for state in states:
+            self.states[state.id] = state
+        widget_states = WidgetStates(widgets=list(self.states.values()))
+        if trigger is not None:
+            widget_states.widgets.append(WidgetState(id=trigger, trigger_value=True))
+        started = time.perf_counter()
+        await self.send(BackMsg(rerun_script=ClientState(query_string='', widget_states=widget_states)))
+
+        labels, widgets, running, succeeded = {}, {}, False, False
+        while True:
+            payload = await self.connection.read_message()
+            if payload is None:
+                raise ConnectionError('The server closed the connection')
+            message = ForwardMsg()
+            message.ParseFromString(payload)
+            kind = message.WhichOneof('type')
+            if kind == 'new_report':
+                # Messages of an earlier run still in flight are skipped
+                running = True
+            elif not running:
+                continue
+            elif kind == 'delta' and message.delta.WhichOneof('type') == 'new_element':
+                element = message.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type == 'exception' or (element_type == 'alert' and element.alert.format == Alert.ERROR):
+                    self.errors += 1
+                elif element_type == 'alert' and element.alert.format == Alert.SUCCESS:
+                    succeeded = True
+                elif element_type in WIDGET_TYPES:
+                    widget = getattr(element, element_type)
+                    labels.setdefault(widget.label, []).append(widget)
+                    widgets[widget.id] = widget
+            elif kind == 'report_finished':
+                break
+        self.labels, self.widgets, self.succeeded = labels, widgets, succeeded
+        return time.perf_counter() - started
+
+
+class ProcessSampler:
+    """RSS and CPU time of the server process, sampled from /proc in the background."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        self.task = None
+
+    def read(self):
+        with open(f'/proc/{self.pid}/stat') as stat_file:
+            # utime and stime are the 14th and 15th fields, counted after the parenthesised command name
+            fields = stat_file.read().rsplit(')', 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        rss = 0
+        with open(f'/proc/{self.pid}/status') as status_file:
+            for line in status_file:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+        return time.perf_counter(), rss, cpu_seconds
+
+    async def sample(self):
+        while True:
+            self.samples.append(self.read())
+            await asyncio.sleep(SAMPLE_SECONDS)
+
+    def start(self):
+        self.samples = []
+        if self.pid is not None and os.path.exists(f'/proc/{self.pid}'):
+            self.task = asyncio.ensure_future(self.sample())
+
+    def stop(self):
+        if self.task is None:
+            return {}
+        self.task.cancel()
+        self.task = None
+        self.samples.append(self.read())
+        times, rss, cpu_seconds = (np.array(values) for values in zip(*self.samples))
+        cpu_percent = 100 * np.diff(cpu_seconds) / np.maximum(np.diff(times), 1e-9)
+        return {
+            'rss_start_mb': rss[0] / 2 ** 20,
+            'rss_peak_mb': rss.max() / 2 ** 20,
+            'cpu_mean_percent': 100 * (cpu_seconds[-1] - cpu_seconds[0]) / max(times[-1] - times[0], 1e-9),
+            'cpu_peak_percent': cpu_percent.max() if len(cpu_percent) else 0.0,
+        }
+
+
+async def think(rng, think_time):
+    await asyncio.sleep(think_time * rng.uniform(0.5, 1.5))
+
+
+async def run_session(index, url, args, timings):
+    # One user going through the app, every step appends (step, seconds)
+    rng = random.Random(index)
+    await asyncio.sleep(args.ramp_seconds * index / max(args.sessions_in_stage, 1))
+    session = Session(url)
+    await session.connect()
+    try:
+        timings.append(('Open', await session.rerun()))
+        await think(rng, args.think_time)
+
+        phases_widget, features_widget = session.find(PHASES_LABEL), session.find(FEATURES_LABEL)
+        phases = [phase_name for phase_name in PHASE_NAMES if phase_name in args.phases]
+        features = [feature_name for feature_name in FEATURE_NAMES if feature_name in args.features]
+        timings.append(('Select', await session.rerun(
+            WidgetState(id=phases_widget.id, int_array_value={'data': [list(phases_widget.options).index(name)
+                                                                      for name in phases]}),
+            WidgetState(id=features_widget.id, int_array_value={'data': [list(features_widget.options).index(name)
+                                                                        for name in features]}))))
+        await think(rng, args.think_time)
+
+        for phase_index, phase_name in enumerate(phases):
+            if phase_index > 0:
+                radio = session.find(PHASE_RADIO_LABEL)
+                timings.append(('Switch phase', await session.rerun(WidgetState(id=radio.id, int_value=phase_index))))
+                await think(rng, args.think_time)
+            timings.append(('Configure phase', await session.rerun(
+                WidgetState(id=phase_name + '_frequency_per_day', int_value=args.frequency))))
+            await think(rng, args.think_time)
+
+            for feature_index, feature_name in enumerate(features):
+                prefix = phase_name + '_' + feature_name
+                slider = session.widgets[prefix + '_noise']
+                noise = slider.min + round(rng.uniform(0, 0.2) * (slider.max - slider.min) / slider.step) * slider.step
+                submit = next(button for button in session.labels['✅ Apply'] if button.form_id == prefix + '_form')
+                timings.append(('Apply', await session.rerun(WidgetState(id=prefix + '_noise',
+                                                                         double_array_value={'data': [noise]}),
+                                                             trigger=submit.id)))
+                await think(rng, args.think_time)
+                if feature_index < args.visualise:
+                    timings.append(('Visualise', await session.rerun(WidgetState(id=prefix + '_visualise',
+                                                                                 bool_value=True))))
+                    await think(rng, args.think_time)
+
+        started = time.perf_counter()
+        elapsed = await session.rerun(trigger=session.find(GENERATE_LABEL).id)
+        timings.append(('Generate click', elapsed))
+        while PROGRESS_LABEL in session.labels:
+            # Background exports are polled like a user clicking the progress button
+            await asyncio.sleep(args.poll_seconds)
+            timings.append(('Check progress', await session.rerun(trigger=session.find(PROGRESS_LABEL).id)))
+        if not session.succeeded:
+            raise RuntimeError('The dataset was not generated')
+        timings.append(('Generate', time.perf_counter() - started))
+        return session.errors
+    finally:
+        session.close()
+
+
+async def clear_cache(url):
+    session = Session(url)
+    await session.connect()
+    await session.send(BackMsg(clear_cache=True))
+    # The request is handled in order, a rerun after it makes sure it was
+    await session.rerun()
+    session.close()
+
+
+async def run_stage(sessions, url, args, sampler):
+    if args.clear_cache:
+        await clear_cache(url)
+    args.sessions_in_stage = sessions
+    timings = []
+    sampler.start()
+    started = time.perf_counter()
+    results = await asyncio.gather(*[run_session(index, url, args, timings) for index in range(sessions)],
+                                   return_exceptions=True)
+    wall_seconds = time.perf_counter() - started
+    usage = sampler.stop()
+
+    failures = [result for result in results if isinstance(result, BaseException)]
+    for failure in failures[:3]:
+        print(f'Session failed: {failure!r}', file=sys.stderr)
+    summary = {
+        'sessions': sessions,
+        'failed_sessions': len(failures),
+        'error_elements': sum(result for result in results if not isinstance(result, BaseException)),
+        'wall_seconds': wall_seconds,
+        'reruns_per_second': sum(step != 'Generate' for step, _ in timings) / wall_seconds,
+        **usage,
+    }
+    steps = pd.DataFrame(timings, columns=['step', 'seconds'])
+    step_summary = steps.groupby('step', sort=False)['seconds'].describe(percentiles=[p / 100 for p in PERCENTILES])
+    step_summary = (1000 * step_summary.drop(columns=['count', 'mean', 'std', 'min'])).add_suffix('_ms')
+    step_summary.insert(0, 'count', steps.groupby('step', sort=False).size())
+    return summary, step_summary
+
+
+def start_server(app_path, port):
+    # Headless server of the app, the repository's .streamlit/config.toml applies
+    command = [sys.executable, '-m', 'streamlit', 'run', os.path.basename(app_path), '--server.headless', 'true',
+               '--server.port', str(port), '--browser.gatherUsageStats', 'false', '--server.fileWatcherType', 'none']
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(app_path)), stdout=subprocess.DEVNULL,
+                            stderr=subprocess.DEVNULL)
+
+
+def wait_for_server(health_url, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(health_url, timeout=1) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'No server at {health_url} after {timeout}s')
+        time.sleep(0.2)
+
+
+async def main(args):
+    server = None
+    url, pid = args.url, args.pid
+    if url is None:
+        server = start_server(args.app, args.port)
+        url, pid = f'ws://localhost:{args.port}/stream', server.pid
+    try:
+        wait_for_server(url.replace('ws://', 'http://').replace('wss://', 'https://').rsplit('/stream', 1)[0] + '/healthz',
+                        args.startup_timeout)
+        # The server runs the script for the first browser before it connects, that session is not measured
+        warm_up = Session(url)
+        await warm_up.connect()
+        await warm_up.rerun()
+        warm_up.close()
+
+        sampler = ProcessSampler(pid)
+        results = []
+        for sessions in args.sessions:
+            summary, step_summary = await run_stage(sessions, url, args, sampler)
+            results.append({**summary, 'steps': step_summary.reset_index().to_dict(orient='records')})
+            print(f"\n{sessions} concurrent sessions: {summary['wall_seconds']:.1f}s, "
+                  f"{summary['reruns_per_second']:.1f} reruns/s, {summary['failed_sessions']} failed, "
+                  f"{summary['error_elements']} errors shown"
+                  + (f", RSS {summary['rss_start_mb']:.0f} -> {summary['rss_peak_mb']:.0f} MB peak, "
+                     f"CPU {summary['cpu_mean_percent']:.0f}% mean {summary['cpu_peak_percent']:.0f}% peak"
+                     if 'rss_peak_mb' in summary else ''))
+            print(step_summary.round(1).to_string())
+        if args.output:
+            with open(args.output, 'w') as output_file:
+                json.dump(results, output_file, indent=2, default=float)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive concurrent simulated sessions through the app and report latency')
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 5, 10],
+                        help='Concurrent sessions of every stage, stages run one after another')
+    parser.add_argument('--app', default='app.py', help='App started with streamlit run when --url is not given')
+    parser.add_argument('--port', type=int, default=8599, help='Port of the started server')
+    parser.add_argument('--url', default=None, help='Websocket of a running server, e.g. ws://localhost:8501/stream')
+    parser.add_argument('--pid', type=int, default=None, help='Process id of the running server for RSS and CPU')
+    parser.add_argument('--phases', nargs='*', default=PHASE_NAMES[:2], help='Phases each session configures')
+    parser.add_argument('--features', nargs='*', default=FEATURE_NAMES[:3], help='Features each session applies')
+    parser.add_argument('--frequency', type=int, default=24, help='Readings per day set for every phase')
+    parser.add_argument('--visualise', type=int, default=1, help='Charts opened per phase')
+    parser.add_argument('--think-time', type=float, default=0.5, help='Mean seconds between the steps of a session')
+    parser.add_argument('--ramp-seconds', type=float, default=2.0, help='Session starts are spread over this time')
+    parser.add_argument('--poll-seconds', type=float, default=1.0, help='Seconds between progress checks of background exports')
+    parser.add_argument('--clear-cache', action='store_true', help='Clear st.cache before every stage, so stages start cold')
+    parser.add_argument('--startup-timeout', type=float, default=60, help='Seconds to wait for the server')
+    parser.add_argument('--output', default=None, help='Write the results of all stages as json')
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,103 @@
+"""Manifests of seeded datasets.
+
+A manifest holds the settings and seed of a generated dataset instead of the data.
+Since the noise is counter based, the whole dataset or any slice of it (rows of a
+phase, or days of one cohort patient) can be rebuilt from it and matches the
+original output exactly.
+
+Usage:
+    python manifest.py manifest.json --output full.csv
+    python manifest.py manifest.json --phase Phase_4 --rows 200 230 --output slice.csv
+    python manifest.py manifest.json --patient 9137 --phase Phase_4 --days 200 230 --output slice.csv
+"""
+import argparse
+import datetime
+import json
+
+import numpy as np
+
+import cohort
+from util import PHASE_NAMES, build_phases, generate_dataset, generate_phase, parse_config, serialize_config
+
+MANIFEST_VERSION = 1
+
+
+def build_manifest(config, include_features, include_phases, include_dates, seed, cohort=None):
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'seed': int(seed),
+        'features': [feature for feature in build_phases()[0].feature_dic if feature in include_features],
+        'phases': sorted(include_phases),
+        'include_dates': include_dates,
+        'config': serialize_config(config),
+    }
+    if cohort is not None:
+        manifest['cohort'] = cohort
+    return manifest
+
+
+def write_manifest(path, manifest):
+    with open(path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def load_manifest(path):
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise ValueError(f'Unsupported manifest version {manifest.get("version")}')
+    manifest['config'] = parse_config(manifest['config'])
+    return manifest
+
+
+def regenerate(manifest, phase_name=None, rows=None):
+    # The whole dataset, or rows (first, last) of one phase
+    phases = build_phases()
+    if phase_name is None:
+        return generate_dataset(manifest['config'], set(manifest['features']), set(manifest['phases']), phases,
+                                include_dates=manifest['include_dates'], seed=manifest['seed'])
+    phase = next(phase for phase in phases if phase.name == phase_name)
+    return generate_phase(manifest['config'], phase, set(manifest['features']), include_dates=manifest['include_dates'],
+                          seed=manifest['seed'], rows=rows)
+
+
+def regenerate_patient(manifest, patient, phase_name=None, days=None):
+    # All rows of one cohort patient, optionally limited to a phase and a (first, last) day range
+    model = manifest['cohort']
+    visits = cohort.simulate_transitions(1, model['days'], transitions=model['matrix'], initial=model['initial'],
+                                         dwell_days=model['dwell_days'], dwell_shape=model['dwell_shape'],
+                                         seed=manifest['seed'], patient_ids=[patient])
+    if phase_name is not None:
+        visits = visits[visits['phase'] == PHASE_NAMES.index(phase_name)]
+    if days is not None:
+        visits = visits[(visits['start_day'] < days[1]) & (visits['end_day'] > days[0])]
+    start_date = datetime.date.fromisoformat(model['start_date']) if model.get('start_date') else None
+    settings = cohort.get_phase_settings(manifest['config'], build_phases(), manifest['features'])
+    result = cohort.render_visits(visits, settings, manifest['features'], start_date=start_date, seed=manifest['seed'])
+    if days is not None:
+        # Day of every row relative to the simulation start
+        frequency = settings['frequency'][visits['phase'].to_numpy()]
+        points = (visits['end_day'] - visits['start_day']).to_numpy() * frequency
+        row_offset = np.arange(points.sum()) - np.repeat(np.cumsum(points) - points, points)
+        day = np.repeat(visits['start_day'].to_numpy(), points) + row_offset // np.repeat(frequency, points)
+        result = result[(day >= days[0]) & (day < days[1])]
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild a seeded dataset or a slice of it from its manifest')
+    parser.add_argument('manifest', help='Path to the manifest json file')
+    parser.add_argument('--phase', default=None, help='Only rebuild this phase')
+    parser.add_argument('--rows', type=int, nargs=2, default=None, help='First and last (exclusive) row of the phase')
+    parser.add_argument('--patient', type=int, default=None, help='Cohort patient to rebuild')
+    parser.add_argument('--days', type=int, nargs=2, default=None, help='First and last (exclusive) day of the patient')
+    parser.add_argument('--output', default='slice.csv', help='Output csv path')
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest)
+    if args.patient is not None:
+        result = regenerate_patient(manifest, args.patient, phase_name=args.phase, days=args.days)
+    else:
+        result = regenerate(manifest, phase_name=args.phase, rows=args.rows)
+    result.to_csv(args.output, index=False)
+    print(f'Rebuilt {len(result)} rows into {args.output}')
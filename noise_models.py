@@ -0,0 +1,188 @@
+"""Noise models of the feature values.
+
+White noise, the default, perturbs the control points before interpolation as
+the app always did. The other models are added to every reading, with the
+feature's noise setting as their standard deviation:
+
+- AR: autoregressive readings x[t] = a1 x[t-1] + ... + ap x[t-p] + e[t]
+- Random walk: drift accumulated between readings, std noise after one day
+- Heteroscedastic: white noise whose variance grows linearly through the phase
+- Weekly: an offset per weekday drawn once per phase, the same every week
+
+Series are built for many segments (a phase, or every cohort visit) at once with
+lfilter, cumulative sums and index arithmetic, restarting at every segment. Each
+segment is filtered in its own row, so its values are the same whichever other
+segments it is built with.
+"""
+import functools
+
+import numpy as np
+import scipy.signal
+
+from counter_rng import NOISE_STREAM, WEEKLY_STREAM
+
+NOISE_MODELS = ['White', 'AR', 'Random walk', 'Heteroscedastic', 'Weekly']
+# Models whose readings depend on all earlier readings of the segment
+STATEFUL_MODELS = {'AR', 'Random walk'}
+DEFAULT_COEFFICIENTS = '0.8'
+# Readings of the impulse response used to scale AR innovations
+IMPULSE_LENGTH = 4096
+
+
+def parse_coefficients(coefficients):
+    # Comma separated from the app, a number or list from json
+    if coefficients is None:
+        coefficients = DEFAULT_COEFFICIENTS
+    if isinstance(coefficients, str):
+        coefficients = [float(value) for value in coefficients.split(',') if value.strip()]
+    coefficients = np.atleast_1d(np.asarray(coefficients, dtype='float64'))
+    if len(coefficients) == 0 or np.any(np.abs(np.roots(np.r_[1.0, -coefficients])) >= 1):
+        raise ValueError(f'AR coefficients {coefficients.tolist()} are not stationary')
+    return coefficients
+
+
+def get_noise_spread(model, noise, phase_days):
+    # Largest standard deviation of a model over a phase, for histogram and fixed point ranges
+    if model == 'Random walk':
+        return noise * np.sqrt(max(phase_days, 1))
+    if model == 'Heteroscedastic':
+        return noise * np.sqrt(2)
+    return noise
+
+
+def get_segment_starts(segment):
+    # First row and length of every run of equal segment ids, and the offset of each row in its run
+    starts = np.flatnonzero(np.r_[True, segment[1:] != segment[:-1]])
+    lengths = np.diff(np.append(starts, len(segment)))
+    offset = np.arange(len(segment)) - np.repeat(starts, lengths)
+    return starts, lengths, offset
+
+
+def get_innovation_scale(denominator):
+    # Standard deviation of an AR series driven by unit innovations
+    impulse = scipy.signal.lfilter([1.0], denominator, np.r_[1.0, np.zeros(IMPULSE_LENGTH - 1)])
+    return np.sqrt(np.square(impulse).sum())
+
+
+def accumulate_segments(accumulate, values, segment):
+    # Applies accumulate along the rows of a matrix to every run of equal segment ids on its own
+    # Runs within a factor 2 of each other's length share one zero padded matrix
+    starts, lengths, offset = get_segment_starts(segment)
+    run = np.repeat(np.arange(len(starts)), lengths)
+    size_class = np.ceil(np.log2(lengths)).astype('int64')
+    result = np.empty(len(values))
+    for size in np.unique(size_class):
+        runs = np.flatnonzero(size_class == size)
+        rows = np.flatnonzero(size_class[run] == size)
+        rank = np.searchsorted(runs, run[rows])
+        padded = np.zeros((len(runs), lengths[runs].max()))
+        padded[rank, offset[rows]] = values[rows]
+        result[rows] = accumulate(padded)[rank, offset[rows]]
+    return result
+
+
+def ar_noise(normals, coefficients, segment):
+    # Unit variance AR(p) series, every segment starts at the stationary standard deviation
+    denominator = np.r_[1.0, -coefficients]
+    innovations = normals / get_innovation_scale(denominator)
+    starts = get_segment_starts(segment)[0]
+    innovations[starts] = normals[starts]
+    return accumulate_segments(functools.partial(scipy.signal.lfilter, [1.0], denominator), innovations, segment)
+
+
+def random_walk_noise(normals, days, segment):
+    # Steps scaled by the square root of the time between readings, every segment starts at zero
+    starts = get_segment_starts(segment)[0]
+    steps = np.diff(days, prepend=days[:1])
+    steps[starts] = 0
+    return accumulate_segments(functools.partial(np.cumsum, axis=1), normals * np.sqrt(np.maximum(steps, 0)), segment)
+
+
+def get_model_noise(model, normals, days, progress, segment, coefficients=None, profile=None, weekday=None):
+    # Unit noise of a model, segment ids index the rows of the weekly profile
+    if len(normals) == 0:
+        return normals
+    if model == 'AR':
+        return ar_noise(normals, parse_coefficients(coefficients), segment)
+    if model == 'Random walk':
+        return random_walk_noise(normals, days, segment)
+    if model == 'Heteroscedastic':
+        # Variance grows from 0 to 2, 1 on average over the phase
+        return normals * np.sqrt(2 * np.clip(progress, 0, 1))
+    if model == 'Weekly':
+        return profile[segment, weekday]
+    raise ValueError(f'Unknown noise model {model}')
+
+
+def get_phase_noise(model, days, phase_days, first_row=0, coefficients=None, first_weekday=0, rng=np.random,
+                    stream=None):
+    # Unit noise of rows first_row.. of one phase, days are the reading times of all rows from the phase start
+    # Stateful models are drawn from the first reading, so any row range matches the full run
+    first = 0 if model in STATEFUL_MODELS else first_row
+    days = days[first:]
+    if stream is not None:
+        normals = stream.normal(NOISE_STREAM, first, first + len(days))
+        profile = stream.normal(WEEKLY_STREAM, 0, 7)[np.newaxis, :]
+    else:
+        normals = rng.normal(0, 1, len(days))
+        profile = rng.normal(0, 1, (1, 7)) if model == 'Weekly' else None
+    weekday = (first_weekday + np.floor(days).astype('int64')) % 7
+    values = get_model_noise(model, normals, days, days / max(phase_days, 1), np.zeros(len(days), dtype='int64'),
+                             coefficients=coefficients, profile=profile, weekday=weekday)
+    return values[first_row - first:]
+
+
+def get_noise_state(model, values, coefficients=None):
+    # What a stateful model needs to continue a series: the last p AR values or the last random walk value
+    if model == 'AR':
+        return [float(value) for value in values[max(len(values) - len(parse_coefficients(coefficients)), 0):]]
+    if model == 'Random walk':
+        return [float(value) for value in values[-1:]]
+    return []
+
+
+def get_filter_state(denominator, history):
+    # State of lfilter([1], denominator) after the outputs in history, oldest first, updated the way lfilter does
+    # so the continued series matches an uninterrupted run exactly (lfiltic sums in another order)
+    order = len(denominator) - 1
+    history = np.r_[np.zeros(order), history][len(history):] if order else []
+    state = np.zeros(order)
+    for output in history:
+        state = np.r_[state[1:], 0.0] - output * denominator[1:]
+    return state
+
+
+def continue_phase_noise(model, days, last_day, phase_days, first_row, coefficients=None, first_weekday=0,
+                         stream=None, state=None):
+    # Unit noise of the rows from first_row on, readings at days after last_day, continuing the series in state
+    state = list(state or [])
+    normals = stream.normal(NOISE_STREAM, first_row, first_row + len(days))
+    if model == 'AR':
+        denominator = np.r_[1.0, -parse_coefficients(coefficients)]
+        values = scipy.signal.lfilter([1.0], denominator, normals / get_innovation_scale(denominator),
+                                      zi=get_filter_state(denominator, state))[0]
+    elif model == 'Random walk':
+        # Accumulated from the last value in one cumsum, the same additions as the uninterrupted walk
+        steps = np.diff(days, prepend=last_day)
+        values = np.cumsum(np.r_[state[-1] if state else 0.0, normals * np.sqrt(np.maximum(steps, 0))])[1:]
+    else:
+        # Heteroscedastic noise stays at its level at the end of the phase, weekly offsets keep repeating
+        weekday = (first_weekday + np.floor(days).astype('int64')) % 7
+        values = get_model_noise(model, normals, days, days / max(phase_days, 1), np.zeros(len(days), dtype='int64'),
+                                 profile=stream.normal(WEEKLY_STREAM, 0, 7)[np.newaxis, :], weekday=weekday)
+    return values, get_noise_state(model, np.r_[state, values], coefficients)
+
+
+def get_phase_noise_state(model, days, phase_days, chunk_rows, coefficients=None, first_weekday=0, stream=None):
+    # State at the end of the readings at days, the series is continued chunk by chunk so only one chunk is held
+    state = []
+    for first_row in range(0, len(days), chunk_rows):
+        chunk_days = days[first_row:first_row + chunk_rows]
+        if first_row == 0:
+            state = get_noise_state(model, get_phase_noise(model, chunk_days, phase_days, coefficients=coefficients,
+                                                           first_weekday=first_weekday, stream=stream), coefficients)
+        else:
+            state = continue_phase_noise(model, chunk_days, days[first_row - 1], phase_days, first_row,
+                                         coefficients=coefficients, first_weekday=first_weekday, stream=stream,
+                                         state=state)[1]
+    return state
@@ -0,0 +1,192 @@
+"""Preset datasets of standard clinical scenarios.
+
+Every preset is a named config with a fixed seed, so its output never changes
+for a given generator. Outputs are generated once, at image build time
+(``python presets.py build``) or on first use, and kept as gzipped csv in a
+local artifact cache together with their manifest. The files are named by the
+preset name and version and a hash of the generator source and library
+versions, so any change to the generator code builds the presets again and the
+stale files are pruned. The cache directory is set with the
+GENERATOR_PRESET_CACHE environment variable.
+
+Usage:
+    python presets.py list
+    python presets.py build
+    python presets.py build gradual_decline --cache-dir /tmp/presets
+"""
+import argparse
+import datetime
+import functools
+import hashlib
+import os
+import re
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from estimate import CHUNK_ROWS
+from manifest import build_manifest, write_manifest
+from util import PHASE_NAMES, build_phases, clip_to_widgets, default_config, write_dataset
+
+PRESET_CACHE_DIR = os.environ.get('GENERATOR_PRESET_CACHE',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), '.preset_cache'))
+# Source of everything that shapes the output, a change to any of them builds the presets again
+GENERATOR_MODULES = ('counter_rng.py', 'features.py', 'manifest.py', 'noise_models.py', 'presets.py', 'settings.py',
+                     'util.py')
+
+Preset = namedtuple('Preset', ['name', 'title', 'description', 'version', 'seed', 'config', 'features', 'phases',
+                               'include_dates'])
+
+# Typical values of a healthy older adult and of one with severely impaired mobility, in the units of the catalog
+HEALTHY_VALUES = {
+    'Gait_Speed': 1.3, 'Step_Length': 70.0, 'Step_Width': 10.0, 'Tug_Score': 8.0, 'Cadence': 110.0,
+    'Active_Hours': 4.0, 'Stride_Time_Variability': 2.0, 'Double_Support': 20.0, 'Sit_To_Stand_Count': 45.0,
+    'Turning_Speed': 150.0,
+}
+IMPAIRED_VALUES = {
+    'Gait_Speed': 0.5, 'Step_Length': 40.0, 'Step_Width': 14.0, 'Tug_Score': 20.0, 'Cadence': 80.0,
+    'Active_Hours': 1.0, 'Stride_Time_Variability': 8.0, 'Double_Support': 35.0, 'Sit_To_Stand_Count': 15.0,
+    'Turning_Speed': 70.0,
+}
+# Day to day spread of a reading, ADL counts follow the week, gait metrics are autocorrelated
+READING_NOISE = {
+    'Gait_Speed': (0.05, 'AR'), 'Step_Length': (2.0, 'AR'), 'Step_Width': (0.5, 'AR'), 'Tug_Score': (0.5, 'AR'),
+    'Cadence': (1.0, 'AR'), 'Active_Hours': (0.3, 'Weekly'), 'Stride_Time_Variability': (0.3, 'AR'),
+    'Double_Support': (1.0, 'AR'), 'Sit_To_Stand_Count': (2.0, 'Weekly'), 'Turning_Speed': (5.0, 'AR'),
+}
+PRESET_FEATURES = list(HEALTHY_VALUES)
+PRESET_START_DATE = datetime.date(2022, 1, 3)
+
+
+def get_scenario_config(phase_names, phase_days, frequency_per_day, sampling='Regular', wear_probability=1.0):
+    # Consecutive phases, the features move from healthy to impaired values evenly over all of them
+    phases = build_phases()
+    config = default_config(phases)
+    start_date = PRESET_START_DATE
+    for index, phase_name in enumerate(phase_names):
+        config[phase_name + '_start_date'] = start_date
+        config[phase_name + '_end_date'] = start_date + datetime.timedelta(days=phase_days)
+        config[phase_name + '_frequency_per_day'] = frequency_per_day
+        config[phase_name + '_sampling'] = sampling
+        config[phase_name + '_wear_probability'] = wear_probability
+        start_date = config[phase_name + '_end_date']
+        for feature_name in PRESET_FEATURES:
+            prefix = phase_name + '_' + feature_name
+            healthy, impaired = HEALTHY_VALUES[feature_name], IMPAIRED_VALUES[feature_name]
+            if len(phase_names) == 1:
+                config[prefix + '_base_start'] = config[prefix + '_base_end'] = healthy
+                config[prefix + '_space'] = 'Constant'
+            else:
+                config[prefix + '_base_start'] = healthy + (impaired - healthy) * index / len(phase_names)
+                config[prefix + '_base_end'] = healthy + (impaired - healthy) * (index + 1) / len(phase_names)
+                config[prefix + '_space'] = 'Linear'
+            config[prefix + '_trend'] = 'Linear'
+            config[prefix + '_noise'], config[prefix + '_noise_model'] = READING_NOISE[feature_name]
+    return clip_to_widgets(config, phases)
+
+
+PRESETS = {preset.name: preset for preset in (
+    Preset('healthy_adult', 'Healthy adult',
+           'Six months of stable Phase_1 readings, four a day', 1, 101,
+           get_scenario_config(['Phase_1'], 182, 4), PRESET_FEATURES, ['Phase_1'], True),
+    Preset('gradual_decline', 'Gradual decline',
+           'A year declining steadily from Phase_1 to Phase_4, three months per phase, four readings a day', 1, 102,
+           get_scenario_config(PHASE_NAMES[:4], 91, 4), PRESET_FEATURES, PHASE_NAMES[:4], True),
+    Preset('gradual_decline_wearable', 'Gradual decline, wearable',
+           'The gradual decline as a wearable records it: readings at random times and the device worn on 70% of '
+           'days', 1, 103,
+           get_scenario_config(PHASE_NAMES[:4], 91, 4, sampling='Poisson', wear_probability=0.7),
+           PRESET_FEATURES, PHASE_NAMES[:4], True),
+)}
+
+# One build at a time per preset in this process, the files are replaced atomically for other processes
+BUILD_LOCKS = {name: threading.Lock() for name in PRESETS}
+# Data, manifest and temporary files of a preset: <name>-v<version>-<code version> and the suffix
+PRESET_FILE_PATTERN = re.compile(r'^(?P<key>(?:%s)-v\d+-[0-9a-f]{12})(?:\.\d+\.tmp)?\.(?:csv\.gz|manifest\.json)$'
+                                 % '|'.join(re.escape(name) for name in PRESETS))
+
+
+@functools.lru_cache(maxsize=1)
+def get_code_version():
+    digest = hashlib.sha1()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for module in GENERATOR_MODULES:
+        with open(os.path.join(directory, module), 'rb') as source:
+            digest.update(source.read())
+    digest.update(repr((np.__version__, pd.__version__, scipy.__version__)).encode())
+    return digest.hexdigest()[:12]
+
+
+def get_preset_key(preset):
+    return f'{preset.name}-v{preset.version}-{get_code_version()}'
+
+
+def get_preset_paths(preset, cache_dir=PRESET_CACHE_DIR):
+    # Data and manifest of the preset
+    path = os.path.join(cache_dir, get_preset_key(preset))
+    return path + '.csv.gz', path + '.manifest.json'
+
+
+def build_preset(preset, cache_dir=PRESET_CACHE_DIR):
+    # Path of the gzipped csv, generated unless the cache has it for the current code version
+    data_path, manifest_path = get_preset_paths(preset, cache_dir)
+    with BUILD_LOCKS[preset.name]:
+        if os.path.exists(data_path) and os.path.exists(manifest_path):
+            return data_path
+        os.makedirs(cache_dir, exist_ok=True)
+        # Same extensions, so the data is gzipped too, the manifest is only put in place once the data is
+        temporary_data_path = data_path.replace('.csv.gz', f'.{os.getpid()}.tmp.csv.gz')
+        temporary_manifest_path = manifest_path.replace('.manifest.json', f'.{os.getpid()}.tmp.manifest.json')
+        try:
+            write_dataset(temporary_data_path, preset.config, set(preset.features), set(preset.phases),
+                          build_phases(), include_dates=preset.include_dates, seed=preset.seed,
+                          chunk_rows=CHUNK_ROWS)
+            write_manifest(temporary_manifest_path, build_manifest(preset.config, set(preset.features),
+                                                                   set(preset.phases), preset.include_dates,
+                                                                   preset.seed))
+            os.replace(temporary_data_path, data_path)
+            os.replace(temporary_manifest_path, manifest_path)
+        finally:
+            for temporary_path in (temporary_data_path, temporary_manifest_path):
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+        prune_cache(cache_dir)
+    return data_path
+
+
+def prune_cache(cache_dir=PRESET_CACHE_DIR):
+    # Preset files of other versions or older generator code, anything else in the directory is left alone
+    keys = {get_preset_key(preset) for preset in PRESETS.values()}
+    removed = []
+    for file_name in os.listdir(cache_dir):
+        match = PRESET_FILE_PATTERN.match(file_name)
+        path = os.path.join(cache_dir, file_name)
+        if match and match.group('key') not in keys and os.path.isfile(path):
+            os.remove(path)
+            removed.append(file_name)
+    return removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the preset datasets into the artifact cache')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('list', help='List the presets and whether they are built')
+    build_parser = commands.add_parser('build', help='Build the presets missing for the current generator code')
+    build_parser.add_argument('names', nargs='*', help='Presets to build, all by default')
+    build_parser.add_argument('--cache-dir', default=PRESET_CACHE_DIR, help='Artifact cache directory')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for preset in PRESETS.values():
+            built = os.path.exists(get_preset_paths(preset)[0])
+            print(f"{preset.name:<28} v{preset.version}  {'built' if built else 'missing'}  {preset.description}")
+    else:
+        unknown = set(args.names) - set(PRESETS)
+        if unknown:
+            parser.error(f"Unknown presets {', '.join(sorted(unknown))}")
+        for name in args.names or PRESETS:
+            data_path = build_preset(PRESETS[name], args.cache_dir)
+            print(f'{name}: {data_path} ({os.path.getsize(data_path) / 2 ** 20:.1f} MB)')
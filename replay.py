@@ -0,0 +1,155 @@
+"""Real-time replay of generated readings for load testing downstream consumers.
+
+Readings of many simulated devices are merged in timestamp order and written as
+NDJSON (one reading per line) to stdout, a TCP socket or a Unix socket, either in
+real time or accelerated. Devices are cohort patients (cohort.py) or copies of
+the configured phases, each with its own counter based noise.
+
+An asyncio loop sleeps until the wall time of every batch and the batches are
+serialized by pandas in one call each, so a single process sustains hundreds of
+thousands of events per second at high rates.
+
+Usage:
+    python replay.py --devices 2000 --source cohort --days 30 --rate 3600
+    python replay.py --devices 100 --source phases --config config.json --tcp localhost:9000 --rate 0
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import cohort
+from util import PHASE_NAMES, build_phases, default_config, generate_phase, get_reading_times, parse_config
+
+# Wall time covered by one batch, later events wait for the next batch
+TICK_SECONDS = 0.05
+
+
+def build_cohort_events(devices, days, start_date, config, include_features, seed):
+    visits = cohort.simulate_transitions(devices, days, seed=seed)
+    settings = cohort.get_phase_settings(config, build_phases(), include_features)
+    events = cohort.render_visits(visits, settings, include_features, start_date=start_date, seed=seed,
+                                  spread_readings=True)
+    return events.rename(columns={'Patient': 'Device'})
+
+
+def build_phase_events(devices, config, include_features, include_phases, seed):
+    frames = []
+    for phase in build_phases():
+        if phase.name not in include_phases:
+            continue
+        regular = config.get(phase.name + '_sampling', 'Regular') == 'Regular'
+        for device in range(devices):
+            frame = generate_phase(config, phase, include_features, include_dates=not regular, seed=seed, patient=device)
+            if regular:
+                frame['Date'] = get_reading_times(config[phase.name + '_start_date'],
+                                                  config[phase.name + '_frequency_per_day'], 0, len(frame))
+            frame.insert(0, 'Device', device)
+            frame.insert(1, 'Phase', phase.name)
+            frames.append(frame)
+    events = pd.concat(frames, ignore_index=True)
+    events['Phase'] = pd.Categorical(events['Phase'], PHASE_NAMES)
+    return events
+
+
+def order_events(events):
+    order = np.argsort(events['Date'].to_numpy(), kind='stable')
+    events = events.iloc[order].reset_index(drop=True).rename(columns={'Date': 'Timestamp'})
+    columns = ['Device', 'Phase', 'Timestamp']
+    return events[columns + [column for column in events.columns if column not in columns]]
+
+
+def get_batch_bounds(timestamps, rate, batch_size):
+    # Events of one tick of wall time form a batch, split further to batch_size
+    seconds = (timestamps - timestamps[0]) / np.timedelta64(1, 's')
+    bounds = np.array([0, len(seconds)])
+    if rate > 0:
+        ticks = np.floor(seconds / rate / TICK_SECONDS)
+        bounds = np.union1d(bounds, np.flatnonzero(np.diff(ticks)) + 1)
+    bounds = np.union1d(bounds, np.arange(0, len(seconds), batch_size))
+    return bounds, seconds
+
+
+async def open_output(args):
+    if args.tcp:
+        host, port = args.tcp.rsplit(':', 1)
+        return (await asyncio.open_connection(host, int(port)))[1]
+    if args.unix:
+        return (await asyncio.open_unix_connection(args.unix))[1]
+    return None
+
+
+async def replay(events, rate, batch_size, writer=None):
+    loop = asyncio.get_running_loop()
+    bounds, seconds = get_batch_bounds(events['Timestamp'].to_numpy(), rate, batch_size)
+    started = loop.time()
+    sent = 0
+    for first, last in zip(bounds[:-1], bounds[1:]):
+        if last <= first:
+            continue
+        if rate > 0:
+            delay = started + seconds[first] / rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        payload = events.iloc[first:last].to_json(orient='records', lines=True, date_format='iso', date_unit='s')
+        payload = (payload.rstrip('\n') + '\n').encode()
+        if writer is None:
+            sys.stdout.buffer.write(payload)
+        else:
+            writer.write(payload)
+            await writer.drain()
+        sent += last - first
+    if writer is None:
+        sys.stdout.buffer.flush()
+    else:
+        writer.close()
+        await writer.wait_closed()
+    return sent, loop.time() - started
+
+
+async def main(args):
+    phases = build_phases()
+    config = default_config(phases)
+    if args.config:
+        with open(args.config) as config_file:
+            config.update(parse_config(json.load(config_file)))
+    features = args.features or list(phases[0].feature_dic)
+
+    prepared = time.perf_counter()
+    if args.source == 'cohort':
+        events = build_cohort_events(args.devices, args.days, datetime.date.fromisoformat(args.start_date), config,
+                                     features, args.seed)
+    else:
+        events = build_phase_events(args.devices, config, features, args.phases or PHASE_NAMES, args.seed)
+    events = order_events(events)
+    prepared = time.perf_counter() - prepared
+
+    writer = await open_output(args)
+    sent, elapsed = await replay(events, args.rate, args.batch_size, writer)
+    print(f'Prepared {len(events)} events in {prepared:.2f}s, sent {sent} in {elapsed:.2f}s '
+          f'({sent / max(elapsed, 1e-9):.0f} events/s)', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay generated readings as NDJSON in timestamp order')
+    parser.add_argument('--devices', type=int, default=100, help='Number of simulated devices')
+    parser.add_argument('--source', choices=['cohort', 'phases'], default='cohort',
+                        help='Devices follow the cohort simulation or the configured phases')
+    parser.add_argument('--days', type=int, default=30, help='Days simulated per device for the cohort source')
+    parser.add_argument('--start-date', default=datetime.date.today().isoformat(), help='First day of the cohort source')
+    parser.add_argument('--config', default=None, help='Json file of phase and feature settings, widget defaults otherwise')
+    parser.add_argument('--phases', nargs='*', default=None, help='Phases of the phases source, all by default')
+    parser.add_argument('--features', nargs='*', default=None, help='Features to include, all by default')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the counter based noise')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='Simulated seconds per wall second, 1 is real time and 0 sends as fast as possible')
+    parser.add_argument('--batch-size', type=int, default=10000, help='Maximum events serialized per write')
+    parser.add_argument('--tcp', default=None, help='Send to host:port instead of stdout')
+    parser.add_argument('--unix', default=None, help='Send to a Unix socket path instead of stdout')
+    args = parser.parse_args()
+    asyncio.run(main(args))
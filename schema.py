@@ -0,0 +1,108 @@
+"""Compact output schema.
+
+The full schema has a float64 column per feature and a datetime64 Date column.
+The compact schema adds a categorical Phase column, stores the timestamps as an
+int32 Time_Offset in seconds from the start date of the row's phase, and stores
+the features as float32, or as int16 fixed point (value * scale) for bounded
+metrics whose configured range fits. The epochs and scales needed to decode are
+kept in a json sidecar next to the data (see to_dict and decode_frame).
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+from features import FEATURE_CATALOG
+from noise_models import get_noise_spread
+from stats import get_expected_range
+from util import PHASE_NAMES
+
+SCHEMA_VERSION = 1
+
+# Fixed point scale of bounded features, 1 / scale is the stored precision
+FIXED_POINT_SCALES = {spec.name: spec.fixed_point_scale for spec in FEATURE_CATALOG if spec.fixed_point_scale}
+INT16_LIMIT = np.iinfo('int16').max
+
+
+def get_value_bounds(config, feature_name, include_phases):
+    # Eight std of noise either side, a reading outside is practically impossible
+    lows, highs = [], []
+    for phase_name in include_phases:
+        prefix = phase_name + '_' + feature_name
+        phase_days = (config[phase_name + '_end_date'] - config[phase_name + '_start_date']).days
+        spread = get_noise_spread(config.get(prefix + '_noise_model', 'White'), config[prefix + '_noise'], phase_days)
+        low, high = get_expected_range(config[prefix + '_base_start'], config[prefix + '_base_end'],
+                                       2 * spread, config[prefix + '_trend'])
+        lows.append(low)
+        highs.append(high)
+    return min(lows), max(highs)
+
+
+class CompactSchema:
+    """Per phase epochs and per feature storage of one dataset."""
+
+    def __init__(self, config, include_features, include_phases):
+        phase_names = [phase_name for phase_name in PHASE_NAMES if phase_name in include_phases]
+        self.epochs = {phase_name: np.datetime64(config[phase_name + '_start_date'], 's') for phase_name in phase_names}
+        self.scales = {}
+        for feature_name in include_features:
+            scale = FIXED_POINT_SCALES.get(feature_name)
+            if scale is not None and phase_names:
+                low, high = get_value_bounds(config, feature_name, phase_names)
+                if max(abs(low), abs(high)) * scale >= INT16_LIMIT:
+                    # Falls back to float32 when the configured range does not fit
+                    scale = None
+            self.scales[feature_name] = scale
+
+    def encode(self, phase_name, frame):
+        result = {'Phase': pd.Categorical([phase_name] * len(frame), PHASE_NAMES)}
+        for column in frame.columns:
+            values = frame[column].to_numpy()
+            if column == 'Date':
+                offsets = (values.astype('datetime64[s]') - self.epochs[phase_name]) // np.timedelta64(1, 's')
+                result['Time_Offset'] = offsets.astype('int32')
+            elif self.scales.get(column) is not None:
+                fixed = np.round(values * self.scales[column])
+                result[column] = np.clip(fixed, -INT16_LIMIT, INT16_LIMIT).astype('int16')
+            else:
+                result[column] = values.astype('float32')
+        return pd.DataFrame(result)
+
+    def decode_frame(self, frame):
+        # Back to float64 features and datetime64 dates
+        result = frame.copy()
+        for column, scale in self.scales.items():
+            if column in result:
+                result[column] = result[column].astype('float64') / (scale or 1)
+        if 'Time_Offset' in result:
+            epochs = result['Phase'].astype(str).map(self.epochs).to_numpy(dtype='datetime64[s]')
+            result['Date'] = epochs + result.pop('Time_Offset').to_numpy().astype('timedelta64[s]')
+        return result
+
+    def to_dict(self):
+        return {
+            'version': SCHEMA_VERSION,
+            'epochs': {phase_name: str(epoch) for phase_name, epoch in self.epochs.items()},
+            'features': {feature_name: {'dtype': 'int16', 'scale': scale} if scale else {'dtype': 'float32'}
+                         for feature_name, scale in sorted(self.scales.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, schema_dict):
+        schema = cls.__new__(cls)
+        schema.epochs = {phase_name: np.datetime64(epoch, 's') for phase_name, epoch in schema_dict['epochs'].items()}
+        schema.scales = {feature_name: storage.get('scale') for feature_name, storage in schema_dict['features'].items()}
+        return schema
+
+
+def write_schema(schema, path_prefix):
+    with open(path_prefix + '.schema.json', 'w') as schema_file:
+        json.dump(schema.to_dict(), schema_file, indent=2)
+
+
+def read_compact_csv(path, schema_path):
+    # Reads a compact csv with its sidecar into the full schema
+    with open(schema_path) as schema_file:
+        schema = CompactSchema.from_dict(json.load(schema_file))
+    frame = pd.read_csv(path, dtype={'Phase': pd.CategoricalDtype(PHASE_NAMES)})
+    return schema.decode_frame(frame)
@@ -0,0 +1,111 @@
+"""Immutable settings of features, phases and datasets.
+
+The generator reads its settings from a flat config mapping (see
+util.default_config). For caching they are captured once per run in namedtuples,
+which are frozen and slotted, together with a fingerprint of all their values
+that __new__ computes, so it cannot be passed in or replaced. Caches and export
+jobs are keyed by the fingerprint (see HASH_FUNCS), so a lookup costs the same
+however many phases and features are configured, instead of walking live phase
+and feature objects.
+"""
+import hashlib
+import operator
+from collections import namedtuple
+
+FINGERPRINT_LENGTH = 16
+
+
+def get_fingerprint(values):
+    # Stable across processes and sessions, unlike hash()
+    return hashlib.sha1(repr(values).encode()).hexdigest()[:FINGERPRINT_LENGTH]
+
+
+def freeze_coefficients(coefficients):
+    # Comma separated text is kept, a list from json becomes a tuple
+    if coefficients is None or isinstance(coefficients, str):
+        return coefficients
+    if isinstance(coefficients, (int, float)):
+        return (float(coefficients),)
+    return tuple(float(coefficient) for coefficient in coefficients)
+
+
+class Fingerprinted:
+    """Settings whose last field, the fingerprint, is computed from the others in __new__."""
+
+    __slots__ = ()
+
+    @classmethod
+    def _make(cls, iterable):
+        # The values without the fingerprint, as __new__ takes them
+        return cls(*iterable)
+
+    def _replace(self, **changes):
+        if 'fingerprint' in changes:
+            raise TypeError('The fingerprint is computed from the other settings')
+        values = self._asdict()
+        del values['fingerprint']
+        values.update(changes)
+        return type(self)(**values)
+
+    def __getnewargs__(self):
+        return tuple(self)[:-1]
+
+
+class FeatureSettings(Fingerprinted, namedtuple('FeatureSettings', ['name', 'base_start', 'base_end', 'space', 'trend',
+                                                                    'noise', 'noise_model', 'coefficients',
+                                                                    'fingerprint'])):
+    __slots__ = ()
+
+    def __new__(cls, name, base_start, base_end, space, trend, noise, noise_model='White', coefficients=None):
+        values = (name, float(base_start), float(base_end), space, trend, float(noise), noise_model,
+                  freeze_coefficients(coefficients))
+        return super().__new__(cls, *values, get_fingerprint(values))
+
+
+class PhaseSettings(Fingerprinted, namedtuple('PhaseSettings', ['name', 'start_date', 'end_date', 'frequency_per_day',
+                                                                'sampling', 'wear_probability', 'features',
+                                                                'fingerprint'])):
+    __slots__ = ()
+
+    def __new__(cls, name, start_date, end_date, frequency_per_day, sampling='Regular', wear_probability=1.0,
+                features=()):
+        values = (name, start_date, end_date, int(frequency_per_day), sampling, float(wear_probability))
+        features = tuple(features)
+        fingerprint = get_fingerprint(values + tuple(feature.fingerprint for feature in features))
+        return super().__new__(cls, *values, features, fingerprint)
+
+
+class DatasetSettings(Fingerprinted, namedtuple('DatasetSettings', ['phases', 'features', 'include_dates',
+                                                                    'fingerprint'])):
+    __slots__ = ()
+
+    def __new__(cls, phases, features, include_dates):
+        phases, features = tuple(phases), tuple(features)
+        values = (tuple(phase.fingerprint for phase in phases), features, bool(include_dates))
+        return super().__new__(cls, phases, features, bool(include_dates), get_fingerprint(values))
+
+
+# For st.cache, settings are hashed by their fingerprint only
+HASH_FUNCS = {settings_type: operator.attrgetter('fingerprint')
+              for settings_type in (FeatureSettings, PhaseSettings, DatasetSettings)}
+
+
+def to_config(dataset):
+    # The flat config of the included phases and features, as the generator functions take it
+    config = {}
+    for phase in dataset.phases:
+        config[phase.name + '_start_date'] = phase.start_date
+        config[phase.name + '_end_date'] = phase.end_date
+        config[phase.name + '_frequency_per_day'] = phase.frequency_per_day
+        config[phase.name + '_sampling'] = phase.sampling
+        config[phase.name + '_wear_probability'] = phase.wear_probability
+        for feature in phase.features:
+            prefix = phase.name + '_' + feature.name
+            config[prefix + '_base_start'] = feature.base_start
+            config[prefix + '_base_end'] = feature.base_end
+            config[prefix + '_space'] = feature.space
+            config[prefix + '_trend'] = feature.trend
+            config[prefix + '_noise'] = feature.noise
+            config[prefix + '_noise_model'] = feature.noise_model
+            config[prefix + '_noise_coefficients'] = feature.coefficients
+    return config
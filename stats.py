@@ -0,0 +1,161 @@
+"""One-pass statistics of the generated data.
+
+The statistics are updated chunk by chunk while the data is generated, so the
+report needs neither a second pass over the export nor the data in memory.
+"""
+import html
+import json
+
+import numpy as np
+import pandas as pd
+
+HISTOGRAM_BINS = 20
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def get_expected_range(start, end, noise, trend):
+    # Fixed histogram range from the configured values, four std of noise either side
+    spread = 4 * noise
+    if trend == 'Quadratic':
+        spread += 4 * abs(start - end) / 2
+    low, high = min(start, end) - spread, max(start, end) + spread
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return low, high
+
+
+class FeatureStats:
+    def __init__(self, low, high, bins=HISTOGRAM_BINS):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.edges = np.linspace(low, high, bins + 1)
+        self.histogram = np.zeros(bins, dtype='int64')
+        self.underflow = 0
+        self.overflow = 0
+        # Lag-1 sums are kept around the first value to keep them well conditioned
+        self.shift = None
+        self.last = None
+        self.pairs = 0
+        self.lag_head = 0.0
+        self.lag_tail = 0.0
+        self.lag_product = 0.0
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        if len(values) == 0:
+            return
+
+        # Welford mean and variance, merged per chunk
+        chunk_count = len(values)
+        chunk_mean = values.mean()
+        chunk_m2 = np.square(values - chunk_mean).sum()
+        total = self.count + chunk_count
+        delta = chunk_mean - self.mean
+        self.mean += delta * chunk_count / total
+        self.m2 += chunk_m2 + delta * delta * self.count * chunk_count / total
+        self.count = total
+
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.histogram += np.histogram(values, bins=self.edges)[0]
+        self.underflow += int((values < self.edges[0]).sum())
+        self.overflow += int((values > self.edges[-1]).sum())
+
+        if self.shift is None:
+            self.shift = values[0]
+        shifted = values - self.shift
+        if self.last is not None:
+            shifted = np.concatenate(([self.last], shifted))
+        self.pairs += len(shifted) - 1
+        self.lag_head += shifted[:-1].sum()
+        self.lag_tail += shifted[1:].sum()
+        self.lag_product += np.dot(shifted[:-1], shifted[1:])
+        self.last = shifted[-1]
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def autocorrelation(self):
+        if self.pairs < 1 or self.m2 == 0:
+            return 0.0
+        covariance = self.lag_product / self.pairs - (self.lag_head / self.pairs) * (self.lag_tail / self.pairs)
+        return covariance / (self.m2 / self.count)
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'std': float(np.sqrt(self.variance)),
+            'min': float(self.min) if self.count else None,
+            'max': float(self.max) if self.count else None,
+            'lag1_autocorrelation': float(self.autocorrelation),
+            'histogram': {
+                'edges': self.edges.tolist(),
+                'counts': self.histogram.tolist(),
+                'underflow': self.underflow,
+                'overflow': self.overflow,
+            },
+        }
+
+
+class StreamingReport:
+    def __init__(self):
+        self.stats = {}
+
+    def add_feature(self, phase_name, feature_name, low, high):
+        # Chunks of the same phase keep updating the existing statistics
+        if (phase_name, feature_name) not in self.stats:
+            self.stats[(phase_name, feature_name)] = FeatureStats(low, high)
+
+    def update(self, phase_name, feature_name, values):
+        self.stats[(phase_name, feature_name)].update(values)
+
+    def to_dict(self):
+        result = {}
+        for (phase_name, feature_name), feature_stats in self.stats.items():
+            result.setdefault(phase_name, {})[feature_name] = feature_stats.to_dict()
+        return result
+
+
+def get_sparkline(counts):
+    counts = np.asarray(counts, dtype='float64')
+    if counts.max() == 0:
+        return ''
+    levels = np.ceil(counts / counts.max() * (len(SPARK_CHARS) - 1)).astype(int)
+    return ''.join(SPARK_CHARS[level] for level in levels)
+
+
+def get_summary_frame(report):
+    rows = []
+    for phase_name, features in report.items():
+        for feature_name, feature_stats in features.items():
+            rows.append({
+                'Phase': phase_name, 'Feature': feature_name, 'Count': feature_stats['count'],
+                'Mean': feature_stats['mean'], 'Std': feature_stats['std'],
+                'Min': feature_stats['min'], 'Max': feature_stats['max'],
+                'Lag-1 autocorrelation': feature_stats['lag1_autocorrelation'],
+                'Histogram': get_sparkline(feature_stats['histogram']['counts']),
+            })
+    return pd.DataFrame(rows)
+
+
+def report_to_json(report):
+    return json.dumps(report, indent=2)
+
+
+def report_to_html(report, title='Synthetic Gait Data Report'):
+    table = get_summary_frame(report).to_html(index=False, float_format=lambda value: f'{value:.4f}')
+    return f'<html><head><meta charset="utf-8"><title>{html.escape(title)}</title></head>' \
+           f'<body><h1>{html.escape(title)}</h1>{table}</body></html>'
+
+
+def write_report(report, path_prefix):
+    with open(path_prefix + '.report.json', 'w') as json_file:
+        json_file.write(report_to_json(report))
+    with open(path_prefix + '.report.html', 'w', encoding='utf-8') as html_file:
+        html_file.write(report_to_html(report))
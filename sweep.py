@@ -0,0 +1,126 @@
+"""Parameter sweep generation for augmentation grids.
+
+A sweep file holds the phase layout and a grid of settings, e.g.
+
+    {
+        "phases": ["Phase_1", "Phase_2"],
+        "features": ["Gait_Speed", "Step_Length"],
+        "include_dates": true,
+        "seed": 0,
+        "config": {"Phase_1_start_date": "2021-09-21", "Phase_1_end_date": "2021-12-21"},
+        "grid": {"trend": ["Nearest", "Linear", "Cubic", "Quadratic"],
+                 "space": ["Linear", "Geometric", "Constant"],
+                 "noise": [0.0, 0.05, 0.1]}
+    }
+
+Grid keys are either full setting keys (``Phase_1_Gait_Speed_noise``) or a setting
+suffix (``noise``) applied to every feature of every phase. Settings missing from
+``config`` use the same defaults as the app widgets. Every dataset gets a
+statistics report next to it (see stats.py), and ``"compact": true`` writes the
+compact schema with its sidecar (see schema.py).
+
+Usage: python sweep.py sweep.json --output sweep_output --workers 4
+"""
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from schema import CompactSchema, write_schema
+from stats import StreamingReport, write_report
+from util import PHASE_NAMES, build_phases, default_config, parse_config, write_dataset
+
+# Parameters that only change how the control points are interpolated or perturbed,
+# jobs differing only in these share control points, plans and date columns
+INTERPOLATION_PARAMETERS = ('trend', 'noise')
+# Tasks handed to a worker at a time are a fraction of its share of the jobs
+CHUNKS_PER_WORKER = 4
+
+
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def apply_parameters(config, parameters):
+    result = dict(config)
+    for name, value in parameters.items():
+        if name in result:
+            result[name] = value
+            continue
+        matched = [key for key in config if key.endswith('_' + name)]
+        if not matched:
+            raise KeyError(f'Sweep parameter {name} does not match any setting')
+        for key in matched:
+            result[key] = value
+    return result
+
+
+def get_job_label(index, parameters):
+    return '_'.join([f'{index:04d}'] + [f'{name}-{value}' for name, value in parameters.items()])
+
+
+def get_share_key(parameters):
+    return tuple((name, value) for name, value in parameters.items()
+                 if name.rsplit('_', 1)[-1] not in INTERPOLATION_PARAMETERS)
+
+
+def run_job(job, spec, output_dir):
+    # Jobs next to each other in the same worker process reuse the util caches
+    index, parameters, config = job
+    label = get_job_label(index, parameters)
+    rng = np.random.default_rng([spec['seed'], index])
+    path_prefix = os.path.join(output_dir, f'sweep_{label}')
+    report = StreamingReport()
+    schema = CompactSchema(config, spec['features'], spec['phases']) if spec['compact'] else None
+    row_count = write_dataset(path_prefix + '.csv', config, set(spec['features']), set(spec['phases']), build_phases(),
+                              include_dates=spec['include_dates'], rng=rng, report=report, schema=schema)
+    write_report(report.to_dict(), path_prefix)
+    if schema is not None:
+        write_schema(schema, path_prefix)
+    return dict(job=index, label=label, path=os.path.basename(path_prefix) + '.csv', rows=row_count, **parameters)
+
+
+def get_chunk_size(job_count, workers):
+    # Several chunks per worker, so a grid that mostly shares its control points still runs in parallel
+    return max(1, job_count // (workers * CHUNKS_PER_WORKER))
+
+
+def run_sweep(spec, output_dir, workers=None):
+    phases = build_phases()
+    config = default_config(phases)
+    config.update(parse_config(spec.get('config', {})))
+    spec = dict(spec, phases=spec.get('phases', PHASE_NAMES), features=spec.get('features', list(phases[0].feature_dic)),
+                include_dates=spec.get('include_dates', False), seed=spec.get('seed', 0),
+                compact=spec.get('compact', False))
+
+    # Every job is its own task, ordered so jobs sharing control points, plans and dates are next to each other
+    jobs = [(index, parameters, apply_parameters(config, parameters))
+            for index, parameters in enumerate(expand_grid(spec['grid']))]
+    jobs.sort(key=lambda job: repr(get_share_key(job[1])))
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = list(executor.map(run_job, jobs, itertools.repeat(spec), itertools.repeat(output_dir),
+                                 chunksize=get_chunk_size(len(jobs), workers)))
+
+    index_df = pd.DataFrame(rows).sort_values('job')
+    index_df.to_csv(os.path.join(output_dir, 'index.csv'), index=False)
+    return index_df
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate one dataset per point of a parameter grid')
+    parser.add_argument('sweep', help='Path to the sweep json file')
+    parser.add_argument('--output', default='sweep_output', help='Directory for the datasets and index.csv')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    args = parser.parse_args()
+
+    with open(args.sweep) as sweep_file:
+        index_df = run_sweep(json.load(sweep_file), args.output, workers=args.workers)
+    print(f'Generated {len(index_df)} datasets in {args.output}')
@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+import append
+import util
+
+TRENDS = ['Cubic', 'Quadratic', 'Linear', 'Nearest']
+NOISE_MODELS = ['White', 'AR', 'Random walk', 'Weekly']
+
+
+def get_manifest(sampling):
+    phases = util.build_phases()
+    config = util.default_config(phases)
+    config['Phase_1_frequency_per_day'] = 24
+    config['Phase_1_sampling'] = sampling
+    config['Phase_1_wear_probability'] = 0.7
+    features = list(phases[0].feature_dic)[:8]
+    for index, feature_name in enumerate(features):
+        config['Phase_1_' + feature_name + '_trend'] = TRENDS[index % len(TRENDS)]
+        config['Phase_1_' + feature_name + '_noise'] = 0.3
+        config['Phase_1_' + feature_name + '_noise_model'] = NOISE_MODELS[index // 2 % len(NOISE_MODELS)]
+    return {'config': config, 'features': features, 'phases': ['Phase_1'], 'include_dates': True, 'seed': 7}
+
+
+def extend(directory, manifest, splits, chunk_rows):
+    directory.mkdir()
+    path = str(directory / 'data.csv')
+    state = append.init_output(manifest, path, chunk_rows=chunk_rows)
+    for days in splits:
+        append.extend_output(path, state, 'Phase_1', days, chunk_rows=chunk_rows)
+    return pd.read_csv(path)
+
+
+@pytest.mark.parametrize('sampling', ['Regular', 'Poisson', 'Wear mask'])
+def test_extension_does_not_depend_on_the_split(tmp_path, sampling):
+    manifest = get_manifest(sampling)
+    expected = extend(tmp_path / 'whole', manifest, [30], 10 ** 6)
+    for name, splits, chunk_rows in [('appends', [10, 20], 10 ** 6), ('blocks', [30], 50), ('both', [7, 1, 22], 37)]:
+        pd.testing.assert_frame_equal(extend(tmp_path / name, manifest, splits, chunk_rows), expected,
+                                      check_exact=True)
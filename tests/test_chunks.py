@@ -0,0 +1,65 @@
+import datetime
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+import util
+
+TRENDS = ['Nearest', 'Linear', 'Cubic', 'Quadratic']
+
+
+def get_long_phase_config(days, frequency, noise_models, sampling='Regular'):
+    phases = util.build_phases()
+    config = util.default_config(phases)
+    config['Phase_1_end_date'] = config['Phase_1_start_date'] + datetime.timedelta(days=days)
+    config['Phase_1_frequency_per_day'] = frequency
+    config['Phase_1_sampling'] = sampling
+    for index, feature_name in enumerate(phases[0].feature_dic):
+        config['Phase_1_' + feature_name + '_trend'] = TRENDS[index % len(TRENDS)]
+        config['Phase_1_' + feature_name + '_noise'] = 0.5
+        config['Phase_1_' + feature_name + '_noise_model'] = noise_models[index % len(noise_models)]
+    return config, phases[0]
+
+
+def get_peak_bytes(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@pytest.mark.parametrize('days', [365, 3650])
+def test_range_memory_does_not_grow_with_phase(days):
+    # 1000 rows of a phase of 365 thousand or 3.65 million rows
+    config, phase = get_long_phase_config(days, 1000, ['White', 'Heteroscedastic', 'Weekly'])
+    total_rows = util.get_phase_row_count(config, phase)
+    rows = (total_rows // 2, total_rows // 2 + 1000)
+    peak = get_peak_bytes(lambda: util.generate_phase(config, phase, set(phase.feature_dic), include_dates=True,
+                                                      seed=1, rows=rows))
+    assert peak < 4 * 2 ** 20
+
+
+def test_chunk_memory_with_stateful_noise():
+    # A phase of 1.825 million rows, a single column of it takes 14 MiB
+    config, phase = get_long_phase_config(3650, 500, ['AR', 'Random walk'])
+    features = {'Gait_Speed', 'Step_Length'}
+
+    def consume():
+        for chunk in util.iter_phase_chunks(config, phase, features, seed=1, chunk_rows=20000):
+            assert len(chunk) <= 20000
+
+    assert get_peak_bytes(consume) < 6 * 2 ** 20
+
+
+@pytest.mark.parametrize('sampling', ['Regular', 'Poisson'])
+def test_chunks_across_spline_windows(sampling):
+    # More control points than a spline window holds, with chunks ending inside the windows
+    config, phase = get_long_phase_config(200, 200, ['White', 'AR', 'Random walk', 'Weekly'], sampling=sampling)
+    features = set(phase.feature_dic)
+    full = util.generate_phase(config, phase, features, include_dates=True, seed=3)
+    assert util.get_initial_space_len(len(full)) > 2 * util.SPLINE_BLOCK_SEGMENTS
+    chunks = util.iter_phase_chunks(config, phase, features, include_dates=True, seed=3, chunk_rows=7777)
+    pd.testing.assert_frame_equal(pd.concat(list(chunks), ignore_index=True), full, check_exact=True)
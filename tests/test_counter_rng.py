@@ -0,0 +1,66 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import counter_rng
+import util
+from noise_models import NOISE_MODELS
+
+TRENDS = ['Nearest', 'Linear', 'Cubic', 'Quadratic']
+
+# Known answers of philox4x32-10 from the Random123 distribution (kat_vectors)
+PHILOX_KNOWN_ANSWERS = [
+    ((0x00000000, 0x00000000, 0x00000000, 0x00000000), (0x00000000, 0x00000000),
+     (0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8)),
+    ((0xffffffff, 0xffffffff, 0xffffffff, 0xffffffff), (0xffffffff, 0xffffffff),
+     (0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd)),
+    ((0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344), (0xa4093822, 0x299f31d0),
+     (0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1)),
+]
+
+
+@pytest.mark.parametrize('counter, key, expected', PHILOX_KNOWN_ANSWERS)
+def test_philox_known_answers(counter, key, expected):
+    assert tuple(int(word) for word in counter_rng.philox4x32(counter, key)) == expected
+
+
+def test_philox_is_elementwise():
+    counters = [np.array([word, 0, word]) for word in (0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344)]
+    words = counter_rng.philox4x32(counters, (0xa4093822, 0x299f31d0))
+    assert tuple(int(word[0]) for word in words) == PHILOX_KNOWN_ANSWERS[2][2]
+    assert tuple(int(word[2]) for word in words) == PHILOX_KNOWN_ANSWERS[2][2]
+
+
+def test_feature_stream_ranges_match():
+    stream = counter_rng.FeatureStream(11, feature=3, phase=2, patient=5)
+    full = stream.normal(counter_rng.NOISE_STREAM, 0, 1000)
+    np.testing.assert_array_equal(stream.normal(counter_rng.NOISE_STREAM, 400, 650), full[400:650])
+    assert not np.array_equal(stream.normal(counter_rng.ROW_STREAM, 0, 1000), full)
+
+
+def get_phase_config(trend, noise_model, sampling):
+    phases = util.build_phases()
+    config = util.default_config(phases)
+    config['Phase_1_end_date'] = config['Phase_1_start_date'] + datetime.timedelta(days=40)
+    config['Phase_1_frequency_per_day'] = 24
+    config['Phase_1_sampling'] = sampling
+    config['Phase_1_wear_probability'] = 0.6
+    for feature_name in phases[0].feature_dic:
+        config['Phase_1_' + feature_name + '_trend'] = trend
+        config['Phase_1_' + feature_name + '_noise'] = 0.4
+        config['Phase_1_' + feature_name + '_noise_model'] = noise_model
+    return config, phases[0]
+
+
+@pytest.mark.parametrize('sampling', util.SAMPLING_MODELS)
+@pytest.mark.parametrize('noise_model', NOISE_MODELS)
+@pytest.mark.parametrize('trend', TRENDS)
+def test_slice_matches_full_phase(trend, noise_model, sampling):
+    config, phase = get_phase_config(trend, noise_model, sampling)
+    features = set(phase.feature_dic)
+    full = util.generate_phase(config, phase, features, include_dates=True, seed=5)
+    for first, last in [(0, 1), (123, 456), (len(full) - 17, len(full))]:
+        part = util.generate_phase(config, phase, features, include_dates=True, seed=5, rows=(first, last))
+        pd.testing.assert_frame_equal(part, full.iloc[first:last].reset_index(drop=True), check_exact=True)
@@ -0,0 +1,79 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cohort
+import manifest
+import util
+from noise_models import NOISE_MODELS
+
+
+def get_config():
+    phases = util.build_phases()
+    config = util.default_config(phases)
+    for phase in phases[:2]:
+        config[phase.name + '_frequency_per_day'] = 6
+        for index, feature_name in enumerate(phase.feature_dic):
+            config[phase.name + '_' + feature_name + '_noise'] = 0.3
+            config[phase.name + '_' + feature_name + '_noise_model'] = NOISE_MODELS[index % len(NOISE_MODELS)]
+    config['Phase_2_sampling'] = 'Poisson'
+    return config, phases
+
+
+def save_and_load(tmp_path, built):
+    # Through the json file, so dates and the cohort model round trip as they do on disk
+    path = str(tmp_path / 'manifest.json')
+    manifest.write_manifest(path, built)
+    return manifest.load_manifest(path)
+
+
+def test_regenerate_dataset_and_rows(tmp_path):
+    config, phases = get_config()
+    features = set(list(phases[0].feature_dic)[:6])
+    loaded = save_and_load(tmp_path, manifest.build_manifest(config, features, {'Phase_1', 'Phase_2'}, True, 21))
+    full = util.generate_dataset(config, features, {'Phase_1', 'Phase_2'}, phases, include_dates=True, seed=21)
+    pd.testing.assert_frame_equal(manifest.regenerate(loaded), full, check_exact=True)
+
+    phase = util.generate_phase(config, phases[1], features, include_dates=True, seed=21)
+    part = manifest.regenerate(loaded, phase_name='Phase_2', rows=(40, 90))
+    pd.testing.assert_frame_equal(part, phase.iloc[40:90].reset_index(drop=True), check_exact=True)
+
+
+def test_load_manifest_rejects_other_versions(tmp_path):
+    config, phases = get_config()
+    built = manifest.build_manifest(config, set(phases[0].feature_dic), {'Phase_1'}, False, 1)
+    built['version'] = manifest.MANIFEST_VERSION + 1
+    with pytest.raises(ValueError):
+        save_and_load(tmp_path, built)
+
+
+@pytest.mark.parametrize('phase_name, days', [(None, None), ('Phase_3', None), (None, (50, 120)),
+                                              ('Phase_2', (30, 200))])
+def test_regenerate_patient(tmp_path, phase_name, days):
+    config, phases = get_config()
+    features = list(phases[0].feature_dic)[:5]
+    start_date = datetime.date(2021, 3, 1)
+    model = dict(matrix=np.asarray(cohort.DEFAULT_TRANSITIONS).tolist(),
+                 initial=np.asarray(cohort.DEFAULT_INITIAL).tolist(),
+                 dwell_days=np.asarray(cohort.DEFAULT_DWELL_DAYS).tolist(), dwell_shape=2.0,
+                 patients=12, days=240, start_date=start_date.isoformat())
+    loaded = save_and_load(tmp_path, manifest.build_manifest(config, features, util.PHASE_NAMES, True, 33,
+                                                             cohort=model))
+
+    visits = cohort.simulate_transitions(12, 240, transitions=model['matrix'], initial=model['initial'],
+                                         dwell_days=model['dwell_days'], dwell_shape=2.0, seed=33)
+    full = pd.concat(cohort.iter_cohort(visits, config, features, start_date=start_date, chunk_patients=5, seed=33),
+                     ignore_index=True)
+    for patient in [0, 7, 11]:
+        expected = full[full['Patient'] == patient]
+        if phase_name is not None:
+            expected = expected[expected['Phase'] == phase_name]
+        if days is not None:
+            day = (expected['Date'] - np.datetime64(start_date)).dt.days
+            expected = expected[(day >= days[0]) & (day < days[1])]
+        result = manifest.regenerate_patient(loaded, patient, phase_name=phase_name, days=days)
+        assert len(result) > 0 or len(expected) == 0
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True),
+                                      check_exact=True)
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+import noise_models
+from counter_rng import FeatureStream
+
+STATEFUL = [('AR', '0.8'), ('AR', '0.5, 0.3'), ('AR', '1.2, -0.5, 0.1'), ('Random walk', None)]
+
+
+def get_days(rows, seed):
+    # Irregular reading times over a phase, with repeated times
+    return np.sort(np.random.RandomState(seed).uniform(0, 60, rows).round(2))
+
+
+@pytest.mark.parametrize('model, coefficients', STATEFUL)
+@pytest.mark.parametrize('chunk_rows', [1, 7, 500, 4000])
+def test_continued_noise_matches_one_shot(model, coefficients, chunk_rows):
+    days = get_days(3000, 1)
+    stream = FeatureStream(3, feature=2, phase=1)
+    full = noise_models.get_phase_noise(model, days, 60, coefficients=coefficients, stream=stream)
+    chunks = [noise_models.get_phase_noise(model, days[:chunk_rows], 60, coefficients=coefficients, stream=stream)]
+    state = noise_models.get_noise_state(model, chunks[0], coefficients)
+    for first_row in range(chunk_rows, len(days), chunk_rows):
+        values, state = noise_models.continue_phase_noise(model, days[first_row:first_row + chunk_rows],
+                                                          days[first_row - 1], 60, first_row,
+                                                          coefficients=coefficients, stream=stream, state=state)
+        chunks.append(values)
+    np.testing.assert_array_equal(np.concatenate(chunks), full)
+    assert state == noise_models.get_noise_state(model, full, coefficients)
+    assert state == noise_models.get_phase_noise_state(model, days, 60, chunk_rows, coefficients=coefficients,
+                                                       stream=stream)
+
+
+@pytest.mark.parametrize('model, coefficients', STATEFUL)
+def test_segments_do_not_depend_on_each_other(model, coefficients):
+    # Segments of very different lengths, as cohort visits are
+    lengths = np.random.RandomState(2).randint(1, 700, 40)
+    segment = np.repeat(np.arange(len(lengths)), lengths)
+    normals = np.random.RandomState(3).normal(0, 1, len(segment))
+    days = np.concatenate([get_days(length, index) for index, length in enumerate(lengths)])
+    batch = noise_models.get_model_noise(model, normals, days, None, segment, coefficients=coefficients)
+    for index in [0, 1, 17, 39]:
+        rows = segment == index
+        alone = noise_models.get_model_noise(model, normals[rows], days[rows], None, np.zeros(rows.sum(), dtype='int64'),
+                                             coefficients=coefficients)
+        np.testing.assert_array_equal(batch[rows], alone)
+    # Dropping segments from the batch leaves the others unchanged
+    kept = segment % 3 != 0
+    np.testing.assert_array_equal(noise_models.get_model_noise(model, normals[kept], days[kept], None, segment[kept],
+                                                               coefficients=coefficients), batch[kept])
+
+
+@pytest.mark.parametrize('coefficients', ['0.8', '0.5, 0.3', '1.2, -0.5, 0.1'])
+def test_ar_noise_has_unit_variance(coefficients):
+    # Many short segments, so the first reading of each is covered as well as the stationary part
+    segment = np.repeat(np.arange(2000), 100)
+    normals = np.random.RandomState(4).normal(0, 1, len(segment))
+    values = noise_models.ar_noise(normals, noise_models.parse_coefficients(coefficients), segment).reshape(2000, 100)
+    np.testing.assert_allclose(values.var(axis=0).mean(), 1, atol=0.05)
+    np.testing.assert_allclose(values[:, 0].var(), 1, atol=0.1)
+    np.testing.assert_allclose(values[:, -1].var(), 1, atol=0.1)
+
+
+def test_random_walk_variance_grows_by_one_per_day():
+    segment = np.repeat(np.arange(20000), 97)
+    days = np.tile(np.arange(97) / 24, 20000)
+    normals = np.random.RandomState(5).normal(0, 1, len(segment))
+    values = noise_models.random_walk_noise(normals, days, segment).reshape(20000, 97)
+    np.testing.assert_array_equal(values[:, 0], 0)
+    np.testing.assert_allclose(values[:, 24].var(), 1, atol=0.05)
+    np.testing.assert_allclose(values[:, 96].var(), 4, atol=0.2)
+
+
+def test_heteroscedastic_noise_has_unit_variance_over_the_phase():
+    days = np.linspace(0, 100, 200000)
+    normals = np.random.RandomState(6).normal(0, 1, len(days))
+    values = noise_models.get_model_noise('Heteroscedastic', normals, days, days / 100, np.zeros(len(days), dtype='int64'))
+    np.testing.assert_allclose(values.var(), 1, atol=0.02)
+
+
+def test_parse_coefficients_rejects_non_stationary():
+    with pytest.raises(ValueError):
+        noise_models.parse_coefficients('1.0')
+    with pytest.raises(ValueError):
+        noise_models.parse_coefficients('0.7, 0.4')
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+
+import presets
+
+
+def touch(directory, name):
+    with open(os.path.join(directory, name), 'w') as output:
+        output.write('x')
+
+
+def test_prune_cache_only_removes_stale_preset_files(tmp_path):
+    current = presets.get_preset_key(presets.PRESETS['healthy_adult'])
+    stale = ['healthy_adult-v0-0123456789ab.csv.gz', 'healthy_adult-v0-0123456789ab.manifest.json',
+             'gradual_decline-v1-0123456789ab.123.tmp.csv.gz']
+    kept = [current + '.csv.gz', current + '.manifest.json', current + '.99.tmp.csv.gz', 'notes.txt', 'important.db',
+            'other_preset-v1-0123456789ab.csv.gz', 'healthy_adult-v1-0123456789ab.csv.gz.bak']
+    for name in stale + kept:
+        touch(tmp_path, name)
+    os.mkdir(os.path.join(tmp_path, 'healthy_adult-v0-0123456789ab.csv.gz.d'))
+
+    assert sorted(presets.prune_cache(str(tmp_path))) == sorted(stale)
+    assert sorted(os.listdir(tmp_path)) == sorted(kept + ['healthy_adult-v0-0123456789ab.csv.gz.d'])
+
+
+def test_build_preset_leaves_no_files_when_generation_fails(tmp_path, monkeypatch):
+    def fail(path, *args, **kwargs):
+        with open(path, 'w') as output:
+            output.write('partial')
+        raise RuntimeError('generation failed')
+
+    monkeypatch.setattr(presets, 'write_dataset', fail)
+    with pytest.raises(RuntimeError):
+        presets.build_preset(presets.PRESETS['healthy_adult'], str(tmp_path))
+    assert os.listdir(tmp_path) == []
+
+
+def test_build_preset_writes_data_and_manifest(tmp_path):
+    preset = presets.PRESETS['healthy_adult']
+    data_path = presets.build_preset(preset, str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path)
+                                                  for path in presets.get_preset_paths(preset, str(tmp_path)))
+    assert presets.build_preset(preset, str(tmp_path)) == data_path
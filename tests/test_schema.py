@@ -0,0 +1,78 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+import schema
+import util
+
+FEATURES = ['Gait_Speed', 'Knee_Flexion', 'Sitting_Adl', 'Turning_Speed']
+
+
+def get_config():
+    phases = util.build_phases()
+    config = util.default_config(phases)
+    config['Phase_1_frequency_per_day'] = 7
+    # Twenty years of readings, offsets past the int16 range
+    config['Phase_2_start_date'] = datetime.date(2024, 1, 1)
+    config['Phase_2_end_date'] = datetime.date(2044, 1, 1)
+    config['Phase_2_sampling'] = 'Poisson'
+    for phase_name in ['Phase_1', 'Phase_2']:
+        config[phase_name + '_Knee_Flexion_noise_model'] = 'Random walk'
+        config[phase_name + '_Knee_Flexion_noise'] = 0.3
+        config[phase_name + '_Turning_Speed_noise_model'] = 'AR'
+    return config, phases
+
+
+def test_compact_csv_round_trip(tmp_path):
+    config, phases = get_config()
+    include_phases = {'Phase_1', 'Phase_2'}
+    compact = schema.CompactSchema(config, FEATURES, include_phases)
+    assert compact.scales == {'Gait_Speed': None, 'Knee_Flexion': 100, 'Sitting_Adl': 10, 'Turning_Speed': 10}
+    path = str(tmp_path / 'data.csv')
+    util.write_dataset(path, config, set(FEATURES), include_phases, phases, include_dates=True, seed=4, schema=compact)
+    schema.write_schema(compact, str(tmp_path / 'data'))
+    expected = util.generate_dataset(config, set(FEATURES), include_phases, phases, include_dates=True, seed=4)
+
+    raw = pd.read_csv(path)
+    for feature_name, scale in compact.scales.items():
+        if scale is not None:
+            assert np.all(raw[feature_name] == raw[feature_name].round())
+            assert raw[feature_name].abs().max() <= schema.INT16_LIMIT
+    assert 2 ** 16 < raw['Time_Offset'].max() < 2 ** 31
+
+    decoded = schema.read_compact_csv(path, str(tmp_path / 'data.schema.json'))
+    assert len(decoded) == len(expected)
+    assert list(decoded['Phase'].astype(str).unique()) == ['Phase_1', 'Phase_2']
+    for feature_name, scale in compact.scales.items():
+        error = np.abs(decoded[feature_name].to_numpy() - expected[feature_name].to_numpy())
+        if scale is None:
+            np.testing.assert_allclose(decoded[feature_name], expected[feature_name], rtol=1e-6)
+        else:
+            assert error.max() <= 0.5 / scale * (1 + 1e-9)
+    # Offsets are whole seconds from the start of each row's phase
+    lag = (expected['Date'].to_numpy() - decoded['Date'].to_numpy()) / np.timedelta64(1, 's')
+    assert lag.min() >= 0 and lag.max() < 1
+
+
+def test_fixed_point_values_are_clipped():
+    config, _ = get_config()
+    compact = schema.CompactSchema(config, ['Knee_Flexion', 'Sitting_Adl'], {'Phase_1'})
+    frame = pd.DataFrame({'Knee_Flexion': [12.34, -12.34, 327.67, 400.0, -1e6],
+                          'Sitting_Adl': [1.25, 3276.7, 3276.8, 1e9, -5000.0]})
+    encoded = compact.encode('Phase_1', frame)
+    assert encoded['Knee_Flexion'].dtype == 'int16' and encoded['Sitting_Adl'].dtype == 'int16'
+    assert encoded['Knee_Flexion'].tolist() == [1234, -1234, 32767, 32767, -32767]
+    assert encoded['Sitting_Adl'].tolist() == [12, 32767, 32767, 32767, -32767]
+    decoded = compact.decode_frame(encoded)
+    np.testing.assert_array_equal(decoded['Knee_Flexion'], [12.34, -12.34, 327.67, 327.67, -327.67])
+
+
+def test_float32_when_the_range_does_not_fit():
+    config, _ = get_config()
+    config['Phase_1_Knee_Flexion_base_end'] = 400.0
+    compact = schema.CompactSchema(config, ['Knee_Flexion', 'Sitting_Adl'], {'Phase_1'})
+    assert compact.scales == {'Knee_Flexion': None, 'Sitting_Adl': 10}
+    encoded = compact.encode('Phase_1', pd.DataFrame({'Knee_Flexion': [390.125], 'Sitting_Adl': [4.0]}))
+    assert encoded['Knee_Flexion'].dtype == 'float32'
+    assert compact.decode_frame(encoded)['Knee_Flexion'].tolist() == [390.125]
@@ -0,0 +1,52 @@
+import datetime
+import pickle
+
+import pytest
+
+import settings
+import util
+
+
+def get_dataset():
+    phases = util.build_phases()
+    config = util.default_config(phases)
+    return util.build_dataset_settings(config, {'Gait_Speed', 'Cadence'}, {'Phase_1', 'Phase_3'}, include_dates=True)
+
+
+def test_fingerprint_cannot_be_passed_in():
+    with pytest.raises(TypeError):
+        settings.FeatureSettings('Gait_Speed', 0.6, 0.8, 'Linear', 'Nearest', 0.1, 'White', None, 'feedfeedfeedfeed')
+    with pytest.raises(TypeError):
+        settings.FeatureSettings('Gait_Speed', 0.6, 0.8, 'Linear', 'Nearest', 0.1, fingerprint='feedfeedfeedfeed')
+    with pytest.raises(TypeError):
+        settings.DatasetSettings((), (), False, 'feedfeedfeedfeed')
+
+
+def test_fingerprint_cannot_be_replaced():
+    dataset = get_dataset()
+    for value in [dataset, dataset.phases[0], dataset.phases[0].features[0]]:
+        with pytest.raises(TypeError):
+            value._replace(fingerprint='feedfeedfeedfeed')
+        with pytest.raises(AttributeError):
+            value.fingerprint = 'feedfeedfeedfeed'
+
+
+def test_replaced_values_get_their_fingerprint():
+    feature = settings.FeatureSettings('Gait_Speed', 0.6, 0.8, 'Linear', 'Nearest', 0.1)
+    noisier = feature._replace(noise=0.2)
+    assert noisier == settings.FeatureSettings('Gait_Speed', 0.6, 0.8, 'Linear', 'Nearest', 0.2)
+    assert noisier.fingerprint != feature.fingerprint
+    assert feature._replace(noise=0.1) == feature
+
+    phase = settings.PhaseSettings('Phase_1', datetime.date(2021, 1, 1), datetime.date(2021, 2, 1), 3,
+                                   features=[feature])
+    assert phase._replace(features=(noisier,)).fingerprint != phase.fingerprint
+    assert phase._replace(frequency_per_day=3.0) == phase
+    assert settings.PhaseSettings._make(tuple(phase)[:-1]) == phase
+
+
+def test_settings_round_trip_through_pickle():
+    dataset = get_dataset()
+    copy = pickle.loads(pickle.dumps(dataset))
+    assert copy == dataset and type(copy.phases[0].features[0]) is settings.FeatureSettings
+    assert settings.HASH_FUNCS[settings.DatasetSettings](copy) == dataset.fingerprint
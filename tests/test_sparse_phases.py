@@ -0,0 +1,52 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import util
+
+TRENDS = ['Nearest', 'Linear', 'Cubic', 'Quadratic']
+
+
+def get_short_phase_config(days, frequency, sampling='Regular', wear_probability=1.0):
+    phases = util.build_phases()
+    config = util.default_config(phases)
+    config['Phase_1_end_date'] = config['Phase_1_start_date'] + datetime.timedelta(days=days)
+    config['Phase_1_frequency_per_day'] = frequency
+    config['Phase_1_sampling'] = sampling
+    config['Phase_1_wear_probability'] = wear_probability
+    for feature_name in phases[0].feature_dic:
+        config['Phase_1_' + feature_name + '_noise'] = 0.5
+    return config, phases[0]
+
+
+@pytest.mark.parametrize('trend', TRENDS)
+@pytest.mark.parametrize('noise_model', ['White', 'AR', 'Random walk'])
+def test_one_row_phase(trend, noise_model):
+    config, phase = get_short_phase_config(1, 1)
+    config['Phase_1_Gait_Speed_trend'] = trend
+    config['Phase_1_Gait_Speed_noise_model'] = noise_model
+    for kwargs in ({}, {'seed': 3}, {'rng': np.random.default_rng(3)}):
+        frame = util.generate_phase(config, phase, {'Gait_Speed'}, include_dates=True, **kwargs)
+        assert len(frame) == 1
+        assert np.isfinite(frame['Gait_Speed']).all()
+
+
+@pytest.mark.parametrize('trend', TRENDS)
+@pytest.mark.parametrize('rows', [1, 2, 3])
+def test_few_irregular_readings(trend, rows):
+    positions = np.sort(np.random.default_rng(rows).random(rows))
+    xfine, values = util.generate_feature_values(1.0, 2.0, 'Linear', trend, 0.5, rows, positions=positions)
+    assert len(values) == rows
+    assert np.isfinite(values).all()
+
+
+@pytest.mark.parametrize('sampling', ['Poisson', 'Wear mask'])
+def test_sparse_phase_with_low_wear(sampling):
+    config, phase = get_short_phase_config(2, 2, sampling=sampling, wear_probability=0.3)
+    for feature_name in phase.feature_dic:
+        config['Phase_1_' + feature_name + '_trend'] = 'Cubic'
+    for seed in range(20):
+        frame = util.generate_phase(config, phase, set(phase.feature_dic), include_dates=True, seed=seed)
+        assert len(frame) == util.get_phase_row_count(config, phase, seed=seed)
+        assert np.isfinite(frame.drop(columns='Date').to_numpy()).all()
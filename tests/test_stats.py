@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import stats
+import util
+
+
+def get_reference(values, low, high):
+    # One-shot numpy statistics of the whole series
+    head, tail = values[:-1], values[1:]
+    covariance = np.mean((head - head.mean()) * (tail - tail.mean()))
+    return {
+        'count': len(values),
+        'mean': values.mean(),
+        'std': values.std(ddof=1),
+        'min': values.min(),
+        'max': values.max(),
+        'lag1_autocorrelation': covariance / values.var(),
+        'counts': np.histogram(values, bins=np.linspace(low, high, stats.HISTOGRAM_BINS + 1))[0].tolist(),
+        'underflow': int((values < low).sum()),
+        'overflow': int((values > high).sum()),
+    }
+
+
+def check_stats(result, reference):
+    for key in ['mean', 'std', 'min', 'max', 'lag1_autocorrelation']:
+        assert result[key] == pytest.approx(reference[key], rel=1e-9, abs=1e-9), key
+    assert result['count'] == reference['count']
+    assert result['histogram']['counts'] == reference['counts']
+    assert result['histogram']['underflow'] == reference['underflow']
+    assert result['histogram']['overflow'] == reference['overflow']
+    assert sum(reference['counts']) + reference['underflow'] + reference['overflow'] == reference['count']
+
+
+@pytest.mark.parametrize('chunk_sizes', [[5000], [1] * 50 + [4950], [1234, 1, 2, 3763], [17] * 294 + [2]])
+@pytest.mark.parametrize('offset', [0.0, 1e6])
+def test_chunks_match_one_shot(chunk_sizes, offset):
+    # AR(1) readings far from zero, with tails past both ends of the histogram range
+    rng = np.random.RandomState(8)
+    values = np.empty(5000)
+    values[0] = rng.normal()
+    for index in range(1, len(values)):
+        values[index] = 0.7 * values[index - 1] + rng.normal()
+    values = values * 2 + offset
+    low, high = offset - 4, offset + 4
+    feature_stats = stats.FeatureStats(low, high)
+    for chunk in np.split(values, np.cumsum(chunk_sizes)[:-1]):
+        feature_stats.update(chunk)
+    reference = get_reference(values, low, high)
+    assert reference['underflow'] > 0 and reference['overflow'] > 0
+    check_stats(feature_stats.to_dict(), reference)
+
+
+def test_empty_chunks_are_ignored():
+    feature_stats = stats.FeatureStats(0, 1)
+    feature_stats.update([])
+    feature_stats.update([0.5])
+    feature_stats.update([])
+    result = feature_stats.to_dict()
+    assert result['count'] == 1 and result['std'] == 0.0 and result['lag1_autocorrelation'] == 0.0
+
+
+def test_report_of_chunked_export_matches_data(tmp_path):
+    phases = util.build_phases()
+    config = util.default_config(phases)
+    config['Phase_1_frequency_per_day'] = 24
+    config['Phase_1_Gait_Speed_noise_model'] = 'AR'
+    config['Phase_1_Step_Length_noise_model'] = 'Random walk'
+    features = {'Gait_Speed', 'Step_Length', 'Tug_Score'}
+    report = stats.StreamingReport()
+    util.write_dataset(str(tmp_path / 'data.csv'), config, features, {'Phase_1'}, phases, seed=2, report=report,
+                       chunk_rows=101)
+    data = util.generate_dataset(config, features, {'Phase_1'}, phases, seed=2)
+    result = report.to_dict()
+    assert set(result) == {'Phase_1'} and set(result['Phase_1']) == features
+    for feature_name in features:
+        histogram = result['Phase_1'][feature_name]['histogram']
+        reference = get_reference(data[feature_name].to_numpy(), histogram['edges'][0], histogram['edges'][-1])
+        check_stats(result['Phase_1'][feature_name], reference)
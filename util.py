@@ -1,425 +1,653 @@
 import streamlit as st
 import numpy as np
 import scipy.interpolate
+import scipy.stats
 import datetime
+import functools
+import gzip
 import pandas as pd
 import plotly.express as px
 
+from counter_rng import (CONTROL_STREAM, DAY_SAMPLING_STREAM, ROW_STREAM, FeatureStream, get_sampling_rng,
+                         keyed_uniform, stream_normals)
+from features import FEATURE_CATALOG, FEATURE_SPECS, get_feature_label
+from noise_models import (DEFAULT_COEFFICIENTS, NOISE_MODELS, STATEFUL_MODELS, continue_phase_noise, get_noise_spread,
+                          get_noise_state, get_phase_noise)
+from settings import HASH_FUNCS, DatasetSettings, FeatureSettings, PhaseSettings
+from stats import get_expected_range
+
+PHASE_NAMES = ['Phase_1', 'Phase_2', 'Phase_3', 'Phase_4', 'Phase_5']
+SAMPLING_MODELS = ['Regular', 'Poisson', 'Wear mask']
+DEFAULT_START_DATE = datetime.date(2021, 9, 21)
+DEFAULT_END_DATE = datetime.date(2021, 10, 21)
+
+
+def get_total_data_points(start, end, freq):
+    return ((end - start) * freq).days
+
+
+@functools.lru_cache(maxsize=32)
+def get_date_data(start, end, freq):
+    result = pd.date_range(start, end, closed='left').to_numpy(dtype='datetime64[D]')
+    result = np.repeat(result, freq)
+    result.flags.writeable = False
+    return result
+
+
+def get_initial_space_len(total_points):
+    # The len of the values that are generated using numpy
+    if (total_points // 10) < 10:
+        return total_points
+    return total_points // 10
+
+
+def get_linspace_slice(start, stop, num, first, last):
+    # np.linspace(start, stop, num)[first:last], the same values without the rest of the grid
+    div = num - 1
+    values = np.arange(first, last, dtype='float64')
+    if div > 0 and (stop - start) / div != 0:
+        values = values * ((stop - start) / div)
+    elif div > 0:
+        values = values / div * (stop - start)
+    else:
+        values = values * (stop - start)
+    values = values + start
+    if num > 1 and last == num and last > first:
+        values[-1] = stop
+    return values
+
+
+def get_control_points(start, end, space, initial_space_len, first=0, last=None):
+    # Coarse control points first..last of the feature before noise is added
+    last = initial_space_len if last is None else last
+    if space == 'Linear':
+        return get_linspace_slice(start, end, initial_space_len, first, last)
+    if space == 'Geometric':
+        # As np.geomspace, through the logarithms with the end points kept exact
+        if start == 0 or end == 0:
+            raise ValueError('Geometric sequence cannot include zero')
+        sign = -1.0 if start < 0 and end < 0 else 1.0
+        y = np.power(10.0, get_linspace_slice(np.log10(sign * start), np.log10(sign * end), initial_space_len,
+                                              first, last))
+        if first == 0 and last > 0:
+            y[0] = sign * start
+        if initial_space_len > 1 and last == initial_space_len and last > first:
+            y[-1] = sign * end
+        return sign * y
+    return np.full(last - first, start, dtype='float64')
+
+
+def get_grid_positions(initial_space_len, total_points, first, last):
+    # Control grid positions of the rows first..last of the dense regular grid over the control points
+    return get_linspace_slice(0, initial_space_len, total_points, first, last)
+
+
+def get_sample_times(start, end, freq, sampling, wear_probability, rng=np.random):
+    # Observed sample times in days since the phase start, only worn days are sampled
+    days = (end - start).days
+    worn_days = np.arange(days)
+    if wear_probability < 1:
+        worn_days = worn_days[rng.random(days) < wear_probability]
+    if sampling == 'Poisson':
+        # Poisson process with freq readings per worn day on average
+        count = rng.poisson(freq * len(worn_days))
+        return np.sort(rng.choice(worn_days, count) + rng.random(count)) if count else np.array([])
+    return (worn_days[:, np.newaxis] + np.arange(freq) / freq).ravel()
+
+
+def get_day_sample_times(first_day, last_day, freq, sampling, wear_probability, seed, phase=0, patient=0):
+    # Sample times of the days first_day..last_day after the phase start, every day is drawn from counter based
+    # streams keyed by its index, so any range of days gets the same readings however the days are split
+    days = np.arange(first_day, last_day)
+    wear, count = keyed_uniform(seed, DAY_SAMPLING_STREAM, days, 0, phase, patient)
+    if wear_probability < 1:
+        days, count = days[wear < wear_probability], count[wear < wear_probability]
+    if sampling != 'Poisson':
+        return (days[:, np.newaxis] + np.arange(freq) / freq).ravel()
+    # Poisson counts by inversion, then uniform times within the day numbered from 1 so they are not the day draws
+    counts = scipy.stats.poisson.ppf(count, freq).astype('int64')
+    sample_days = np.repeat(days, counts)
+    within_day = np.arange(len(sample_days)) - np.repeat(np.cumsum(counts) - counts, counts)
+    times = sample_days + keyed_uniform(seed, DAY_SAMPLING_STREAM, sample_days, within_day + 1, phase, patient)[0]
+    return np.sort(times)
+
+
+def get_sample_dates(start, times):
+    return np.datetime64(start, 's') + np.round(times * 86400).astype('timedelta64[s]')
+
+
+TREND_KINDS = {'Nearest': 'nearest', 'Linear': 'linear', 'Cubic': 'cubic'}
+# Control points a spline needs, with fewer the next lower order is used
+SPLINE_POINTS = {'cubic': 4, 'quadratic': 3, 'linear': 2, 'nearest': 2}
+LOWER_KINDS = {'cubic': 'quadratic', 'quadratic': 'linear'}
+
+
+def interpolate_trend(x, y, kind, xfine):
+    # Rows of y interpolated at xfine, short phases (e.g. a few worn days) fall back to a lower order
+    # and a single control point is held constant
+    if len(x) < 2:
+        return np.repeat(y[..., :1], len(xfine), axis=-1)
+    while len(x) < SPLINE_POINTS[kind]:
+        kind = LOWER_KINDS[kind]
+    return scipy.interpolate.interp1d(x, y, kind=kind)(xfine)
+
+
+# Control segments a spline is fitted on at once and control points added on each side, so the rows of any range are
+# interpolated from the control points around them, with the same values as in the whole phase or extension
+SPLINE_BLOCK_SEGMENTS = 1024
+SPLINE_BLOCK_MARGIN = 16
+
+
+def get_spline_windows(xfine, step, last_index=None):
+    # (first, last control point, rows) of the blocks of control segments the sorted positions xfine fall in
+    if len(xfine) == 0:
+        return []
+    blocks = np.floor(xfine / step).astype('int64') // SPLINE_BLOCK_SEGMENTS
+    bounds = np.flatnonzero(np.diff(blocks)) + 1
+    windows = []
+    for first, last in zip(np.r_[0, bounds], np.r_[bounds, len(xfine)]):
+        low = max(blocks[first] * SPLINE_BLOCK_SEGMENTS - SPLINE_BLOCK_MARGIN, 0)
+        high = (blocks[first] + 1) * SPLINE_BLOCK_SEGMENTS + SPLINE_BLOCK_MARGIN
+        windows.append((int(low), int(high if last_index is None else min(high, last_index)), slice(first, last)))
+    return windows
+
+
+def get_reading_days(total_points, phase_days, positions, first, last):
+    # Times in days of the readings first to last, on the regular grid without positions
+    if positions is None:
+        return np.arange(first, last) * phase_days / max(total_points, 1)
+    return np.asarray(positions[first:last]) * phase_days
+
+
+def generate_features_values(features, total_points, rng=np.random, positions=None, streams=None, rows=None,
+                             phase_days=None, first_weekday=0, noise_state=None):
+    # One row of values per FeatureSettings, the trends of all features of a phase are built and interpolated together
+    # positions are sample times as fractions of the phase, the dense regular grid is used without them
+    # With counter based streams (one per feature), rows is a (first, last) range matching the same rows of the full run
+    # White noise perturbs the control points, the other noise models (see noise_models.py) every reading
+    # noise_state maps feature names to (next row, last day, state) of their noise, updated after every range, so
+    # consecutive ranges continue the noise instead of generating it again from the first row of the phase
+    # Only the rows of the range and the control points around them are built, so a range costs its own rows
+    if positions is None:
+        initial_space_len = get_initial_space_len(total_points)
+        first_row, last_row = rows if rows is not None else (0, total_points)
+        xfine = get_grid_positions(initial_space_len, total_points, first_row, last_row)
+    elif len(positions) == 0:
+        return np.array([]), np.empty((len(features), 0))
+    else:
+        initial_space_len = get_initial_space_len(len(positions))
+        first_row, last_row = rows if rows is not None else (0, len(positions))
+        xfine = np.asarray(positions[first_row:last_row]) * initial_space_len
+    windows = get_spline_windows(xfine, initial_space_len / max(initial_space_len - 1, 1), initial_space_len - 1)
+    low, high = (windows[0][0], windows[-1][1]) if windows else (0, -1)
+    y = np.array([get_control_points(feature.base_start, feature.base_end, feature.space, initial_space_len, low,
+                                     high + 1) for feature in features]).reshape(len(features), high + 1 - low)
+    kinds = [TREND_KINDS.get(feature.trend, 'quadratic') for feature in features]
+    white = [index for index, feature in enumerate(features) if feature.noise != 0 and feature.noise_model == 'White']
+    quadratic = [index for index, kind in enumerate(kinds) if kind == 'quadratic']
+    modelled = [index for index, feature in enumerate(features) if feature.noise != 0 and feature.noise_model != 'White']
+    extra_noise = np.zeros((len(features), len(xfine)))
+    model_noise = np.zeros((len(features), len(xfine)))
+    if modelled:
+        # Reading times in days of the rows generated
+        phase_days = phase_days or total_points
+        days = get_reading_days(total_points, phase_days, positions, first_row, first_row + len(xfine))
+
+    # Counter based noise of all features is drawn in one call per stream
+    if streams is not None and white:
+        noise = np.array([features[index].noise for index in white])[:, np.newaxis]
+        y[white] = y[white] + noise * stream_normals([streams[index] for index in white], CONTROL_STREAM, low,
+                                                     high + 1)
+    if streams is not None and quadratic:
+        spread = np.array([(abs(features[index].base_start - features[index].base_end)) / 2
+                           for index in quadratic])[:, np.newaxis]
+        extra_noise[quadratic] = spread * stream_normals([streams[index] for index in quadratic], ROW_STREAM,
+                                                         first_row, first_row + len(xfine))
+    # Draws from rng keep their order, one feature after the other
+    for index, feature in enumerate(features):
+        if streams is None and index in white:
+            y[index] = y[index] + rng.normal(0, feature.noise, initial_space_len)[low:high + 1]
+        if streams is None and index in quadratic:
+            extra_noise[index] = rng.normal(0, (abs(feature.base_start - feature.base_end)) / 2, len(xfine))
+        if index not in modelled:
+            continue
+        carried = noise_state.get(feature.name) if noise_state is not None and streams is not None else None
+        if streams is not None and feature.noise_model not in STATEFUL_MODELS:
+            # Nothing to carry, any range is generated on its own
+            carried = (first_row, 0.0, [])
+        if carried is not None and carried[0] == first_row:
+            unit_noise, state = continue_phase_noise(
+                feature.noise_model, days, carried[1], phase_days, first_row, coefficients=feature.coefficients,
+                first_weekday=first_weekday, stream=streams[index], state=carried[2])
+        else:
+            # Generated again from the first row of the phase
+            unit_noise = get_phase_noise(
+                feature.noise_model, get_reading_days(total_points, phase_days, positions, 0, first_row + len(xfine)),
+                phase_days, first_row=first_row, coefficients=feature.coefficients,
+                first_weekday=first_weekday, rng=rng, stream=streams[index] if streams is not None else None)
+            # The state is known when the range starts at the first row
+            state = get_noise_state(feature.noise_model, unit_noise, feature.coefficients) if first_row == 0 else None
+        if noise_state is not None and streams is not None and state is not None and len(days):
+            noise_state[feature.name] = (first_row + len(days), float(days[-1]), state)
+        model_noise[index] = feature.noise * unit_noise
+
+    # One interpolation per spline window and trend kind over the rows of all its features
+    values = np.empty((len(features), len(xfine)))
+    for window_low, window_high, window_rows in windows:
+        x = get_linspace_slice(0, initial_space_len, initial_space_len, window_low, window_high + 1)
+        for kind in set(kinds):
+            group = [index for index, feature_kind in enumerate(kinds) if feature_kind == kind]
+            values[group, window_rows] = interpolate_trend(x, y[group, window_low - low:window_high + 1 - low], kind,
+                                                           xfine[window_rows])
+    if quadratic:
+        values[quadratic] = values[quadratic] + extra_noise[quadratic]
+    if modelled:
+        values[modelled] = values[modelled] + model_noise[modelled]
+    return xfine, values
+
+
+def generate_feature_values(start, end, space, trend, noise, total_points, rng=np.random, positions=None,
+                            stream=None, rows=None, noise_model='White', coefficients=None, phase_days=None,
+                            first_weekday=0):
+    # A single feature, see generate_features_values
+    feature = FeatureSettings('', start, end, space, trend, noise, noise_model, coefficients)
+    xfine, values = generate_features_values([feature], total_points, rng=rng, positions=positions,
+                                             streams=[stream] if stream is not None else None, rows=rows,
+                                             phase_days=phase_days, first_weekday=first_weekday)
+    return xfine, values[0]
+
+
+def get_control_values(start, end, space, initial_space_len, indices):
+    # Control points at any index, past the last one of the phase they continue the trend in its space
+    fraction = np.asarray(indices, dtype='float64') / max(initial_space_len - 1, 1)
+    if space == 'Linear':
+        return start + (end - start) * fraction
+    if space == 'Geometric':
+        return start * (end / start) ** fraction
+    return np.full(len(fraction), start, dtype='float64')
+
+
+def extend_feature_values(start, end, space, trend, noise, initial_space_len, x, first_row, stream, days,
+                          noise_model='White', coefficients=None, last_day=0, phase_days=1, first_weekday=0,
+                          noise_state=None):
+    # Readings at control grid positions x past the end of a seeded phase, continuing its rows from first_row
+    # The control points and noise keep their counter indices, so the values join the earlier rows seamlessly
+    # Splines are fitted per spline window (see get_spline_windows), so a reading does not depend on how the
+    # extension is split into days or blocks of rows
+    if len(x) == 0:
+        return np.array([]), noise_state
+    step = initial_space_len / max(initial_space_len - 1, 1)
+    kind = TREND_KINDS.get(trend, 'quadratic')
+    y = np.empty(len(x))
+    for low, high, window_rows in get_spline_windows(x, step):
+        control = get_control_values(start, end, space, initial_space_len, np.arange(low, high + 1))
+        if noise != 0 and noise_model == 'White':
+            control = control + noise * stream.normal(CONTROL_STREAM, low, high + 1)
+        y[window_rows] = interpolate_trend(np.arange(low, high + 1) * step, control, kind, x[window_rows])
+
+    if kind == 'quadratic':
+        y = y + (abs(start - end)) / 2 * stream.normal(ROW_STREAM, first_row, first_row + len(x))
+
+    if noise != 0 and noise_model != 'White':
+        model_noise, noise_state = continue_phase_noise(noise_model, days, last_day, phase_days, first_row,
+                                                        coefficients=coefficients, first_weekday=first_weekday,
+                                                        stream=stream, state=noise_state)
+        y = y + noise * model_noise
+    return y, noise_state
+
+
+def get_feature_stream(feature):
+    # Noise without a seed is keyed by the feature settings, so a feature's values only change with its own settings
+    return FeatureStream(int(feature.fingerprint, 16))
+
+
+@st.cache(hash_funcs=HASH_FUNCS)
+def get_feature_data(feature, total_points, phase_days=None, first_weekday=0):
+    # Keyed by the fingerprint of the feature settings and the grid of its phase
+    xfine, values = generate_features_values([feature], total_points, streams=[get_feature_stream(feature)],
+                                             phase_days=phase_days, first_weekday=first_weekday)
+    return xfine, values[0]
+
+
+@st.cache(hash_funcs=HASH_FUNCS, allow_output_mutation=True, show_spinner=False)
+def get_feature_figure(feature, total_points, phase_days=None, first_weekday=0):
+    # Only charts whose settings changed are rebuilt on a rerun
+    feature_data = get_feature_data(feature, total_points, phase_days, first_weekday)
+    return px.line(x=feature_data[0], y=feature_data[1], title=feature.name.replace('_', ' ') + ' Data')
+
+
 class Phase:
-    def __init__(self, name, feature_dic={}):
+    def __init__(self, name, feature_dic=None):
         self.name = name
-        self.feature_dic = feature_dic
+        # A new dict per phase, phases must not share their features
+        self.feature_dic = feature_dic if feature_dic is not None else {}
 
     def add_feature(self, feature):
         self.feature_dic[str(feature)] = feature
 
     def add_features(self, feature_dic):
         self.feature_dic = feature_dic
-    @st.cache
     def get_total_data_points(self, start, end, freq):
-        return ((end - start) * freq).days
+        return get_total_data_points(start, end, freq)
 
-    @st.cache
     def get_date_data(self, start, end, freq):
-        result = pd.date_range(start, end, closed='left').to_numpy(dtype='datetime64[D]')
-        result = np.repeat(result, freq)        
-        return result
+        return get_date_data(start, end, freq)
 
     def render_config(self):
         start_date = st.sidebar.date_input(
-                "Phase Start date", datetime.date(2021, 9, 21), min_value=datetime.date(2000, 1, 1), key=self.name + '_start_date'
+                "Phase Start date", DEFAULT_START_DATE, min_value=datetime.date(2000, 1, 1), key=self.name + '_start_date'
             )
         end_date = st.sidebar.date_input(
-                "Phase End date", datetime.date(2021, 10, 21), min_value=start_date, key=self.name+'_end_date'
+                "Phase End date", DEFAULT_END_DATE, min_value=start_date, key=self.name+'_end_date'
             )
         frequency_per_day = st.sidebar.number_input("Frequency per day", value=1, format="%d", key=self.name + '_frequency_per_day')
+        sampling = st.sidebar.selectbox("Sampling", SAMPLING_MODELS, key=self.name + '_sampling',
+                                        help="Regular: frequency per day readings every day, Poisson: readings at random times "
+                                             "with frequency per day on average, Wear mask: regular readings on worn days only")
+        if sampling != 'Regular':
+            st.sidebar.slider("Wear probability per day", min_value=0.0, max_value=1.0, value=1.0, step=0.05,
+                              key=self.name + '_wear_probability')
    
     def __str__(self):
         return self.name
 
 
-class BaseFeature:
-    def render(self, total_data_points, phase_name):
-        pass
-    
-    @st.cache
-    def get_feature_data(self, start, end, space, trend, noise, total_points):
-    
-        # The len of the values that are generated using numpy
-        if (total_points // 10) < 10:
-            initial_space_len =  total_points
-        else:
-            initial_space_len =  total_points // 10
-
-        # Create Random noise distribution, where std selected by user
-        if noise != 0:
-            noise = np.random.normal(0, noise, initial_space_len)
-
-        if space == 'Linear':
-            y = np.linspace(start, end, initial_space_len) + noise
-        elif space == 'Geometric':
-            y = np.geomspace(start, end, initial_space_len) + noise
-        else:
-            y = np.full(initial_space_len, start) + noise
-
-        x = np.linspace(0, initial_space_len, initial_space_len)
-        
-        #use finer and regular mesh for plot
-        xfine = np.linspace(0, initial_space_len, total_points)
-
-        if trend == 'Nearest':
-            #interpolate with piecewise nearest function (p=0)
-            y = (scipy.interpolate.interp1d(x, y, kind='nearest')(xfine))  
-        elif trend == 'Linear':
-            #interpolate with piecewise linear func (p=1)
-            y = (scipy.interpolate.interp1d(x, y, kind='linear')(xfine)) 
-        elif trend == 'Cubic':
-            #interpolate with piecewise cubic func (p=2)
-            y = (scipy.interpolate.interp1d(x, y, kind='cubic')(xfine)) 
-        else:    
-            #interpolate with piecewise qudratic func (p=2) with additional noise
-            y = (scipy.interpolate.interp1d(x, y, kind='quadratic')(xfine)) + np.random.normal(0, (abs(start - end)) / 2, total_points)
-
-        return xfine, y    
-
-
-class GaitFeature(BaseFeature):
-    def __init__(self, start_default=0.6, end_default=0.8, noise_min=0.0, noise_max=1.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
+class Feature:
+    """A feature of a phase, rendered from its spec in the catalog (see features.py)."""
+
+    def __init__(self, spec):
+        self.spec = spec
+
+    def render(self, phase):
+        # The settings are edited in a form, so the app reruns once per submit instead of once per widget change
+        # phase is the PhaseSettings of the phase being configured
+        feature_name = self.spec.name
+        phase_name = phase.name
+        total_data_points = get_total_data_points(phase.start_date, phase.end_date, phase.frequency_per_day)
+        with st.expander(get_feature_label(self.spec)):
+            with st.form(key=phase_name+'_'+feature_name+'_form'):
+                st.caption(self.spec.description)
+                feature_start_base = st.number_input("Feature Base start value", value=self.spec.start_default,
+                                                     min_value=self.spec.valid_min, max_value=self.spec.valid_max,
+                                                     format="%f", key=phase_name+'_'+feature_name+'_base_start')
+                feature_end_base = st.number_input("Feature Base end value", value=self.spec.end_default,
+                                                   min_value=self.spec.valid_min, max_value=self.spec.valid_max,
+                                                   format="%f", key=phase_name+'_'+feature_name+'_base_end')
+                feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'],
+                                        key=phase_name+'_'+feature_name+'_space')
+                feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
+                                         key=phase_name+'_'+feature_name+'_trend')
+                feature_noise = st.slider('Select Noise to add', min_value=self.spec.noise_min,
+                                          max_value=self.spec.noise_max, value=self.spec.noise_default,
+                                          step=self.spec.noise_step, key=phase_name+'_'+feature_name+'_noise')
+                noise_model = st.selectbox('Select noise model', NOISE_MODELS, key=phase_name+'_'+feature_name+'_noise_model',
+                                           help="White: noise on the trend control points, AR: autocorrelated readings, "
+                                                "Random walk: day to day drift, Heteroscedastic: noise growing through "
+                                                "the phase, Weekly: a repeating offset per weekday")
+                coefficients = st.text_input('AR coefficients', value=DEFAULT_COEFFICIENTS,
+                                             key=phase_name+'_'+feature_name+'_noise_coefficients',
+                                             help="Comma separated a1, ..., ap of the AR noise model")
+                st.form_submit_button('✅ Apply')
+            feature = FeatureSettings(feature_name, feature_start_base, feature_end_base, feature_space,
+                                      feature_trend, feature_noise, noise_model, coefficients)
             if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
                 with st.spinner('Processing feature ....'):
                     if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=['Gait_Speed'], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df['Gait_Speed'], title='Gait Speed Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
+                        phase_days = (phase.end_date - phase.start_date).days
+                        try:
+                            st.plotly_chart(get_feature_figure(feature, total_data_points, phase_days,
+                                                               phase.start_date.weekday()),
+                                            render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
+                        except ValueError as error:
+                            st.error(f'⚠️ {error}')
                     else:
                         st.warning('Number of data points not specified')
-    
-    def __str__(self):
-        return 'Gait_Speed'
-
-
-class StepLengthFeature(BaseFeature):
-    def __init__(self, start_default=36.4, end_default=114.6, noise_min=0.0, noise_max=5.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
-            if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
-                with st.spinner('Processing feature ....'):
-                    if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=['Step_Length'], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df['Step_Length'], title='Step Length Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
-                    else:
-                        st.warning('Number of data points not specified')
-    
-    def __str__(self):
-        return 'Step_Length'
-
-
-class StepWidthFeature(BaseFeature):
-    def __init__(self, start_default=1.6, end_default=14.6, noise_min=0.0, noise_max=3.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
-            if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
-                with st.spinner('Processing feature ....'):
-                    if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=[self.__str__()], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df[self.__str__()], title='Step Width Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
-                    else:
-                        st.warning('Number of data points not specified')
-    
-    def __str__(self):
-        return 'Step_Width'
-
-
-class TugScoreFeature(BaseFeature):
-    def __init__(self, start_default=8.0, end_default=13.5, noise_min=0.0, noise_max=3.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
-            if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
-                with st.spinner('Processing feature ....'):
-                    if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=[self.__str__()], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df[self.__str__()], title='Tug Score Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
-                    else:
-                        st.warning('Number of data points not specified')
-    
-    def __str__(self):
-        return 'Tug_Score'
-
-
-class CadenceFeature(BaseFeature):
-    def __init__(self, start_default=0.0, end_default=1.0, noise_min=0.0, noise_max=1.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
-            if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
-                with st.spinner('Processing feature ....'):
-                    if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=[self.__str__()], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df[self.__str__()], title='Cadence Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
-                    else:
-                        st.warning('Number of data points not specified')
-    
-    def __str__(self):
-        return 'Cadence'
-
-
-class KneeFlexionFeature(BaseFeature):
-    def __init__(self, start_default=20.0, end_default=35.0, noise_min=0.0, noise_max=3.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
-            if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
-                with st.spinner('Processing feature ....'):
-                    if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=[self.__str__()], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df[self.__str__()], title='Knee Flexion Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
-                    else:
-                        st.warning('Number of data points not specified')
-    
-    def __str__(self):
-        return 'Knee_Flexion'
-
-
-class SittingAdlFeature(BaseFeature):
-    def __init__(self, start_default=2.0, end_default=10.0, noise_min=0.0, noise_max=5.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
-            if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
-                with st.spinner('Processing feature ....'):
-                    if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=[self.__str__()], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df[self.__str__()], title='Sitting Adl Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
-                    else:
-                        st.warning('Number of data points not specified')
-    
-    def __str__(self):
-        return 'Sitting_Adl'
-
-
-class LyingAdlFeature(BaseFeature):
-    def __init__(self, start_default=0.0, end_default=1.0, noise_min=0.0, noise_max=3.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
-            if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
-                with st.spinner('Processing feature ....'):
-                    if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=[self.__str__()], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df[self.__str__()], title='Lying Adl Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
-                    else:
-                        st.warning('Number of data points not specified')
-    
-    def __str__(self):
-        return 'Lying_Adl'
-
-
-class ActiveHoursFeature(BaseFeature):
-    def __init__(self, start_default=0.25, end_default=1.0, noise_min=0.0, noise_max=3.0, noise_step=0.05, noise_default=0.0):
-        self.start_default = start_default
-        self.end_default = end_default
-        self.noise_min = noise_min
-        self.noise_max = noise_max
-        self.noise_step = noise_step
-        self.noise_default = noise_default
-
-    def render(self, total_data_points, phase_name):
-        feature_name = self.__str__()
-        with st.expander(feature_name):
-            feature_start_base = st.number_input("Feature Base start value", value=self.start_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_start')
-            feature_end_base = st.number_input("Feature Base end value", value=self.end_default, 
-                                                format="%f", key=phase_name+'_'+feature_name+'_base_end')
-            feature_space = st.radio('Select feature space', ['Linear', 'Geometric', 'Constant'], 
-                                    key=phase_name+'_'+feature_name+'_space')
-            feature_trend = st.radio('Select feature trend', ['Nearest', 'Linear', 'Cubic', 'Quadratic'],
-                                     key=phase_name+'_'+feature_name+'_trend')
-            feature_noise = st.slider('Select Noise to add', min_value=self.noise_min, max_value=self.noise_max, 
-                                            value=self.noise_default, step=self.noise_step, 
-                                            key=phase_name+'_'+feature_name+'_noise')
-            if st.checkbox("📈 Visualise Data", key=phase_name+'_'+feature_name+'_visualise'):
-                with st.spinner('Processing feature ....'):
-                    if total_data_points > 0:
-                        feature_data = self.get_feature_data(feature_start_base, feature_end_base, feature_space, 
-                                                feature_trend, feature_noise, total_data_points)
-                        feature_data_df = pd.DataFrame( feature_data[1], columns=[self.__str__()], index=feature_data[0], dtype='float64')
-                        st.plotly_chart(px.line(x=list(feature_data_df.index), y=feature_data_df[self.__str__()], title='Active Hours Data'),
-                                        render_mode='auto', use_container_width=True, key=phase_name+'_'+feature_name+'_visualiser')
-                    else:
-                        st.warning('Number of data points not specified')
-    
+
     def __str__(self):
-        return 'Active_Hours'
+        return self.spec.name
+
+
+FEATURE_NAMES = [spec.name for spec in FEATURE_CATALOG]
+
+
+def build_phases():
+    phases = []
+    for phase_name in PHASE_NAMES:
+        phase = Phase(phase_name)
+        phase.add_features({spec.name: Feature(spec) for spec in FEATURE_CATALOG})
+        phases.append(phase)
+    return phases
+
+
+def get_feature_defaults(phase_name, feature_name):
+    # Same keys and values the feature widgets start with
+    spec = FEATURE_SPECS[feature_name]
+    prefix = phase_name + '_' + feature_name
+    return {
+        prefix + '_base_start': spec.start_default,
+        prefix + '_base_end': spec.end_default,
+        prefix + '_space': 'Linear',
+        prefix + '_trend': 'Nearest',
+        prefix + '_noise': spec.noise_default,
+        prefix + '_noise_model': 'White',
+        prefix + '_noise_coefficients': DEFAULT_COEFFICIENTS,
+    }
+
+
+def default_config(phases):
+    # Same keys and values the sidebar and feature widgets start with
+    config = {}
+    for phase in phases:
+        config[phase.name + '_start_date'] = DEFAULT_START_DATE
+        config[phase.name + '_end_date'] = DEFAULT_END_DATE
+        config[phase.name + '_frequency_per_day'] = 1
+        config[phase.name + '_sampling'] = 'Regular'
+        config[phase.name + '_wear_probability'] = 1.0
+        for feature_name in phase.feature_dic:
+            config.update(get_feature_defaults(phase.name, feature_name))
+    return config
+
+
+def with_feature_defaults(config, include_phases, include_features):
+    # Feature widgets are only rendered once the feature is included, until then it has their defaults
+    result = {}
+    for phase_name in include_phases:
+        for feature_name in include_features:
+            result.update(get_feature_defaults(phase_name, feature_name))
+    result.update(config)
+    return result
+
+
+def clip_to_widgets(config, phases):
+    # Values set through session_state must be within the ranges of their widgets
+    result = dict(config)
+    for phase in phases:
+        for feature_name, feature in phase.feature_dic.items():
+            spec = feature.spec
+            prefix = phase.name + '_' + feature_name
+            if prefix + '_noise' in result:
+                noise = round(result[prefix + '_noise'] / spec.noise_step) * spec.noise_step
+                result[prefix + '_noise'] = float(min(max(noise, spec.noise_min), spec.noise_max))
+            for key in (prefix + '_base_start', prefix + '_base_end'):
+                if key in result and spec.valid_min is not None:
+                    result[key] = float(max(result[key], spec.valid_min))
+                if key in result and spec.valid_max is not None:
+                    result[key] = float(min(result[key], spec.valid_max))
+    return result
+
+
+def parse_config(raw_config):
+    # Config loaded from json, dates are given as iso strings
+    config = {}
+    for key, value in raw_config.items():
+        if key.endswith('_date') and isinstance(value, str):
+            value = datetime.date.fromisoformat(value)
+        config[key] = value
+    return config
+
+
+def serialize_config(config):
+    return {key: value.isoformat() if isinstance(value, datetime.date) else value for key, value in config.items()}
+
+
+def collect_config(phases, state):
+    # Only the phase and feature settings, so widget toggles do not affect generation
+    prefixes = tuple(phase.name + '_' for phase in phases)
+    return {key: state[key] for key in state.keys() if key.startswith(prefixes) and not key.endswith('_visualise')}
+
+
+def build_feature_settings(config, phase_name, feature_name):
+    prefix = phase_name + '_' + feature_name
+    return FeatureSettings(feature_name, config[prefix + '_base_start'], config[prefix + '_base_end'],
+                           config[prefix + '_space'], config[prefix + '_trend'], config[prefix + '_noise'],
+                           config.get(prefix + '_noise_model', 'White'), config.get(prefix + '_noise_coefficients'))
+
+
+def build_phase_settings(config, phase_name, include_features=()):
+    # Features in their output order, none for the phase level settings only
+    return PhaseSettings(phase_name, config[phase_name + '_start_date'], config[phase_name + '_end_date'],
+                         config[phase_name + '_frequency_per_day'], config.get(phase_name + '_sampling', 'Regular'),
+                         config.get(phase_name + '_wear_probability', 1.0),
+                         [build_feature_settings(config, phase_name, feature_name)
+                          for feature_name in FEATURE_NAMES if feature_name in include_features])
+
+
+def build_dataset_settings(config, include_features, include_phases, include_dates=False):
+    # Built once per run, the selection order of phases and features does not change the fingerprint
+    return DatasetSettings([build_phase_settings(config, phase_name, include_features)
+                            for phase_name in PHASE_NAMES if phase_name in include_phases],
+                           [feature_name for feature_name in FEATURE_NAMES if feature_name in include_features],
+                           include_dates)
+
+
+def get_reading_times(start, freq, first, last):
+    # Regular readings spread evenly over each day, second resolution
+    return np.datetime64(start, 's') + (np.arange(first, last) * 86400 // freq).astype('timedelta64[s]')
+
+
+def get_date_slice(start, freq, first, last):
+    # Rows first..last of get_date_data without building the whole column
+    return np.datetime64(start, 'D') + (np.arange(first, last) // freq).astype('timedelta64[D]')
+
+
+def generate_phase(config, phase, include_features, include_dates=False, rng=None, seed=None, rows=None, report=None,
+                   patient=0, noise_state=None):
+    # Without an rng or seed the noise of every feature is keyed by its settings, so downloads match the previews
+    # With a seed the noise is counter based and rows can be any (first, last) range of the phase,
+    # noise_state carries the noise from one range to the next (see generate_features_values)
+    phase_index = PHASE_NAMES.index(phase.name)
+    start_date, end_date = config[phase.name+'_start_date'], config[phase.name+'_end_date']
+    frequency_per_day = config[phase.name+'_frequency_per_day']
+    total_data_points = get_total_data_points(start_date, end_date, frequency_per_day)
+    sampling = config.get(phase.name+'_sampling', 'Regular')
+    if sampling != 'Regular':
+        # Only the observed readings are generated
+        sampling_rng = get_sampling_rng(seed, phase_index, patient) if seed is not None else rng or np.random
+        sample_times = get_sample_times(start_date, end_date, frequency_per_day, sampling,
+                                        config.get(phase.name+'_wear_probability', 1.0), rng=sampling_rng)
+        positions = sample_times / max((end_date - start_date).days, 1)
+        total_data_points = len(sample_times)
+    first_row, last_row = rows if rows is not None else (0, total_data_points)
+
+    phase_days, first_weekday = (end_date - start_date).days, start_date.weekday()
+    included = [(feature_index, feature_name) for feature_index, feature_name in enumerate(phase.feature_dic)
+                if feature_name in include_features]
+    features = [build_feature_settings(config, phase.name, feature_name) for _, feature_name in included]
+    # All included features are generated in one batch
+    if not features:
+        values = []
+    elif seed is not None:
+        streams = [FeatureStream(seed, feature_index, phase_index, patient) for feature_index, _ in included]
+        values = generate_features_values(features, total_data_points, streams=streams, rows=rows,
+                                          positions=positions if sampling != 'Regular' else None,
+                                          phase_days=phase_days, first_weekday=first_weekday,
+                                          noise_state=noise_state)[1]
+    elif sampling != 'Regular':
+        values = generate_features_values(features, total_data_points, rng=rng or np.random, positions=positions,
+                                          phase_days=phase_days, first_weekday=first_weekday)[1]
+    elif rng is None:
+        values = generate_features_values(features, total_data_points,
+                                          streams=[get_feature_stream(feature) for feature in features],
+                                          phase_days=phase_days, first_weekday=first_weekday)[1]
+    else:
+        values = generate_features_values(features, total_data_points, rng=rng, phase_days=phase_days,
+                                          first_weekday=first_weekday)[1]
+
+    result_json = {}
+    for feature, feature_data in zip(features, values):
+        result_json[feature.name] = feature_data
+        if report is not None:
+            spread = get_noise_spread(feature.noise_model, feature.noise, phase_days)
+            report.add_feature(phase.name, feature.name,
+                               *get_expected_range(feature.base_start, feature.base_end, spread, feature.trend))
+            report.update(phase.name, feature.name, feature_data)
+
+    if include_dates and sampling != 'Regular':
+        result_json['Date'] = get_sample_dates(start_date, sample_times[first_row:last_row])
+    elif include_dates and rows is not None:
+        result_json['Date'] = get_date_slice(start_date, frequency_per_day, first_row, last_row)
+    elif include_dates:
+        result_json['Date'] = get_date_data(start_date, end_date, frequency_per_day)
+    return pd.DataFrame(result_json)
+
+
+def get_phase_row_count(config, phase, seed=None, patient=0):
+    # Rows generate_phase produces, irregular sampling needs the seed to be known up front
+    start_date, end_date = config[phase.name+'_start_date'], config[phase.name+'_end_date']
+    frequency_per_day = config[phase.name+'_frequency_per_day']
+    sampling = config.get(phase.name+'_sampling', 'Regular')
+    if sampling == 'Regular':
+        return get_total_data_points(start_date, end_date, frequency_per_day)
+    return len(get_sample_times(start_date, end_date, frequency_per_day, sampling,
+                                config.get(phase.name+'_wear_probability', 1.0),
+                                rng=get_sampling_rng(seed, PHASE_NAMES.index(phase.name), patient)))
+
+
+def iter_phase_chunks(config, phase, include_features, include_dates=False, rng=None, seed=None, report=None,
+                      chunk_rows=None):
+    # With a seed and chunk_rows, the phase is split into row ranges of at most chunk_rows
+    # The AR and random walk noise continues from the end of the previous range, so each range costs only its rows
+    if seed is None or chunk_rows is None:
+        yield generate_phase(config, phase, include_features, include_dates=include_dates, rng=rng, seed=seed,
+                             report=report)
+        return
+    total_rows = get_phase_row_count(config, phase, seed=seed)
+    noise_state = {}
+    for first_row in range(0, total_rows, chunk_rows):
+        yield generate_phase(config, phase, include_features, include_dates=include_dates, seed=seed,
+                             rows=(first_row, min(first_row + chunk_rows, total_rows)), report=report,
+                             noise_state=noise_state)
+
+
+def iter_dataset(config, include_features, include_phases, phases, include_dates=False, rng=None, seed=None, report=None,
+                 chunk_rows=None, schema=None):
+    # Yields the data phase by phase, updating the report while it is produced
+    # The report sees the generated values, the chunks are encoded with the schema (see schema.py) when given
+    for phase in phases:
+        if str(phase) not in include_phases:
+            continue
+        for chunk in iter_phase_chunks(config, phase, include_features, include_dates=include_dates, rng=rng,
+                                       seed=seed, report=report, chunk_rows=chunk_rows):
+            yield phase.name, schema.encode(phase.name, chunk) if schema is not None else chunk
+
+
+def generate_dataset(config, include_features, include_phases, phases, include_dates=False, rng=None, seed=None, report=None,
+                     schema=None):
+    chunks = [chunk for _, chunk in iter_dataset(config, include_features, include_phases, phases,
+                                                 include_dates=include_dates, rng=rng, seed=seed, report=report,
+                                                 schema=schema)]
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+def write_dataset(path, config, include_features, include_phases, phases, include_dates=False, rng=None, seed=None,
+                  report=None, chunk_rows=None, schema=None):
+    # Streams the chunks to csv one at a time, so only one chunk is held in memory, gzipped for .gz paths
+    rows = 0
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', newline='') as output:
+        for index, (_, chunk) in enumerate(iter_dataset(config, include_features, include_phases, phases,
+                                                        include_dates=include_dates, rng=rng, seed=seed, report=report,
+                                                        chunk_rows=chunk_rows, schema=schema)):
+            chunk.to_csv(output, index=False, header=index == 0)
+            rows += len(chunk)
+    return rows